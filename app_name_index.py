@@ -0,0 +1,283 @@
+from pathlib import Path
+
+import numpy as np
+import os
+import re
+import unicodedata
+import config
+
+
+# Symbols and punctuation dropped by normalize_name. Letters, digits and spaces are kept.
+_SYMBOL_PATTERN = re.compile(r"[^\w\s]|_")
+_SPACE_PATTERN = re.compile(r"\s+")
+
+_index = None
+
+
+def normalize_name(name: str):
+    """
+    Normalise an app name for matching: case folded, accents removed, trademark signs and punctuation dropped and
+    whitespace collapsed, so that 'ELDEN RING™' and 'Elden Ring' are equal.
+    :param name: App name
+    :return: Normalised name
+    """
+    name = unicodedata.normalize("NFKD", name.casefold())
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = _SYMBOL_PATTERN.sub(" ", name)
+    return _SPACE_PATTERN.sub(" ", name).strip()
+
+
+def trigrams(normalized_name: str):
+    """
+    :param normalized_name: Name returned by normalize_name
+    :return: Set of the 3-grams of the name padded with a space on each side, so that short names have some too
+    """
+    padded = f" {normalized_name} "
+    return {padded[idx:idx + 3] for idx in range(len(padded) - 2)}
+
+
+def _pack_strings(strings: list):
+    # One string and the character offsets of each element, which np.savez stores compactly
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in strings], out=offsets[1:])
+    return np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32), offsets
+
+
+def _unpack_strings(characters: np.ndarray, offsets: np.ndarray):
+    joined = characters.astype(np.uint32).tobytes().decode("utf-32-le")
+    return [joined[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def _source_fingerprint(path: str):
+    if path is None or not Path(path).is_file():
+        return np.array([-1, -1], dtype=np.int64)
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+class AppNameIndex:
+    """
+    Index from app names to Steam app ids. Exact case-insensitive lookups and lookups of normalised names go through
+    dictionaries and are O(1). Fuzzy matching scores candidates by the Dice coefficient of their name trigrams, using
+    an inverted index from each trigram to the names holding it, so only names sharing a trigram with the query are
+    looked at. Where several apps have the same name, the first one in the app list wins, as in the original linear
+    search of data_collection.get_steam_app_id.
+    """
+
+    # Largest number of candidate checks (candidates x query trigrams) done by binary search in match
+    FILTER_LIMIT = 20000
+
+    def __init__(self, app_ids: np.ndarray, names: list, normalized_names: list, gram_keys: list,
+                 posting_offsets: np.ndarray, postings: np.ndarray, gram_counts: np.ndarray, fingerprint=None):
+        """
+        Use from_apps or load rather than calling this directly.
+        :param app_ids: app_ids[i] is the app id of name i
+        :param names: Names as listed
+        :param normalized_names: normalize_name of each name
+        :param gram_keys: Trigrams of the inverted index
+        :param posting_offsets: postings[posting_offsets[k]:posting_offsets[k + 1]] are the names holding trigram k
+        :param postings: Name ids, grouped by trigram
+        :param gram_counts: Number of distinct trigrams of each name
+        :param fingerprint: Size and modification time of the app list the index was built from
+        """
+        self.app_ids = app_ids
+        self.names = names
+        self.normalized_names = normalized_names
+        self.gram_keys = gram_keys
+        self.posting_offsets = posting_offsets
+        self.postings = postings
+        self.gram_counts = gram_counts
+        self.fingerprint = _source_fingerprint(None) if fingerprint is None else fingerprint
+
+        self.grams = {gram: idx for idx, gram in enumerate(gram_keys)}
+        # Iterating in reverse leaves the first name in the list as the value of every key
+        self.exact = {}
+        self.normalized = {}
+        for idx in range(len(names) - 1, -1, -1):
+            self.exact[names[idx].lower()] = idx
+            self.normalized[normalized_names[idx]] = idx
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_apps(cls, steam_apps, source_path: str=None):
+        """
+        Build an index in one pass over the app list. Apps with an empty name are skipped.
+        :param steam_apps: Iterable of dictionaries with the keys 'appid' and 'name', e.g.
+        data_collection.iter_all_app_ids_and_names()
+        :param source_path: Optional path of the file the apps were read from. Its size and modification time are
+        saved with the index, so that load can tell when the index is stale.
+        :return: AppNameIndex
+        """
+        app_ids = []
+        names = []
+        normalized_names = []
+        gram_ids = {}
+        gram_postings = []
+        gram_counts = []
+        for app in steam_apps:
+            if not app["name"]:
+                continue
+            name_id = len(names)
+            normalized_name = normalize_name(app["name"])
+            app_ids.append(app["appid"])
+            names.append(app["name"])
+            normalized_names.append(normalized_name)
+            name_grams = trigrams(normalized_name)
+            gram_counts.append(len(name_grams))
+            for gram in name_grams:
+                gram_id = gram_ids.setdefault(gram, len(gram_postings))
+                if gram_id == len(gram_postings):
+                    gram_postings.append([])
+                gram_postings[gram_id].append(name_id)
+
+        posting_offsets = np.zeros(len(gram_postings) + 1, dtype=np.int64)
+        np.cumsum([len(posting) for posting in gram_postings], out=posting_offsets[1:])
+        postings = np.fromiter((name_id for posting in gram_postings for name_id in posting), dtype=np.int32,
+                               count=posting_offsets[-1])
+        return cls(np.array(app_ids, dtype=np.int64), names, normalized_names, list(gram_ids), posting_offsets,
+                   postings, np.array(gram_counts, dtype=np.int32), _source_fingerprint(source_path))
+
+    def save(self, path: str):
+        """
+        Atomically save the index, compressed.
+        :param path: Path of the .npz file
+        """
+        arrays = {"app_ids": self.app_ids, "posting_offsets": self.posting_offsets, "postings": self.postings,
+                  "gram_counts": self.gram_counts, "fingerprint": self.fingerprint}
+        for key, strings in [("names", self.names), ("normalized_names", self.normalized_names),
+                             ("gram_keys", self.gram_keys)]:
+            arrays[key], arrays[key + "_offsets"] = _pack_strings(strings)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source_path: str=None):
+        """
+        Load an index saved with save.
+        :param path: Path of the .npz file
+        :param source_path: Optional path of the app list. If given and the file changed since the index was built,
+        None is returned.
+        :return: AppNameIndex, or None if the file is missing or stale
+        """
+        if not Path(path).is_file():
+            return None
+        with np.load(path) as data:
+            fingerprint = data["fingerprint"]
+            if source_path is not None and not np.array_equal(fingerprint, _source_fingerprint(source_path)):
+                return None
+            strings = {key: _unpack_strings(data[key], data[key + "_offsets"])
+                       for key in ["names", "normalized_names", "gram_keys"]}
+            return cls(data["app_ids"], strings["names"], strings["normalized_names"], strings["gram_keys"],
+                       data["posting_offsets"], data["postings"], data["gram_counts"], fingerprint)
+
+    def lookup(self, name: str):
+        """
+        Exact case-insensitive lookup.
+        :param name: App name
+        :return: App id, or None if no app has this name
+        """
+        idx = self.exact.get(name.lower())
+        return None if idx is None else int(self.app_ids[idx])
+
+    def match(self, name: str, limit: int=5, min_score: float=0.5):
+        """
+        Find the apps whose names are most similar to name.
+        :param name: App name
+        :param limit: Maximum number of matches
+        :param min_score: Minimum Dice coefficient of the trigram sets, between 0 and 1
+        :return: List of (app_id, name, score), best match first. Ties keep app list order.
+        """
+        name_grams = trigrams(normalize_name(name))
+        num_query_grams = len(name_grams)
+        postings = sorted((self.postings[self.posting_offsets[gram_id]:self.posting_offsets[gram_id + 1]]
+                           for gram_id in (self.grams.get(gram) for gram in name_grams) if gram_id is not None),
+                          key=len)
+
+        # A name scoring min_score or more has at least min_score * q / (2 - min_score) of the q query trigrams, so it
+        # holds at least one of the rarest len(postings) - min_common + 1 of them. When those postings are short, only
+        # the candidates they hold are checked against the other postings, by binary search (postings are sorted).
+        # Otherwise the trigrams shared with every name are counted in one pass.
+        min_common = max(1, int(np.ceil(min_score * num_query_grams / (2 - min_score) - 1e-9)))
+        num_prefix = len(postings) - min_common + 1
+        if num_prefix <= 0:
+            return []
+        if sum(len(posting) for posting in postings[:num_prefix]) * len(postings) < self.FILTER_LIMIT:
+            candidate_ids = np.unique(np.concatenate(postings[:num_prefix]))
+            common = np.zeros(len(candidate_ids), dtype=np.int32)
+            for posting in postings:
+                positions = np.minimum(np.searchsorted(posting, candidate_ids), len(posting) - 1)
+                common += posting[positions] == candidate_ids
+        else:
+            common = np.bincount(np.concatenate(postings), minlength=len(self.names))
+            candidate_ids = np.flatnonzero(common >= min_common)
+            common = common[candidate_ids]
+
+        scores = 2 * common / (self.gram_counts[candidate_ids] + num_query_grams)
+        keep = scores >= min_score
+        candidate_ids, scores = candidate_ids[keep], scores[keep]
+        order = np.lexsort((candidate_ids, -scores))[:limit]
+        return [(int(self.app_ids[idx]), self.names[idx], float(score))
+                for idx, score in zip(candidate_ids[order], scores[order])]
+
+    def resolve(self, name: str, fuzzy: bool=True, min_score: float=0.8):
+        """
+        Get the app id of a name: an exact case-insensitive match, else a match of the normalised name, else the best
+        fuzzy match.
+        :param name: App name
+        :param fuzzy: If False, stop after the normalised lookup
+        :param min_score: Minimum score of a fuzzy match. See match.
+        :return: App id, or None if nothing matches
+        """
+        app_id = self.lookup(name)
+        if app_id is not None:
+            return app_id
+        idx = self.normalized.get(normalize_name(name))
+        if idx is not None:
+            return int(self.app_ids[idx])
+        if fuzzy:
+            matches = self.match(name, limit=1, min_score=min_score)
+            if matches:
+                return matches[0][0]
+        return None
+
+    def resolve_many(self, names, fuzzy: bool=True, min_score: float=0.8):
+        """
+        Resolve a batch of names. Repeated names are resolved once.
+        :param names: Iterable of app names
+        :param fuzzy: See resolve
+        :param min_score: See resolve
+        :return: List of app ids (None where nothing matches), in the order of names
+        """
+        resolved = {}
+        app_ids = []
+        for name in names:
+            if name not in resolved:
+                resolved[name] = self.resolve(name, fuzzy, min_score)
+            app_ids.append(resolved[name])
+        return app_ids
+
+
+def get_index(rebuild: bool=False):
+    """
+    Get the index of the app list in <config.STEAM_APP_JSON_DATA>. It is loaded from <config.APP_NAME_INDEX>, and
+    built and saved there if that file is missing or older than the app list.
+    :param rebuild: If True, build the index again
+    :return: AppNameIndex
+    """
+    global _index
+    import data_collection
+    if _index is not None and not rebuild and \
+            np.array_equal(_index.fingerprint, _source_fingerprint(config.STEAM_APP_JSON_DATA)):
+        return _index
+
+    index = None if rebuild else AppNameIndex.load(config.APP_NAME_INDEX, config.STEAM_APP_JSON_DATA)
+    if index is None:
+        index = AppNameIndex.from_apps(data_collection.iter_all_app_ids_and_names(), config.STEAM_APP_JSON_DATA)
+        index.save(config.APP_NAME_INDEX)
+    _index = index
+    return index
@@ -0,0 +1,170 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import html
+import re
+
+
+# src attributes, found by their literal prefix, and, as a fallback, links written anywhere else in the description.
+# Values and links are bounded runs of characters that cannot end them, so neither pattern backtracks and each scan
+# is linear in the description. Both are case-sensitive, since Steam writes tags, attributes and URL schemes in lower
+# case, which lets the regex engine jump from one literal prefix to the next. Image extensions are compared in any
+# case.
+_SRC_PATTERN = re.compile(r"""src\s*=\s*(?:"([^"]{0,8192})"|'([^']{0,8192})'|([^\s"'>]{1,8192}))""")
+_URL_PATTERN = re.compile(r"""https?://[^\s"'<>]{1,2048}""")
+_URL_TRAILING_PUNCTUATION = ".,;:!?)]}"
+
+# Tags whose src is an image or a video
+_IMAGE_TAGS = ("img",)
+_VIDEO_TAGS = ("video", "source")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp", ".svg")
+
+# Movie formats of the appdetails 'movies' entries, in order of preference. Older responses have mp4 and webm, newer
+# ones stream manifests.
+MOVIE_FORMATS = [("mp4", "max"), ("webm", "max"), ("hls_h264", None), ("dash_h264", None), ("dash_av1", None)]
+
+
+def _strip_query(url: str):
+    return url.split("#", 1)[0].split("?", 1)[0]
+
+
+def _has_image_extension(url: str):
+    return _strip_query(url).lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _tag_name(description: str, start: int, end: int):
+    # Name of the tag between the '<' at start and the attribute at end, or None if a '>' closes it before
+    if start < 0 or description.find(">", start, end) >= 0:
+        return None
+    name_end = start + 1
+    while name_end < end and description[name_end].isalnum():
+        name_end += 1
+    return description[start + 1:name_end].lower()
+
+
+def scan_description(description: str):
+    """
+    Find the images and videos of an HTML description: the src of every <img>, the src of every <video> and <source>
+    tag, and the image links written outside of tags, in two linear scans. Image links are cut at the query string
+    (Steam's '?t=<timestamp>' cache buster), as data_collection always stored them, so they stay equal to the links
+    of earlier crawls.
+    :param description: detailed_description of an app
+    :return: (image links, video links), each in order of appearance without repeats
+    """
+    links = []  # (position, is video, link)
+    src_spans = []
+    tag_start = -1
+    previous_end = 0
+    for match in _SRC_PATTERN.finditer(description):
+        start = match.start()
+        # The last '<' before the attribute, found by looking back only as far as the previous attribute
+        last_open = description.rfind("<", previous_end, start)
+        tag_start = tag_start if last_open < 0 else last_open
+        previous_end = match.end()
+        if start == 0 or not description[start - 1].isspace():  # e.g. data-src or text
+            continue
+        name = _tag_name(description, tag_start, start)
+        if name not in _IMAGE_TAGS and name not in _VIDEO_TAGS:
+            continue
+        src_spans.append((start, match.end()))
+        link = next(value for value in match.groups() if value is not None).strip()
+        if link:
+            links.append((start, name in _VIDEO_TAGS, link))
+
+    span_idx = 0
+    for match in _URL_PATTERN.finditer(description):
+        start = match.start()
+        while span_idx < len(src_spans) and src_spans[span_idx][1] <= start:
+            span_idx += 1
+        if span_idx < len(src_spans) and src_spans[span_idx][0] <= start:
+            continue  # Inside a src attribute
+        link = match.group().rstrip(_URL_TRAILING_PUNCTUATION)
+        if _has_image_extension(link):
+            links.append((start, False, link))
+
+    links.sort()
+    images = {}
+    videos = {}
+    for _, is_video, link in links:
+        if "&" in link:
+            link = html.unescape(link)
+        if is_video:
+            videos[link] = None
+        else:
+            images[_strip_query(link)] = None
+    return list(images), list(videos)
+
+
+def _image_links(details: dict, description_images: list):
+    images = [[image_type, details[key]] for image_type, key in [("header", "header_image"),
+                                                                   ("capsule", "capsule_image")] if details.get(key)]
+    images += [["description", link] for link in description_images]
+    images += [["screenshot", screenshot["path_full"]] for screenshot in details.get("screenshots") or []
+               if screenshot.get("path_full")]
+    return images
+
+
+def _movie_link(movie: dict):
+    for key, size in MOVIE_FORMATS:
+        link = movie.get(key)
+        if isinstance(link, dict):
+            link = link.get(size)
+        if link:
+            return link
+    return None
+
+
+def _video_links(details: dict, description_videos: list):
+    links = [_movie_link(movie) for movie in details.get("movies") or []]
+    return list(dict.fromkeys(link for link in links + description_videos if link))
+
+
+def extract_image_links(details):
+    """
+    :param details: App details returned by data_collection.get_app_details
+    :return: List of [image type, link] with image type 'header', 'capsule', 'description' or 'screenshot', in that
+    order and in order of appearance within each type. None if details is not a dictionary.
+    """
+    return extract_assets(details)[0]
+
+
+def extract_video_links(details):
+    """
+    :param details: App details returned by data_collection.get_app_details
+    :return: List of video links: the largest mp4 (else the best other format) of every trailer in 'movies', then the
+    videos of the description, without repeats. None if details is not a dictionary.
+    """
+    return extract_assets(details)[1]
+
+
+def extract_assets(details):
+    """
+    Extract the images and videos of an app with a single scan of its description.
+    :param details: App details returned by data_collection.get_app_details
+    :return: (image links, video links) as returned by extract_image_links and extract_video_links, or (None, None)
+    if details is not a dictionary
+    """
+    if not isinstance(details, dict):
+        return None, None
+    description_images, description_videos = scan_description(details.get("detailed_description") or "")
+    return _image_links(details, description_images), _video_links(details, description_videos)
+
+
+def _extract_chunk(chunk):
+    return [extract_assets(details) for details in chunk]
+
+
+def extract_assets_many(details_list, num_workers: int=None, chunk_size: int=64):
+    """
+    Extract the images and videos of many apps, with the work spread over a process pool.
+    :param details_list: Iterable of app details
+    :param num_workers: Number of processes. Default os.cpu_count(). 0 runs everything in this process.
+    :param chunk_size: Number of apps per task sent to the pool
+    :return: List of (image links, video links) per app, in the order of details_list. See extract_assets.
+    """
+    details_list = list(details_list)
+    chunks = [details_list[start:start + chunk_size] for start in range(0, len(details_list), chunk_size)]
+    if num_workers == 0 or len(chunks) <= 1:
+        return _extract_chunk(details_list)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return [assets for chunk_assets in executor.map(_extract_chunk, chunks) for assets in chunk_assets]
@@ -0,0 +1,94 @@
+"""
+Benchmark resolving a batch of app names with app_name_index against the original linear search of
+get_steam_app_id, on a synthetic app list.
+
+Run from the repository root:
+    python benchmarks/bench_app_name_index.py --num-apps 200000 --num-queries 5000
+The linear search is timed on the first --linear-queries names only, because it scans the whole list per name.
+"""
+from pathlib import Path
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app_name_index import AppNameIndex
+
+
+SYLLABLES = ["ka", "lo", "ri", "sen", "tor", "mi", "dra", "vel", "qu", "zan", "ith", "or", "bel", "ga", "nox", "phy",
+             "us", "ter", "ax", "el", "mon", "cra", "fti", "ssa", "wy", "jo", "ren", "hul", "ek", "bri"]
+SUFFIXES = ["", "", "", " 2", " II", " Soundtrack", " Demo", " - Deluxe Edition", " VR", " Simulator", "™"]
+
+
+def make_synthetic_app_list(num_apps: int, seed: int=0):
+    """
+    :return: List of dictionaries with the keys 'appid' and 'name'. About 5% of the names are empty.
+    """
+    rng = random.Random(seed)
+    apps = []
+    for app_id in range(10, 10 + 10 * num_apps, 10):
+        words = ["".join(rng.choices(SYLLABLES, k=rng.randint(1, 4))).title() for _ in range(rng.randint(1, 3))]
+        name = "" if rng.random() < 0.05 else " ".join(words) + rng.choice(SUFFIXES)
+        apps.append({"appid": app_id, "name": name})
+    return apps
+
+
+def linear_get_steam_app_id(app_name, steam_apps):
+    """
+    The original get_steam_app_id: a case-insensitive comparison with every app.
+    """
+    for app in steam_apps:
+        if app["name"].lower() == app_name.lower():
+            return app["appid"]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-apps", type=int, default=200000)
+    parser.add_argument("--num-queries", type=int, default=5000)
+    parser.add_argument("--linear-queries", type=int, default=50)
+    args = parser.parse_args()
+
+    apps = make_synthetic_app_list(args.num_apps)
+    rng = random.Random(1)
+    queries = [app["name"].upper() for app in rng.sample(apps, args.num_queries) if app["name"]]
+    # Misspelled names: one character replaced
+    misspelled = [name[:len(name) // 2] + "x" + name[len(name) // 2 + 1:] for name in queries]
+
+    start = time.perf_counter()
+    index = AppNameIndex.from_apps(apps)
+    build_seconds = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "names.npz")
+        index.save(path)
+        start = time.perf_counter()
+        index = AppNameIndex.load(path)
+        load_seconds = time.perf_counter() - start
+        size = os.path.getsize(path)
+    print(f"Index of {len(index)} names: built in {build_seconds:.2f}s, loaded in {load_seconds:.2f}s, "
+          f"{size / 2 ** 20:.1f} MiB on disk")
+
+    start = time.perf_counter()
+    linear = [linear_get_steam_app_id(name, apps) for name in queries[:args.linear_queries]]
+    linear_seconds = (time.perf_counter() - start) / len(linear)
+    start = time.perf_counter()
+    exact = index.resolve_many(queries, fuzzy=False)
+    exact_seconds = (time.perf_counter() - start) / len(queries)
+    assert exact[:len(linear)] == linear
+    start = time.perf_counter()
+    fuzzy = index.resolve_many(misspelled, min_score=0.6)
+    fuzzy_seconds = (time.perf_counter() - start) / len(misspelled)
+
+    print(f"Linear search:  {linear_seconds * 1e3:.3f} ms per name")
+    print(f"Exact lookup:   {exact_seconds * 1e3:.4f} ms per name ({linear_seconds / exact_seconds:.0f}x)")
+    print(f"Fuzzy match:    {fuzzy_seconds * 1e3:.3f} ms per name, "
+          f"{sum(app_id is not None for app_id in fuzzy) / len(fuzzy):.1%} of misspelled names resolved")
+
+
+if __name__ == "__main__":
+    main()
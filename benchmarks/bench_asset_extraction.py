@@ -0,0 +1,91 @@
+"""
+Benchmark asset_extraction against the original regex of data_collection.extract_image_links on the descriptions of
+the appdetails fixtures, on long descriptions made by repeating them, and on a description with a long run of links
+and no whitespace, where the original pattern backtracks. Also times the batch API with and without a process pool.
+
+Run from the repository root:
+    python benchmarks/bench_asset_extraction.py --num-apps 20000
+"""
+from pathlib import Path
+
+import argparse
+import json
+import re
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import asset_extraction
+
+
+FIXTURE_DIRECTORY = Path(__file__).resolve().parent / "fixtures"
+
+
+def original_description_images(description_text):
+    """
+    The description part of the original data_collection.extract_image_links.
+    """
+    image_pattern = r'https?://[^\s]+(?:\.jpg|\.jpeg|\.png|\.gif|\.bmp|\.tiff|\.webp|\.svg)'
+    image_links = re.findall(image_pattern, description_text, re.IGNORECASE)
+    return list(set(image_links))
+
+
+def load_details():
+    """
+    :return: List of the app details of the appdetails fixtures
+    """
+    with open(FIXTURE_DIRECTORY / "appdetails.json", "r") as f:
+        responses = json.load(f)
+    return [entry["data"] for response in responses for entry in response.values() if entry.get("success")]
+
+
+def time_per_call(function, argument, min_seconds: float=0.5):
+    """
+    :return: Mean seconds per call of function(argument), over as many calls as fit in about min_seconds
+    """
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        function(argument)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-apps", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=50, help="Copies of each description in the long samples")
+    parser.add_argument("--run-length", type=int, default=2000, help="Links in the sample without whitespace")
+    parser.add_argument("--num-workers", type=int, default=None)
+    args = parser.parse_args()
+
+    details = load_details()
+    descriptions = [app["detailed_description"] for app in details]
+    samples = [
+        ("fixture descriptions", descriptions),
+        (f"fixture descriptions x{args.repeat}",
+         ["".join([description] * args.repeat) for description in descriptions]),
+        (f"{args.run_length} links without whitespace", ["https://example.com/a" * args.run_length])
+    ]
+    for name, texts in samples:
+        original = sum(time_per_call(original_description_images, text) for text in texts) / len(texts)
+        scanner = sum(time_per_call(asset_extraction.scan_description, text) for text in texts) / len(texts)
+        print(f"{name:>34}: {len(texts[0]):>7} characters, original {original * 1e6:10.1f} us, "
+              f"scanner {scanner * 1e6:8.1f} us ({original / scanner:.1f}x)")
+
+    batch = [details[idx % len(details)] for idx in range(args.num_apps)]
+    start = time.perf_counter()
+    inline = asset_extraction.extract_assets_many(batch, num_workers=0)
+    inline_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    pooled = asset_extraction.extract_assets_many(batch, num_workers=args.num_workers, chunk_size=256)
+    pooled_seconds = time.perf_counter() - start
+    assert pooled == inline
+    print(f"Batch of {len(batch)} apps: {inline_seconds:.2f}s in one process, {pooled_seconds:.2f}s with a process "
+          f"pool")
+
+
+if __name__ == "__main__":
+    main()
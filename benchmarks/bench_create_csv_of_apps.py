@@ -0,0 +1,97 @@
+"""
+Benchmark create_csv_of_apps against the original row-by-row implementation on a synthetic GetAppList payload.
+
+Run from the repository root:
+    python benchmarks/bench_create_csv_of_apps.py --num-apps 1000000
+The original implementation is timed on the first --old-rows apps only, because it takes minutes on the full list.
+"""
+from pathlib import Path
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import data_processing
+
+
+def make_synthetic_app_list(num_apps: int, seed: int=0):
+    """
+    Create a list shaped like the GetAppList payload. About 5% of the apps have an empty name and about 1% of the app
+    ids are listed twice, as in the real list.
+    :param num_apps: Number of apps
+    :param seed: Random seed
+    :return: List of dictionaries with the keys 'appid' and 'name'
+    """
+    rng = random.Random(seed)
+    apps = []
+    for app_id in range(10, 10 + num_apps):
+        name = "" if rng.random() < 0.05 else f"Synthetic App {app_id} {rng.choice(['Deluxe', 'Demo', 'Soundtrack'])}"
+        apps.append({"appid": app_id, "name": name})
+        if rng.random() < 0.01:
+            apps.append({"appid": app_id, "name": name})
+    return apps
+
+
+def create_csv_of_apps_rowwise(steam_apps: list, output_path: str, block_size=1000):
+    """
+    The original create_csv_of_apps: one df.loc append per app, concatenated in blocks of block_size rows.
+    """
+    df_dict = {}
+    num_apps_processed = 0
+    df = pd.DataFrame(columns=["appid", "name"])
+    for app in steam_apps:
+        num_apps_processed += 1
+        if app["name"] == "":
+            continue
+        df.loc[len(df)] = [app["appid"], app["name"]]
+        if num_apps_processed % block_size == 0:
+            df_dict[num_apps_processed] = df
+            df = pd.DataFrame(columns=["appid", "name"])
+    num_apps_processed += 1
+    df_dict[num_apps_processed] = df
+    pd.concat(df_dict.values()).set_index("appid").to_csv(output_path)
+
+
+def time_call(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-apps", type=int, default=1000000, help="Size of the synthetic app list")
+    parser.add_argument("--old-rows", type=int, default=20000, help="Number of apps given to the original version")
+    parser.add_argument("--formats", nargs="+", default=list(data_processing.OUTPUT_FORMATS),
+                        help="Output formats to time for the new version")
+    args = parser.parse_args()
+
+    steam_apps = make_synthetic_app_list(args.num_apps)
+    print(f"Synthetic app list: {len(steam_apps)} entries")
+
+    with tempfile.TemporaryDirectory() as directory:
+        old_apps = steam_apps[:args.old_rows]
+        seconds = time_call(create_csv_of_apps_rowwise, old_apps, os.path.join(directory, "old.csv"))
+        print(f"old  csv     {len(old_apps):>9} rows {seconds:8.2f} s {len(old_apps) / seconds:>12,.0f} rows/s")
+
+        for output_format in args.formats:
+            output_path = os.path.join(directory, "new" + data_processing.OUTPUT_FORMATS[output_format])
+            try:
+                seconds = time_call(data_processing.create_csv_of_apps, steam_apps, overwrite_file=True,
+                                    output_format=output_format, output_path=output_path)
+            except ImportError as e:
+                print(f"new  {output_format:<7} skipped: {e}")
+                continue
+            size = os.path.getsize(output_path)
+            print(f"new  {output_format:<7} {len(steam_apps):>9} rows {seconds:8.2f} s "
+                  f"{len(steam_apps) / seconds:>12,.0f} rows/s {size / 2 ** 20:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark the Eclat miner of itemset_mining against a naive pure-Python Apriori on the same transactions. Both must
+find the same frequent itemsets. Peak memory is measured with tracemalloc, which also slows both runs down somewhat.
+
+Run from the repository root on synthetic transactions shaped like the review transactions:
+    python benchmarks/bench_itemset_mining.py --num-transactions 20000 --min-support 0.02
+or on transaction files written by the CleanText notebook:
+    python benchmarks/bench_itemset_mining.py --files DataMiningProjectData/grouped-text/transactions/t-liked-action.csv
+"""
+from collections import Counter
+from itertools import combinations
+from pathlib import Path
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import itemset_mining
+
+
+def make_synthetic_transactions(num_transactions: int, num_words: int=5000, mean_length: int=12, seed: int=0):
+    """
+    Create transactions of distinct words drawn from a Zipf-like distribution, as in cleaned review text.
+    :param num_transactions: Number of transactions
+    :param num_words: Size of the vocabulary
+    :param mean_length: Mean number of words drawn per transaction
+    :param seed: Random seed
+    :return: List of lists of words
+    """
+    rng = random.Random(seed)
+    words = [f"word{idx}" for idx in range(num_words)]
+    weights = [1 / (rank + 1) for rank in range(num_words)]
+    transactions = []
+    for _ in range(num_transactions):
+        length = max(1, int(rng.expovariate(1 / mean_length)))
+        transactions.append(list(dict.fromkeys(rng.choices(words, weights, k=length))))
+    return transactions
+
+
+def naive_apriori(transactions: list, min_support: float, max_length: int=None):
+    """
+    Textbook Apriori: join frequent k-itemsets into (k+1)-candidates, prune candidates with an infrequent subset, and
+    count the rest by checking every candidate against every transaction.
+    :return: Dictionary mapping frozensets of items to their support count
+    """
+    transactions = [frozenset(transaction) for transaction in transactions]
+    min_count = itemset_mining._min_count(min_support, len(transactions))
+    counts = Counter(item for transaction in transactions for item in transaction)
+    frequent = {frozenset([item]): count for item, count in counts.items() if count >= min_count}
+    result = dict(frequent)
+    size = 1
+    while frequent and (max_length is None or size < max_length):
+        size += 1
+        previous = list(frequent)
+        candidates = set()
+        for first, second in combinations(previous, 2):
+            candidate = first | second
+            if len(candidate) == size and all(frozenset(subset) in frequent
+                                              for subset in combinations(candidate, size - 1)):
+                candidates.add(candidate)
+        counts = {candidate: sum(1 for transaction in transactions if candidate <= transaction)
+                  for candidate in candidates}
+        frequent = {candidate: count for candidate, count in counts.items() if count >= min_count}
+        result.update(frequent)
+    return result
+
+
+def measure(function, *args, **kwargs):
+    """
+    :return: (result, seconds, peak traced memory in bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def mine_eclat(transactions, min_support, max_length):
+    database = itemset_mining.TransactionDatabase.from_transactions(transactions)
+    counts = itemset_mining.eclat(database, min_support, max_length)
+    names = database.items.names
+    return {frozenset(names[item_id] for item_id in itemset): count for itemset, count in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-transactions", type=int, default=20000, help="Number of synthetic transactions")
+    parser.add_argument("--files", nargs="+", help="Transaction CSV files to use instead of synthetic transactions")
+    parser.add_argument("--min-support", type=float, default=0.02, help="Minimum support")
+    parser.add_argument("--max-length", type=int, default=None, help="Maximum itemset length")
+    args = parser.parse_args()
+
+    if args.files:
+        transactions = [transaction for path in args.files
+                        for transaction in itemset_mining.iter_transaction_file(path)]
+    else:
+        transactions = make_synthetic_transactions(args.num_transactions)
+    print(f"Transactions: {len(transactions)}. Minimum support: {args.min_support}.")
+
+    eclat_result, eclat_seconds, eclat_peak = measure(mine_eclat, transactions, args.min_support, args.max_length)
+    print(f"eclat    {len(eclat_result):>8} itemsets {eclat_seconds:8.2f} s {eclat_peak / 2 ** 20:8.1f} MB peak")
+
+    apriori_result, apriori_seconds, apriori_peak = measure(naive_apriori, transactions, args.min_support,
+                                                            args.max_length)
+    print(f"apriori  {len(apriori_result):>8} itemsets {apriori_seconds:8.2f} s "
+          f"{apriori_peak / 2 ** 20:8.1f} MB peak")
+
+    if eclat_result != apriori_result:
+        raise AssertionError("Eclat and Apriori found different itemsets")
+    print(f"Same itemsets. Speedup: {apriori_seconds / eclat_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
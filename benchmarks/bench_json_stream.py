@@ -0,0 +1,92 @@
+"""
+Check json_stream against json.loads for every chunk boundary of small documents with bare floats and exponents, as
+object members and as array elements, then benchmark streaming a large GetAppList payload against json.loads.
+
+Run from the repository root:
+    python benchmarks/bench_json_stream.py --num-apps 1000000
+"""
+from pathlib import Path
+
+import argparse
+import json
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import json_stream
+
+
+# (document, stream path). Numbers end just before a '.', an exponent or more digits at some chunk boundary.
+CHECK_DOCUMENTS = [
+    ('{"a":{"apps":[1,2],"x":1500.0}}', ("a", "apps")),
+    ('{"apps":[1.5,22.75,3e10]}', ("apps",)),
+    ('{"success":1,"weight":0.75,"reviews":[]}', ("reviews",)),
+    ('{"apps":[-0.5, 1E+20, 2.5e-3, 12345678901234567890, {"price": 999.99, "n": 10}], "total": -1.25E2}', ("apps",)),
+    ('{"cursor": "AoJ4", "query_summary": {"num_reviews": 100, "weight": 1e-05}, "reviews": [{"w": 0.5}, 7]}',
+     ("reviews",)),
+]
+
+
+def expected_members(document: str, stream_path: tuple):
+    """
+    :return: (path, value) tuples iter_json_members should yield, computed from json.loads
+    """
+    members = []
+
+    def walk(obj, prefix):
+        for key, value in obj.items():
+            path = prefix + (key,)
+            if path == stream_path[:len(path)] and isinstance(value, (dict, list)):
+                if len(path) == len(stream_path):
+                    members.extend((path + ("item",), item) for item in value)
+                else:
+                    walk(value, path)
+            else:
+                members.append((path, value))
+
+    walk(json.loads(document), ())
+    return members
+
+
+def check_chunk_boundaries():
+    """
+    Parse every check document split into chunks of every size from 1 to its length, as str and as bytes.
+    :return: Number of parses checked
+    """
+    num_checked = 0
+    for document, stream_path in CHECK_DOCUMENTS:
+        expected = expected_members(document, stream_path)
+        for chunk_size in range(1, len(document) + 1):
+            for data in (document, document.encode("utf-8")):
+                chunks = [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+                members = list(json_stream.iter_json_members(chunks, stream_path))
+                assert members == expected, (document, chunk_size, members)
+                num_checked += 1
+    return num_checked
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-apps", type=int, default=1000000)
+    parser.add_argument("--chunk-size", type=int, default=1 << 16)
+    args = parser.parse_args()
+
+    print(f"Chunk boundaries: {check_chunk_boundaries()} parses equal to json.loads")
+
+    payload = json.dumps({"applist": {"apps": [{"appid": appid, "name": f"Synthetic App {appid}", "price": appid / 8}
+                                               for appid in range(args.num_apps)]}}).encode("utf-8")
+    chunks = [payload[start:start + args.chunk_size] for start in range(0, len(payload), args.chunk_size)]
+
+    start = time.perf_counter()
+    loaded = json.loads(payload)["applist"]["apps"]
+    loads_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    streamed = list(json_stream.iter_json_array(chunks, ("applist", "apps")))
+    stream_seconds = time.perf_counter() - start
+    assert streamed == loaded
+    print(f"{args.num_apps} apps ({len(payload) / 2 ** 20:.1f} MiB): json.loads {loads_seconds:.2f}s, "
+          f"json_stream {stream_seconds:.2f}s in chunks of {args.chunk_size} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Benchmark suite for the collection and processing hot paths, on synthetic catalogues served by a local stub of the
+Steam API (see stub_server.py). Stages:
+    app_list       download and parse GetAppList, then create_csv_of_apps
+    crawl          the crawl loop of main.py (CrawlSession.crawl), checkpoints included
+    save_progress  save_progress alone, on the rows of the catalogue built without any network calls
+    clean_reviews  text_cleaning.clean_genre_files on grouped review files made from the recorded reviews
+Every stage runs in a fresh process so that its peak RSS is its own. Results are written as JSON, to compare runs:
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 100000
+    python benchmarks/bench_pipeline.py --sizes 1000 --stages crawl save_progress --compare benchmarks/results/a.json
+The crawl of 100k apps makes about 250k requests to the stub server and takes about half an hour.
+
+Fixtures are recorded from the real API with
+    python benchmarks/bench_pipeline.py record --app-ids 620 1145360 367520
+"""
+from contextlib import redirect_stdout
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import stub_server
+
+STAGES = ["app_list", "crawl", "save_progress", "clean_reviews"]
+RESULT_DIRECTORY = Path(__file__).resolve().parent / "results"
+
+
+def _peak_rss(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _configure(data_directory: str, server_url: str=None):
+    """
+    Point config at a scratch data directory and the stub server, without rate limits, the response cache or the
+    near duplicate review filter. The stub server gives every app the same few fixture texts, which the filter would
+    drop, so every app writes its reviews as it would with real ones.
+    """
+    import config
+    config.DATA_DIRECTORY = data_directory
+    config.STEAM_APP_JSON_DATA = os.path.join(data_directory, "steam_apps.json")
+    config.STEAM_APP_CSV_DATA = os.path.join(data_directory, "steam_apps.csv")
+    config.STEAM_APP_JSON_METADATA = os.path.join(data_directory, "steam_apps.meta.json")
+    config.CHECKPOINT_DATABASE = os.path.join(data_directory, "checkpoint.sqlite3")
+    config.QUERIED_APPS_INDEX = os.path.join(data_directory, "queried_apps.npz")
+    config.REVIEW_DATASET_DIRECTORY = os.path.join(data_directory, "steam_apps_reviews")
+    config.RESPONSE_CACHE_ENABLED = False
+    config.CRAWLER_RATE_LIMITS = {}
+    config.CRAWLER_BACKOFF_BASE = 0.01
+    config.REVIEW_NEAR_DUPLICATE_FILTER = False
+    if server_url is not None:
+        config.STEAM_API_URL = config.STEAM_STORE_URL = server_url
+
+
+def bench_app_list(num_apps: int, data_directory: str, server_url: str, options: dict):
+    import data_collection
+    import data_processing
+
+    start = time.perf_counter()
+    steam_apps = data_collection.get_all_app_ids_and_names(overwrite_existing_file=True)
+    download_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data_processing.create_csv_of_apps(steam_apps, overwrite_file=True)
+    csv_seconds = time.perf_counter() - start
+    return {"seconds": download_seconds + csv_seconds, "download_seconds": download_seconds,
+            "create_csv_seconds": csv_seconds, "apps_per_second": num_apps / csv_seconds}
+
+
+def bench_crawl(num_apps: int, data_directory: str, server_url: str, options: dict):
+    import crawler
+    import steam_client
+    import telemetry
+    from checkpoint_store import CheckpointStore
+    from crawl_session import CrawlSession
+    from review_dataset import ReviewDataset
+
+    store = CheckpointStore()
+    session = CrawlSession(store, review_dataset=ReviewDataset.open(store=store), progress_path=None)
+    fetcher = crawler.RateLimitedFetcher()
+    start = time.perf_counter()
+    for _ in session.crawl(stub_server.catalogue_app_ids(num_apps), fetcher):
+        pass
+    seconds = time.perf_counter() - start
+    counters = telemetry.snapshot()["counters"]
+    num_reviews = store.count("reviews")
+    return {"seconds": seconds, "apps_per_second": num_apps / seconds, "reviews_per_second": num_reviews / seconds,
+            "requests": fetcher.num_requests, "rate_limited": fetcher.num_rate_limited,
+            "connections": sum(host.get("connections", 0) for host in steam_client.get_stats().values()),
+            "checkpoint_seconds": counters.get('stage_seconds_total{stage="checkpoint"}', 0.0),
+            "games": store.count("games"), "reviews": num_reviews, "database_bytes": store.size()}
+
+
+def _iter_catalogue(num_apps: int):
+    """
+    The responses of the stub catalogue, decoded in process, as (app_id, details, review pages).
+    """
+    catalogue = stub_server.Catalogue(num_apps)
+    for app_id in stub_server.catalogue_app_ids(num_apps):
+        response = json.loads(catalogue.app_details(app_id))[str(app_id)]
+        details = response["data"] if response["success"] else None
+        pages = []
+        cursor = "*"
+        num_reviews = 0
+        while True:
+            page = json.loads(catalogue.review_page(app_id, cursor, 100))
+            num_reviews += len(page["reviews"])
+            query_summary = page["query_summary"] if cursor == "*" else pages[0]["query_summary"]
+            pages.append({"query_summary": query_summary, "reviews": page["reviews"], "cursor": page["cursor"],
+                          "num_reviews": num_reviews})
+            if len(page["reviews"]) < 100:
+                break
+            cursor = page["cursor"]
+        yield app_id, details, pages
+
+
+def bench_save_progress(num_apps: int, data_directory: str, server_url: str, options: dict):
+    from checkpoint_store import CheckpointStore
+    from crawl_session import CrawlSession
+    from review_dataset import ReviewDataset
+
+    store = CheckpointStore()
+    session = CrawlSession(store, review_dataset=ReviewDataset.open(store=store), progress_path=None)
+    durations = []
+    num_written = 0
+    for app_id, details, pages in _iter_catalogue(num_apps):
+        _, written = session.add_app(app_id, details, iter(pages))
+        num_written += written
+        if written and num_written % session.save_every == 0:
+            start = time.perf_counter()
+            session.save()
+            durations.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    session.save()
+    durations.append(time.perf_counter() - start)
+
+    durations.sort()
+    seconds = sum(durations)
+    return {"seconds": seconds, "checkpoints": len(durations), "mean_checkpoint_seconds": seconds / len(durations),
+            "p95_checkpoint_seconds": durations[int(0.95 * (len(durations) - 1))],
+            "max_checkpoint_seconds": durations[-1], "apps_per_second": num_apps / seconds,
+            "reviews": store.count("reviews"), "database_bytes": store.size()}
+
+
+def bench_clean_reviews(num_apps: int, data_directory: str, server_url: str, options: dict):
+    import pandas as pd
+    import text_cleaning
+
+    # Grouped review files of a few genres, with reviews_per_app recorded reviews per app spread over them
+    with open(stub_server.FIXTURE_DIRECTORY / "appreviews.json", "r") as f:
+        texts = [review["review"] for page in json.load(f) for review in page["reviews"]]
+    with open(stub_server.FIXTURE_DIRECTORY / "stopwords.txt", "r") as f:
+        stopwords = frozenset(f.read().split())
+    genres = ["Action", "Indie", "Massively Multiplayer"]
+    num_reviews = num_apps * options["reviews_per_app"]
+    for group in text_cleaning.REVIEW_GROUPS:
+        Path(data_directory, f"{group}-games").mkdir(parents=True, exist_ok=True)
+        for genre_idx, genre in enumerate(genres):
+            reviews = [texts[idx % len(texts)] for idx in range(genre_idx, num_reviews, len(genres))]
+            pd.DataFrame({"review": reviews}).to_csv(
+                Path(data_directory, f"{group}-games", f"{group}-{text_cleaning.genre_file_name(genre)}.csv"))
+
+    start = time.perf_counter()
+    counts = text_cleaning.clean_genre_files(genres, directory=data_directory, stopwords=stopwords, sample_size=None,
+                                             num_workers=options["num_workers"])
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "reviews": 2 * num_reviews, "reviews_per_second": 2 * num_reviews / seconds,
+            "transactions": sum(counts.values())}
+
+
+BENCHMARKS = {"app_list": bench_app_list, "crawl": bench_crawl, "save_progress": bench_save_progress,
+              "clean_reviews": bench_clean_reviews}
+
+
+def _run_stage(stage: str, num_apps: int, server_url: str, options: dict, connection):
+    with tempfile.TemporaryDirectory() as data_directory, open(os.devnull, "w") as devnull:
+        _configure(data_directory, server_url)
+        start_rss = _peak_rss()
+        try:
+            with redirect_stdout(devnull):
+                result = BENCHMARKS[stage](num_apps, data_directory, server_url, options)
+        except Exception as e:
+            connection.send({"error": f"{type(e).__name__}: {e}"})
+            raise
+        result["peak_rss_bytes"] = _peak_rss()
+        result["start_rss_bytes"] = start_rss
+        result["peak_rss_children_bytes"] = _peak_rss(resource.RUSAGE_CHILDREN)
+        connection.send(result)
+
+
+def run_stage(stage: str, num_apps: int, server_url: str, options: dict):
+    """
+    Run one benchmark in a fresh process.
+    :return: Dictionary of results, with 'stage', 'num_apps' and the peak RSS of the process
+    """
+    context = get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_stage, args=(stage, num_apps, server_url, options, sender))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {"error": f"Process exited with code {process.exitcode}"}
+    process.join()
+    return {"stage": stage, "num_apps": num_apps, **result}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list, baseline_path: str):
+    """
+    Print the speed-up of every stage against an earlier results file.
+    """
+    with open(baseline_path, "r") as f:
+        baseline = {(result["stage"], result["num_apps"]): result for result in json.load(f)["results"]}
+    for result in results:
+        previous = baseline.get((result["stage"], result["num_apps"]))
+        if previous is None or "seconds" not in previous or "seconds" not in result:
+            continue
+        print(f"{result['stage']:>14} {result['num_apps']:>7} apps: {previous['seconds']:.2f}s -> "
+              f"{result['seconds']:.2f}s ({previous['seconds'] / result['seconds']:.2f}x), peak RSS "
+              f"{previous['peak_rss_bytes'] / 2 ** 20:.0f} -> {result['peak_rss_bytes'] / 2 ** 20:.0f} MiB")
+
+
+def record(app_ids: list, directory: Path=stub_server.FIXTURE_DIRECTORY):
+    """
+    Replace the fixtures with responses of the real API: the details and first review page of each app, and the
+    first apps of GetAppList.
+    :param app_ids: App ids to record. The first of them should have reviews.
+    :param directory: Fixture directory
+    """
+    import config
+    import steam_client
+
+    details = [steam_client.get(f"{config.STEAM_STORE_URL}/api/appdetails", {"appids": app_id}).json()
+               for app_id in app_ids]
+    pages = [steam_client.get(f"{config.STEAM_STORE_URL}/appreviews/{app_id}",
+                              {"json": 1, "num_per_page": 100, "cursor": "*", "filter": "recent",
+                               "purchase_type": "all"}).json() for app_id in app_ids]
+    app_list = steam_client.get(f"{config.STEAM_API_URL}/ISteamApps/GetAppList/v2/").json()
+    app_list["applist"]["apps"] = app_list["applist"]["apps"][:1000]
+    for name, value in [("appdetails.json", details), ("appreviews.json", [page for page in pages if page["reviews"]]),
+                        ("applist.json", app_list)]:
+        with open(directory / name, "w") as f:
+            json.dump(value, f, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["run", "record"], default="run")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Catalogue sizes")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--reviews-per-app", type=int, default=5, help="Reviews per app cleaned by clean_reviews")
+    parser.add_argument("--num-workers", type=int, default=None, help="Processes used by clean_reviews")
+    parser.add_argument("--rate-limited-every", type=int, default=0,
+                        help="Answer every n-th API request with a 429 to include the backoff in the crawl")
+    parser.add_argument("--output", default=None, help="Results file. Default benchmarks/results/<time>.json")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare with")
+    parser.add_argument("--app-ids", type=int, nargs="+", default=[620, 1145360, 367520], help="Apps to record")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.app_ids)
+        return
+
+    options = {"reviews_per_app": args.reviews_per_app, "num_workers": args.num_workers}
+    results = []
+    for num_apps in args.sizes:
+        with stub_server.StubServer(num_apps, args.rate_limited_every) as server:
+            for stage in args.stages:
+                result = run_stage(stage, num_apps, server.url, options)
+                results.append(result)
+                if "error" in result:
+                    print(f"{stage:>14} {num_apps:>7} apps: failed. {result['error']}")
+                else:
+                    print(f"{stage:>14} {num_apps:>7} apps: {result['seconds']:.2f}s, "
+                          f"peak RSS {result['peak_rss_bytes'] / 2 ** 20:.0f} MiB")
+
+    output = Path(args.output) if args.output else RESULT_DIRECTORY / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"time": datetime.now().isoformat(timespec="seconds"), "commit": _git_commit(),
+                   "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                   "options": options, "results": results}, f, indent=1)
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
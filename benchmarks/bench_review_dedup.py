@@ -0,0 +1,86 @@
+"""
+Benchmark review_dedup.NearDuplicateIndex on synthetic reviews: throughput, peak memory of the index and how many of
+the planted near duplicates (copies of a template with one word changed) are found, against the number of other
+reviews wrongly dropped. Recall is also given for the planted duplicates whose exact Jaccard similarity to their
+template reaches the threshold, which are the ones the index is meant to find.
+
+Run from the repository root:
+    python benchmarks/bench_review_dedup.py --num-reviews 200000
+"""
+from pathlib import Path
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from review_dedup import NearDuplicateIndex
+
+
+WORDS = ["great", "game", "fun", "boring", "story", "graphics", "bugs", "friends", "multiplayer", "worth", "price",
+         "recommend", "hours", "controls", "music", "levels", "boss", "grind", "update", "developers", "combat", "map",
+         "quests", "loot", "servers", "lag", "ending", "characters", "puzzle", "sale", "refund", "patch", "mods",
+         "crafting", "open", "world", "early", "access", "content", "difficulty", "tutorial", "co-op", "pvp", "art"]
+
+
+def _shingles(words: list):
+    return {tuple(words[idx:idx + 3]) for idx in range(len(words) - 2)}
+
+
+def make_reviews(num_reviews: int, duplicate_share: float, num_templates: int=200, seed: int=0):
+    """
+    :return: List of (text, Jaccard similarity of the word 3-grams to the template of a planted near duplicate, or
+    None for the other reviews)
+    """
+    rng = random.Random(seed)
+    templates = [[rng.choice(WORDS) for _ in range(rng.randint(20, 60))] for _ in range(num_templates)]
+    reviews = [(" ".join(template), None) for template in templates]
+    while len(reviews) < num_reviews:
+        if rng.random() < duplicate_share:
+            template = rng.choice(templates)
+            words = list(template)
+            words[rng.randrange(len(words))] = rng.choice(WORDS)  # One word changed
+            a, b = _shingles(template), _shingles(words)
+            reviews.append((" ".join(words), len(a & b) / len(a | b)))
+        else:
+            reviews.append((" ".join(rng.choices(WORDS, k=int(rng.expovariate(1 / 30)) + 1)), None))
+    return reviews
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-reviews", type=int, default=200000)
+    parser.add_argument("--duplicate-share", type=float, default=0.2)
+    parser.add_argument("--capacity", type=int, default=20000)
+    args = parser.parse_args()
+
+    reviews = make_reviews(args.num_reviews, args.duplicate_share)
+    start = time.perf_counter()
+    index = NearDuplicateIndex(capacity=args.capacity)
+    dropped = [index.is_duplicate(text) for text, _ in reviews]
+    seconds = time.perf_counter() - start
+
+    # Second pass for the memory, since tracing allocations slows the first one down
+    tracemalloc.start()
+    index = NearDuplicateIndex(capacity=args.capacity)
+    for text, _ in reviews:
+        index.is_duplicate(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    planted = [drop for drop, (_, jaccard) in zip(dropped, reviews) if jaccard is not None]
+    similar = [drop for drop, (_, jaccard) in zip(dropped, reviews)
+               if jaccard is not None and jaccard >= index.threshold]
+    wrong = sum(drop for drop, (_, jaccard) in zip(dropped, reviews) if jaccard is None)
+    print(f"{len(reviews)} reviews in {seconds:.2f}s ({len(reviews) / seconds:.0f} reviews/s), "
+          f"peak memory {peak / 2 ** 20:.1f} MiB with capacity {args.capacity}")
+    print(f"Planted near duplicates found: {sum(planted)}/{len(planted)} ({sum(planted) / max(len(planted), 1):.1%}), "
+          f"{sum(similar)}/{len(similar)} ({sum(similar) / max(len(similar), 1):.1%}) of those with a Jaccard "
+          f"similarity of at least {index.threshold}. Other reviews dropped: {wrong} "
+          f"({wrong / max(len(reviews) - len(planted), 1):.2%})")
+
+
+if __name__ == "__main__":
+    main()
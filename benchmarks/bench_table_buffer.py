@@ -0,0 +1,83 @@
+"""
+Benchmark the memory and time of holding review rows in a table_buffer.TableBuffer against the lists of lists it
+replaced, and of handing them to the checkpoint store and the review dataset. Each container is filled in a fresh
+process so that its peak RSS is its own.
+
+Run from the repository root:
+    python benchmarks/bench_table_buffer.py --num-rows 1000000
+"""
+from multiprocessing import get_context
+from pathlib import Path
+
+import argparse
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _make_rows(num_rows: int, seed: int=0):
+    """
+    Review rows shaped like the output of data_collection.build_review_rows, generated lazily.
+    """
+    rng = random.Random(seed)
+    words = ["great", "game", "fun", "boring", "story", "graphics", "bugs", "friends", "multiplayer", "worth", "price",
+             "recommend", "hours", "controls", "music", "levels", "boss", "grind", "update", "developers"]
+    for review_id in range(num_rows):
+        text = " ".join(rng.choices(words, k=int(rng.expovariate(1 / 40)) + 1))
+        yield [review_id, 10 + review_id // 500, float(rng.randint(0, 10000)), text]
+
+
+def _run(container: str, num_rows: int, connection):
+    from checkpoint_store import CheckpointStore, TABLES
+    from review_dataset import ReviewDataset
+    from table_buffer import TableBuffer
+
+    start_rss = _peak_rss()
+    start = time.perf_counter()
+    rows = TableBuffer(TABLES["reviews"][1]) if container == "table_buffer" else []
+    rows += _make_rows(num_rows)
+    fill_seconds = time.perf_counter() - start
+    held_rss = _peak_rss() - start_rss
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = CheckpointStore(str(Path(directory, "checkpoint.sqlite3")))
+        start = time.perf_counter()
+        store.checkpoint({"reviews": rows})
+        checkpoint_seconds = time.perf_counter() - start
+        dataset = ReviewDataset(str(Path(directory, "reviews")))
+        start = time.perf_counter()
+        dataset.append(rows)
+        dataset_seconds = time.perf_counter() - start
+        store.close()
+    connection.send({"fill_seconds": fill_seconds, "held_rss_bytes": held_rss,
+                     "checkpoint_seconds": checkpoint_seconds, "review_dataset_seconds": dataset_seconds})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    context = get_context("spawn")
+    for container in ["list", "table_buffer"]:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_run, args=(container, args.num_rows, sender))
+        process.start()
+        result = receiver.recv()
+        process.join()
+        print(f"{container:>12}: {result['held_rss_bytes'] / 2 ** 20:7.1f} MiB held, "
+              f"filled in {result['fill_seconds']:.2f}s, checkpoint {result['checkpoint_seconds']:.2f}s, "
+              f"review dataset {result['review_dataset_seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
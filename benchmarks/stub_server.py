@@ -0,0 +1,194 @@
+"""
+Local stand-in for the Steam API, serving a synthetic catalogue built from the recorded responses in
+benchmarks/fixtures. GetAppList lists num_apps apps. The appdetails and appreviews responses of each app are recorded
+responses with the app id substituted, so every app has its own image, trailer and review ids. Which fixture an app
+gets, and how many reviews it has, only depends on its app id, so every run serves the same catalogue.
+
+Run on its own (e.g. to point main.py at it with the STEAM_API_URL and STEAM_STORE_URL environment variables):
+    python benchmarks/stub_server.py --num-apps 10000 --port 8766
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import argparse
+import json
+import socket
+import time
+import zlib
+
+FIXTURE_DIRECTORY = Path(__file__).resolve().parent / "fixtures"
+
+# App id of the first app of the catalogue and the step between app ids
+FIRST_APP_ID = 10
+APP_ID_STEP = 10
+
+# Review counts an app can get. Chosen by app id, so about a fifth of the apps have no reviews and some need 3 pages.
+REVIEW_COUNTS = [0, 3, 20, 45, 90, 130, 260]
+
+
+def catalogue_app_ids(num_apps: int):
+    """
+    :param num_apps: Size of the catalogue
+    :return: List of the app ids served by a stub server of this size
+    """
+    return list(range(FIRST_APP_ID, FIRST_APP_ID + APP_ID_STEP * num_apps, APP_ID_STEP))
+
+
+def _choose(app_id: int, options: list):
+    # A stable hash, unlike hash(), which is salted per process
+    return options[zlib.crc32(str(app_id).encode()) % len(options)]
+
+
+class Catalogue:
+    """
+    Serialised responses of the synthetic catalogue.
+    """
+
+    def __init__(self, num_apps: int, fixture_directory: Path=FIXTURE_DIRECTORY):
+        """
+        :param num_apps: Number of apps in GetAppList
+        :param fixture_directory: Directory of applist.json, appdetails.json and appreviews.json
+        """
+        with open(fixture_directory / "applist.json", "r") as f:
+            names = [app["name"] for app in json.load(f)["applist"]["apps"]]
+        self.app_list = json.dumps({"applist": {"apps": [
+            {"appid": app_id, "name": f"{names[idx % len(names)]} {app_id}" if names[idx % len(names)] else ""}
+            for idx, app_id in enumerate(catalogue_app_ids(num_apps))
+        ]}}).encode()
+
+        # (recorded app id, serialised response). The recorded id is replaced by the requested one.
+        with open(fixture_directory / "appdetails.json", "r") as f:
+            self.details = [(next(iter(response)), json.dumps(response)) for response in json.load(f)]
+        with open(fixture_directory / "appreviews.json", "r") as f:
+            pages = json.load(f)
+        self.reviews = [review for page in pages for review in page["reviews"]]
+        self.review_summary = pages[0]["query_summary"]
+
+    def app_details(self, app_id: int):
+        recorded_id, response = _choose(app_id, self.details)
+        return response.replace(recorded_id, str(app_id)).encode()
+
+    def review_page(self, app_id: int, cursor: str, num_per_page: int):
+        total = _choose(app_id, REVIEW_COUNTS)
+        start = 0 if cursor == "*" else int(cursor)
+        stop = min(start + num_per_page, total)
+        reviews = []
+        for idx in range(start, stop):
+            review = dict(self.reviews[(app_id + idx) % len(self.reviews)])
+            review["recommendationid"] = str(app_id * 1000 + idx)
+            review["timestamp_created"] = review["timestamp_updated"] = 1700000000 - idx * 3600
+            reviews.append(review)
+        query_summary = {"num_reviews": len(reviews)}
+        if cursor == "*":
+            # Only the first page carries the totals, as on Steam
+            num_positive = sum(review["voted_up"] for review in reviews) if total <= num_per_page else \
+                total * self.review_summary["total_positive"] // max(self.review_summary["total_reviews"], 1)
+            query_summary.update({"review_score": 8, "total_positive": num_positive,
+                                  "total_negative": total - num_positive, "total_reviews": total})
+        return json.dumps({"success": 1, "query_summary": query_summary, "reviews": reviews,
+                           "cursor": str(stop)}).encode()
+
+
+def _make_handler(catalogue: Catalogue, rate_limited_every: int):
+    state = {"requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, body: bytes, status: int=200, headers: dict=None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            if url.path.startswith("/ISteamApps/GetAppList"):
+                return self._send(catalogue.app_list, headers={"ETag": '"stub"'})
+
+            state["requests"] += 1
+            if rate_limited_every and state["requests"] % rate_limited_every == 0:
+                return self._send(b"{}", 429, {"Retry-After": "0"})
+            if url.path == "/api/appdetails":
+                return self._send(catalogue.app_details(int(query["appids"][0])))
+            if url.path.startswith("/appreviews/"):
+                return self._send(catalogue.review_page(int(url.path.split("/")[2]), query.get("cursor", ["*"])[0],
+                                                        int(query.get("num_per_page", ["20"])[0])))
+            self._send(b"{}", 404)
+
+    return Handler
+
+
+def serve(port: int, num_apps: int, rate_limited_every: int=0, ready=None):
+    """
+    Serve the catalogue until the process is stopped.
+    :param port: Port to listen on, on 127.0.0.1
+    :param num_apps: Size of the catalogue
+    :param rate_limited_every: If not 0, answer every n-th appdetails/appreviews request with a 429
+    :param ready: Optional multiprocessing.Event set once the server listens
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(Catalogue(num_apps), rate_limited_every))
+    server.daemon_threads = True
+    if ready is not None:
+        ready.set()
+    server.serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubServer:
+    """
+    Runs serve() in a child process, so that the server does not compete with the code being measured for the GIL.
+
+        with StubServer(10000) as server:
+            config.STEAM_API_URL = config.STEAM_STORE_URL = server.url
+    """
+
+    def __init__(self, num_apps: int, rate_limited_every: int=0, port: int=None):
+        self.num_apps = num_apps
+        self.rate_limited_every = rate_limited_every
+        self.port = _free_port() if port is None else port
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._process = None
+
+    def __enter__(self):
+        context = get_context("spawn")
+        ready = context.Event()
+        self._process = context.Process(target=serve, args=(self.port, self.num_apps, self.rate_limited_every, ready),
+                                        daemon=True)
+        self._process.start()
+        if not ready.wait(60):
+            raise RuntimeError("The stub server did not start.")
+        time.sleep(0.1)
+        return self
+
+    def __exit__(self, *args):
+        self._process.terminate()
+        self._process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-apps", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--rate-limited-every", type=int, default=0)
+    args = parser.parse_args()
+    print(f"Serving {args.num_apps} apps on http://127.0.0.1:{args.port}")
+    serve(args.port, args.num_apps, args.rate_limited_every)
+
+
+if __name__ == "__main__":
+    main()
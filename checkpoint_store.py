@@ -0,0 +1,435 @@
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+import ast
+import json
+import os
+import pickle
+import re
+import sqlite3
+import config
+import queried_apps
+from dimension_table import DimensionTable
+
+
+# SQLite cannot bind NumPy scalars. App ids read with pandas are np.int64.
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+
+
+# Table name -> (CSV file name, [(column, SQLite type), ...]). The first column is the primary key. The columns and
+# CSV files are the ones written by the original save_progress, so exported CSVs still work with the notebooks. The
+# typed columns added since (price_cents, app_type_id, currency_id) and the link and dimension tables come after them.
+TABLES = {
+    "games": ("steam_apps_info.csv", [
+        ("steam_app_id", "INTEGER"),
+        ("steam_app_name", "TEXT"),
+        ("app_type", "TEXT"),
+        ("description", "TEXT"),
+        ("total_reviews", "INTEGER"),
+        ("total_positive_reviews", "INTEGER"),
+        ("total_negative_reviews", "INTEGER"),
+        ("price_currency", "TEXT"),
+        ("price", "TEXT"),
+        ("genres", "TEXT"),
+        ("categores", "TEXT"),
+        ("platforms", "TEXT"),
+        ("developer_id", "INTEGER"),
+        ("publisher_id", "INTEGER"),
+        ("price_cents", "INTEGER"),
+        ("app_type_id", "INTEGER"),
+        ("currency_id", "INTEGER")
+    ]),
+    "reviews": ("steam_apps_reviews.csv", [
+        ("review_id", "INTEGER"),
+        ("steam_app_id", "INTEGER"),
+        ("playtime_at_review", "REAL"),
+        ("review", "TEXT")
+    ]),
+    "images": ("steam_apps_images.csv", [
+        ("image_id", "INTEGER"),
+        ("steam_app_id", "INTEGER"),
+        ("image_type", "TEXT"),
+        ("image_url", "TEXT")
+    ]),
+    "publishers": ("steam_apps_publishers.csv", [
+        ("publisher_id", "INTEGER"),
+        ("publisher_name", "TEXT")
+    ]),
+    "developers": ("steam_apps_developers.csv", [
+        ("developer_id", "INTEGER"),
+        ("developer_name", "TEXT")
+    ]),
+    "trailers": ("steam_apps_trailers.csv", [
+        ("trailer_id", "INTEGER"),
+        ("steam_app_id", "INTEGER"),
+        ("trailer_url", "TEXT")
+    ]),
+    "genres": ("steam_apps_genres.csv", [
+        ("genre_id", "INTEGER"),
+        ("genre_name", "TEXT")
+    ]),
+    "categories": ("steam_apps_categories.csv", [
+        ("category_id", "INTEGER"),
+        ("category_name", "TEXT")
+    ]),
+    "platforms": ("steam_apps_platforms.csv", [
+        ("platform_id", "INTEGER"),
+        ("platform_name", "TEXT")
+    ]),
+    "app_types": ("steam_apps_app_types.csv", [
+        ("app_type_id", "INTEGER"),
+        ("app_type_name", "TEXT")
+    ]),
+    "currencies": ("steam_apps_currencies.csv", [
+        ("currency_id", "INTEGER"),
+        ("currency_code", "TEXT")
+    ]),
+    "app_developers": ("steam_apps_app_developers.csv", [
+        ("steam_app_id", "INTEGER"),
+        ("developer_id", "INTEGER")
+    ]),
+    "app_publishers": ("steam_apps_app_publishers.csv", [
+        ("steam_app_id", "INTEGER"),
+        ("publisher_id", "INTEGER")
+    ]),
+    "app_genres": ("steam_apps_app_genres.csv", [
+        ("steam_app_id", "INTEGER"),
+        ("genre_id", "INTEGER")
+    ]),
+    "app_categories": ("steam_apps_app_categories.csv", [
+        ("steam_app_id", "INTEGER"),
+        ("category_id", "INTEGER")
+    ]),
+    "app_platforms": ("steam_apps_app_platforms.csv", [
+        ("steam_app_id", "INTEGER"),
+        ("platform_id", "INTEGER")
+    ])
+}
+
+# Name interning tables. Rows are (id, name) with dense ids. See dimension_table.DimensionTable.
+DIMENSION_TABLES = ["developers", "publishers", "genres", "categories", "platforms", "app_types", "currencies"]
+
+# Many-to-many tables linking apps to dimension rows, mapped to their dimension table. Their primary key is made of all
+# of their columns.
+LINK_TABLES = {"app_developers": "developers", "app_publishers": "publishers", "app_genres": "genres",
+               "app_categories": "categories", "app_platforms": "platforms"}
+
+# Columns of the review_sync table: the newest review seen and the review totals of each app at its last sync. See
+# data_collection.get_new_app_reviews.
+REVIEW_SYNC_COLUMNS = ["newest_timestamp", "newest_review_id", "total_reviews", "total_positive", "total_negative",
+                       "synced_at"]
+
+# Columns holding Python lists. They are stored as their repr, which is what DataFrame.to_csv wrote before.
+LIST_COLUMNS = {"genres", "categores", "platforms"}
+
+
+# Columns of the games table filled by _backfill_games for rows saved before they existed
+TYPED_GAME_COLUMNS = ["price_cents", "app_type_id", "currency_id"]
+
+_PRICE_PATTERN = re.compile(r"\d+(?:[.,\s\u00a0'’]\d+)*")
+
+
+def get_columns(table: str):
+    """
+    :param table: Name of a table in TABLES
+    :return: List of the column names of the table
+    """
+    return [column for column, _ in TABLES[table][1]]
+
+
+def get_primary_key(table: str):
+    """
+    :param table: Name of a table in TABLES
+    :return: List of the primary key columns of the table
+    """
+    if table in LINK_TABLES:
+        return get_columns(table)
+    return get_columns(table)[:1]
+
+
+def parse_formatted_price(price):
+    """
+    Parse a price formatted by Steam (price_overview.final_formatted), e.g. '$19.99', '19,99€', '¥ 1,980' or
+    'Rp 108 999'. A separator followed by exactly two digits at the end is read as the decimal separator. Any other
+    separator groups thousands, and the price is a whole number of units.
+    :param price: Formatted price. save_progress wrote an empty string for free apps and apps without a price, which
+    reads back from CSV as NaN.
+    :return: Price in cents (hundredths of the currency unit), 0 for an empty price, or -1 if price is not a price
+    """
+    if price is None or (isinstance(price, float) and np.isnan(price)) or str(price).strip() == "":
+        return 0
+    match = _PRICE_PATTERN.search(str(price))
+    if match is None:
+        return -1
+    number = match.group()
+    digits = re.sub(r"\D", "", number)
+    if len(number) > 3 and not number[-3].isdigit():
+        return int(digits)
+    return int(digits) * 100
+
+
+def _cursor_state(page: dict):
+    # The resume state of a review page: its cursor, the query summary, the number of reviews so far and the recent
+    # review ids of the app (review_dedup.SeenIds), if any
+    state = {key: page[key] for key in ("cursor", "query_summary", "num_reviews")}
+    if "seen_ids" in page:
+        state["seen_ids"] = list(page["seen_ids"])
+    return state
+
+
+class CheckpointStore:
+    """
+    Append-only checkpoint store for the crawl, backed by a SQLite database in WAL mode. Each checkpoint inserts only
+    the rows collected since the previous one, in a single transaction, so its cost does not grow with the size of
+    the dataset and a crash can never leave a half written checkpoint.
+    """
+
+    def __init__(self, path: str=None):
+        """
+        :param path: Path of the database file. Default config.CHECKPOINT_DATABASE.
+        """
+        self.path = config.CHECKPOINT_DATABASE if path is None else path
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.connection:
+            for table, (_, columns) in TABLES.items():
+                column_sql = ", ".join(f"{column} {column_type}" for column, column_type in columns)
+                self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({column_sql}, "
+                                        f"PRIMARY KEY ({', '.join(get_primary_key(table))}))")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS queried_apps "
+                                    "(steam_app_id INTEGER PRIMARY KEY, status INTEGER)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS review_cursors "
+                                    "(steam_app_id INTEGER PRIMARY KEY, state TEXT)")
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS review_sync (steam_app_id INTEGER PRIMARY KEY, "
+                                    f"{', '.join(column + ' INTEGER' for column in REVIEW_SYNC_COLUMNS)})")
+
+            # Stores created before the typed game columns get them, empty, and _backfill_games fills them
+            existing = {row[1] for row in self.connection.execute("PRAGMA table_info(games)")}
+            for column, column_type in TABLES["games"][1]:
+                if column not in existing:
+                    self.connection.execute(f"ALTER TABLE games ADD COLUMN {column} {column_type}")
+            self._backfill_games()
+
+    def _backfill_games(self, batch_size: int=10000):
+        """
+        Fill the typed columns and the app_platforms rows of games saved before they existed, whose app_type_id is
+        NULL, from the formatted price, the currency and app type names and the platforms list. Runs inside the
+        caller's transaction.
+        :param batch_size: Number of games updated at a time
+        """
+        rows = self.connection.execute("SELECT steam_app_id, app_type, price_currency, price, platforms FROM games "
+                                       "WHERE app_type_id IS NULL ORDER BY rowid").fetchall()
+        if not rows:
+            return
+        dimensions = {table: DimensionTable.from_rows(self.iter_rows(table))
+                      for table in ["platforms", "app_types", "currencies"]}
+        start = {table: len(dimension) for table, dimension in dimensions.items()}
+        for batch_start in range(0, len(rows), batch_size):
+            updates = []
+            links = []
+            for app_id, app_type, currency, price, platforms in rows[batch_start:batch_start + batch_size]:
+                currency_id = dimensions["currencies"].get_id(currency) if currency else -1
+                updates.append((parse_formatted_price(price), dimensions["app_types"].get_id(app_type), currency_id,
+                                app_id))
+                platforms = ast.literal_eval(platforms) if platforms else []
+                links += [(app_id, platform_id) for platform_id in dimensions["platforms"].get_ids(platforms)]
+            self.connection.executemany("UPDATE games SET price_cents = ?, app_type_id = ?, currency_id = ? "
+                                        "WHERE steam_app_id = ?", updates)
+            self.connection.executemany("INSERT OR IGNORE INTO app_platforms VALUES (?, ?)", links)
+        self._insert({table: dimension.rows(start[table]) for table, dimension in dimensions.items()}, [], None)
+        print(f"Filled the typed columns of {len(rows)} saved games.")
+
+    def close(self):
+        self.connection.close()
+
+    def count(self, table: str):
+        """
+        :param table: Table name
+        :return: Number of rows in the table
+        """
+        return self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def size(self):
+        """
+        :return: Size of the database in bytes, counting pages still in the write-ahead log
+        """
+        page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+        return page_count * self.connection.execute("PRAGMA page_size").fetchone()[0]
+
+    def next_id(self, table: str):
+        """
+        :param table: Name of a table in TABLES
+        :return: The primary key to use for the next row of the table
+        """
+        key = TABLES[table][1][0][0]
+        max_id = self.connection.execute(f"SELECT MAX({key}) FROM {table}").fetchone()[0]
+        return 0 if max_id is None else max_id + 1
+
+    def is_empty(self):
+        return self.count("queried_apps") == 0 and self.count("games") == 0
+
+    def checkpoint(self, new_rows: dict, queried_app_changes: list=(), review_cursors: dict=None,
+                   review_sync: dict=None):
+        """
+        Append rows to the store in one transaction.
+        :param new_rows: Dictionary mapping table name to a list of rows (lists in the column order of TABLES) that
+        are not in the store yet.
+        :param queried_app_changes: List of (app_id, status) set since the last checkpoint. See
+        queried_apps.QueriedAppsIndex.pop_changes.
+        :param review_cursors: Dictionary mapping app id to the last review page consumed for apps whose reviews were
+        only partly collected. Replaces the saved cursors. See data_collection.iter_app_review_pages.
+        :param review_sync: Dictionary mapping app id to its review sync state, for apps synced since the last
+        checkpoint. The review totals of the games table are updated to match. See
+        data_collection.get_new_app_reviews.
+        """
+        with self.connection:
+            self._insert(new_rows, queried_app_changes, review_cursors)
+            if review_sync:
+                self._update_review_sync(review_sync)
+
+    def _update_review_sync(self, review_sync):
+        placeholders = ", ".join("?" for _ in range(len(REVIEW_SYNC_COLUMNS) + 1))
+        self.connection.executemany(f"INSERT OR REPLACE INTO review_sync VALUES ({placeholders})", (
+            [app_id] + [state[column] for column in REVIEW_SYNC_COLUMNS] for app_id, state in review_sync.items()
+        ))
+        # The review totals of the games table follow the latest sync, so that total_reviews stays the sum of the
+        # positive and negative reviews
+        self.connection.executemany("UPDATE games SET total_reviews = ?, total_positive_reviews = ?, "
+                                    "total_negative_reviews = ? WHERE steam_app_id = ?", (
+            (state["total_reviews"], state["total_positive"], state["total_negative"], app_id)
+            for app_id, state in review_sync.items()
+        ))
+
+    def _insert(self, new_rows, queried_app_changes, review_cursors):
+        for table, rows in new_rows.items():
+            if len(rows) == 0:
+                continue
+            columns = get_columns(table)
+            list_idx = [idx for idx, column in enumerate(columns) if column in LIST_COLUMNS]
+            if list_idx:
+                rows = ([str(value) if idx in list_idx and isinstance(value, list) else value
+                         for idx, value in enumerate(row)] for row in rows)
+            placeholders = ", ".join("?" for _ in columns)
+            self.connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+
+        self.connection.executemany("INSERT OR REPLACE INTO queried_apps VALUES (?, ?)", queried_app_changes)
+
+        if review_cursors is not None:
+            self.connection.execute("DELETE FROM review_cursors")
+            self.connection.executemany("INSERT INTO review_cursors VALUES (?, ?)", (
+                (app_id, json.dumps(_cursor_state(page))) for app_id, page in review_cursors.items()
+            ))
+
+    def iter_rows(self, table: str, batch_size: int=10000):
+        """
+        Iterate over the rows of a table in primary key order without loading the whole table.
+        :param table: Table name
+        :param batch_size: Number of rows fetched from SQLite at a time
+        :return: Generator of row tuples
+        """
+        cursor = self.connection.execute(f"SELECT * FROM {table} ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def read_table(self, table: str, chunksize: int=None):
+        """
+        Read a table into a DataFrame indexed by its first column.
+        :param table: Name of a table in TABLES
+        :param chunksize: If given, return an iterator of DataFrames of this many rows instead
+        :return: DataFrame or iterator of DataFrames
+        """
+        return pd.read_sql_query(f"SELECT * FROM {table} ORDER BY rowid", self.connection,
+                                 index_col=get_columns(table)[0], chunksize=chunksize)
+
+    def queried_app_rows(self):
+        """
+        :return: Generator of (app_id, status) for every queried app. See queried_apps for the statuses.
+        """
+        return self.iter_rows("queried_apps")
+
+    def load_review_cursors(self):
+        """
+        :return: Dictionary mapping app id to the review resume state saved with the last checkpoint
+        """
+        return {app_id: json.loads(state) for app_id, state in self.iter_rows("review_cursors")}
+
+    def load_review_sync(self):
+        """
+        :return: Dictionary mapping app id to its review sync state saved with the last checkpoint
+        """
+        return {row[0]: dict(zip(REVIEW_SYNC_COLUMNS, row[1:])) for row in self.iter_rows("review_sync")}
+
+    def export_csv(self, directory: str=None, chunksize: int=100000):
+        """
+        Write every table to the CSV files read by the analysis notebooks. Tables are streamed in chunks.
+        :param directory: Output directory. Default config.DATA_DIRECTORY.
+        :param chunksize: Number of rows read and written at a time
+        """
+        directory = config.DATA_DIRECTORY if directory is None else directory
+        for table, (file_name, _) in TABLES.items():
+            path = os.path.join(directory, file_name)
+            temp_path = path + ".tmp"
+            header = True
+            with open(temp_path, "w", newline="") as f:
+                for chunk in self.read_table(table, chunksize=chunksize):
+                    chunk.to_csv(f, header=header)
+                    header = False
+                if header:  # Empty table
+                    pd.DataFrame(columns=get_columns(table)).set_index(get_columns(table)[0]).to_csv(f)
+            os.replace(temp_path, path)
+
+    def import_csv_checkpoint(self, directory: str=None, chunksize: int=100000):
+        """
+        Import a checkpoint written by the old save_progress (six CSV files, queried_apps.pkl and
+        review_cursors.json) into an empty store. Queried apps with a games row get the status DONE, the others
+        NO_DETAILS.
+        :param directory: Directory holding the files. Default config.DATA_DIRECTORY.
+        :param chunksize: Number of CSV rows read at a time
+        :return: True if a checkpoint was found and imported
+        """
+        directory = config.DATA_DIRECTORY if directory is None else directory
+        games_path = os.path.join(directory, TABLES["games"][0])
+        queried_path = os.path.join(directory, "queried_apps.pkl")
+        if not self.is_empty() or not Path(games_path).is_file() or not Path(queried_path).is_file():
+            return False
+
+        print("Importing CSV checkpoint into the checkpoint store.")
+        with open(queried_path, "rb") as f:
+            queried_app_ids = pickle.load(f)
+
+        review_cursors = {}
+        cursor_path = os.path.join(directory, "review_cursors.json")
+        if Path(cursor_path).is_file():
+            with open(cursor_path, "r") as f:
+                review_cursors = {int(app_id): state for app_id, state in json.load(f).items()}
+
+        with self.connection:
+            for table, (file_name, _) in TABLES.items():
+                path = os.path.join(directory, file_name)
+                if not Path(path).is_file():
+                    continue
+                placeholders = ", ".join("?" for _ in get_columns(table))
+                for chunk in pd.read_csv(path, chunksize=chunksize):
+                    # Columns added since the checkpoint was written are NULL and filled by _backfill_games
+                    chunk = chunk.reindex(columns=get_columns(table))
+                    chunk = chunk.astype(object).where(chunk.notna(), None)
+                    self.connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})",
+                                                chunk.itertuples(index=False, name=None))
+            # Only apps with a games row were written. The old checkpoint does not say whether the others had no
+            # details or no reviews, and both are skipped by the crawl, so they are imported as NO_DETAILS. Importing
+            # them as DONE would make every sync_reviews request their reviews.
+            game_ids = {app_id for app_id, in self.connection.execute("SELECT steam_app_id FROM games")}
+            self._insert({}, [(app_id, queried_apps.DONE if app_id in game_ids else queried_apps.NO_DETAILS)
+                              for app_id in queried_app_ids], review_cursors)
+            self._backfill_games()
+        return True
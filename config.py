@@ -3,3 +3,92 @@ import os
 DATA_DIRECTORY = "./data"
 STEAM_APP_JSON_DATA = os.path.join(DATA_DIRECTORY, "steam_apps.json")
 STEAM_APP_CSV_DATA = os.path.join(DATA_DIRECTORY, "steam_apps.csv")
+STEAM_APP_JSON_METADATA = os.path.join(DATA_DIRECTORY, "steam_apps.meta.json")
+CHECKPOINT_DATABASE = os.path.join(DATA_DIRECTORY, "checkpoint.sqlite3")
+QUERIED_APPS_INDEX = os.path.join(DATA_DIRECTORY, "queried_apps.npz")
+# Name to app id index of the app list, rebuilt when steam_apps.json changes. See app_name_index.
+APP_NAME_INDEX = os.path.join(DATA_DIRECTORY, "steam_app_names.npz")
+
+# Sharded crawl: queue of shard leases, one checkpoint store per shard and the store they are merged into. See
+# crawl_coordinator.
+SHARD_DIRECTORY = os.path.join(DATA_DIRECTORY, "shards")
+SHARD_QUEUE_DATABASE = os.path.join(SHARD_DIRECTORY, "queue.sqlite3")
+SHARD_MERGED_DATABASE = os.path.join(SHARD_DIRECTORY, "merged.sqlite3")
+SHARD_SIZE = 1000
+SHARD_LEASE_SECONDS = 900
+
+# Parquet copy of the reviews table, partitioned into this many buckets by app id. See review_dataset.
+REVIEW_DATASET_DIRECTORY = os.path.join(DATA_DIRECTORY, "steam_apps_reviews")
+REVIEW_DATASET_BUCKETS = 32
+
+# Brightness, contrast, saturation and dominant hue of every image in the images table. See image_features.
+IMAGE_ATTRIBUTES_CSV = os.path.join(DATA_DIRECTORY, "steam_images_attributes.csv")
+
+# Parquet copies of the exported tables and of the views derived from them, in a directory of this name next to the
+# CSV files. They are rebuilt when a CSV file they come from changes. See steam_dataset.
+DATASET_CACHE_DIRECTORY_NAME = "dataset_cache"
+
+# Reviews grouped by genre and the transaction files made from them, used by the CleanText notebook
+GROUPED_TEXT_DIRECTORY = "./DataMiningProjectData/grouped-text"
+
+# After crawling new apps, fetch only the reviews written since the last crawl or sync of every finished app
+REFRESH_REVIEWS = False
+
+# Write the CSV files read by the analysis notebooks from the checkpoint store at the end of every crawl run
+EXPORT_CSV_AT_END = True
+
+# Base URLs of the Steam endpoints. These can be pointed at a local stand-in server through environment variables.
+STEAM_API_URL = os.environ.get("STEAM_API_URL", "https://api.steampowered.com")
+STEAM_STORE_URL = os.environ.get("STEAM_STORE_URL", "https://store.steampowered.com")
+
+# HTTP client settings shared by every Steam API call. The timeout is (connect, read) in seconds.
+HTTP_TIMEOUT = (5, 30)
+HTTP_RETRIES = 3
+HTTP_RETRY_BACKOFF = 0.5
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 16
+HTTP_USER_AGENT = "Data-Mining-Project/1.0 (+https://github.com/daniel-ethridge/Data-Mining-Project)"
+
+# On-disk cache of Steam API responses. Time to live in seconds per endpoint; endpoints not listed are not cached.
+# Set RESPONSE_CACHE_IGNORE_TTL to re-process a previous crawl from the cache without any network calls. The first
+# review page of an app (cursor '*') and the pages of a delta sync are always fetched, since they hold the new reviews.
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_DIRECTORY = os.path.join(DATA_DIRECTORY, "response_cache")
+RESPONSE_CACHE_TTL = {
+    "appdetails": 7 * 24 * 3600,
+    "appreviews": 24 * 3600,
+}
+RESPONSE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+RESPONSE_CACHE_IGNORE_TTL = False
+
+# Review deduplication at ingest. Reviews whose recommendationid is among the last REVIEW_DEDUP_WINDOW ids of their app
+# are dropped. With REVIEW_NEAR_DUPLICATE_FILTER, reviews of at least REVIEW_NEAR_DUPLICATE_MIN_SHINGLES word 3-grams
+# whose estimated Jaccard similarity to one of the last REVIEW_NEAR_DUPLICATE_CAPACITY kept reviews of the same app is
+# at least REVIEW_NEAR_DUPLICATE_THRESHOLD are dropped too. The capacity is per app: every app gets its own index, which
+# is not saved, so a resumed app starts from an empty one. See review_dedup.
+REVIEW_DEDUP_WINDOW = 10000
+REVIEW_NEAR_DUPLICATE_FILTER = True
+REVIEW_NEAR_DUPLICATE_THRESHOLD = 0.8
+REVIEW_NEAR_DUPLICATE_CAPACITY = 20000
+REVIEW_NEAR_DUPLICATE_MIN_SHINGLES = 8
+
+# Crawler settings. Rate limits are given as (number of requests, period in seconds) per endpoint.
+CRAWLER_NUM_WORKERS = 8
+# Rows collected since the last checkpoint are saved early when they take more memory than this
+CRAWL_BUFFER_MAX_BYTES = 64 * 1024 ** 2
+CRAWLER_MAX_RETRIES = 6
+CRAWLER_BACKOFF_BASE = 1.0
+CRAWLER_BACKOFF_CAP = 300.0
+CRAWLER_RATE_LIMITS = {
+    "appdetails": (200, 300),
+    "appreviews": (600, 300),
+}
+
+# Crawl telemetry. Snapshots are appended to <TELEMETRY_DIRECTORY>/<name>.jsonl and the Prometheus text file
+# <name>.prom is rewritten every TELEMETRY_INTERVAL seconds. Latency buckets are upper bounds in seconds.
+TELEMETRY_ENABLED = True
+TELEMETRY_DIRECTORY = os.path.join(DATA_DIRECTORY, "telemetry")
+TELEMETRY_INTERVAL = 10
+TELEMETRY_MAX_BYTES = 50 * 1024 ** 2
+TELEMETRY_METRIC_PREFIX = "steam_crawl_"
+TELEMETRY_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
@@ -0,0 +1,389 @@
+"""
+Sharded crawl. The app id space is split into shards of contiguous app ids, kept in a SQLite queue. Worker processes on
+this machine lease one shard at a time and crawl it into a checkpoint store of its own. A lease that is not renewed
+expires, so the shard of a crashed worker is handed out again and continues from the last checkpoint of its store.
+Completed shards are merged into one store in shard order, so the merged store does not depend on which worker crawled
+which shard or when.
+
+    python crawl_coordinator.py create --shard-size 1000
+    python crawl_coordinator.py work --processes 4
+    python crawl_coordinator.py merge --export
+"""
+from contextlib import contextmanager
+from multiprocessing import Process
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import argparse
+import os
+import socket
+import sqlite3
+import time
+import config
+import crawler
+import telemetry
+from checkpoint_store import CheckpointStore, DIMENSION_TABLES, TABLES, get_columns
+from crawl_session import CrawlSession
+from dimension_table import DimensionTable
+
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+# Tables whose first column is a row id renumbered by the merge
+ROW_ID_TABLES = ["reviews", "images", "trailers"]
+
+# Columns holding dimension ids, remapped by the merge: table -> [(column, dimension table)]
+DIMENSION_COLUMNS = {
+    "games": [("developer_id", "developers"), ("publisher_id", "publishers"), ("app_type_id", "app_types"),
+              ("currency_id", "currencies")],
+    "app_developers": [("developer_id", "developers")],
+    "app_publishers": [("publisher_id", "publishers")],
+    "app_genres": [("genre_id", "genres")],
+    "app_categories": [("category_id", "categories")],
+    "app_platforms": [("platform_id", "platforms")]
+}
+
+
+class ShardQueue:
+    """
+    Queue of shards with time-limited leases, in a SQLite database. Every state change runs in an immediate
+    transaction, so two workers can never lease the same shard. The database is in WAL mode, whose readers and writers
+    share memory, so every worker must run on the same host. Do not put the queue on a network filesystem shared by
+    several machines.
+    """
+
+    def __init__(self, path: str=None, timeout: float=60):
+        """
+        :param path: Path of the queue database. Default config.SHARD_QUEUE_DATABASE.
+        :param timeout: Seconds to wait for another process holding the database lock
+        """
+        self.path = config.SHARD_QUEUE_DATABASE if path is None else path
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=timeout, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS shards (shard_id INTEGER PRIMARY KEY, "
+                                "first_app_id INTEGER, last_app_id INTEGER, status TEXT, owner TEXT, "
+                                "lease_expires REAL, attempts INTEGER, completed_at REAL)")
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def create_shards(self, app_ids, shard_size: int=None):
+        """
+        Split app ids into shards of shard_size consecutive ids. Does nothing if the queue already has shards.
+        :param app_ids: Iterable of Steam app ids
+        :param shard_size: Number of apps per shard. Default config.SHARD_SIZE.
+        :return: Number of shards created
+        """
+        shard_size = config.SHARD_SIZE if shard_size is None else shard_size
+        app_ids = np.unique(np.fromiter(app_ids, dtype=np.int64))
+        with self._transaction() as connection:
+            if connection.execute("SELECT COUNT(*) FROM shards").fetchone()[0] > 0:
+                return 0
+            shards = [(shard_id, int(app_ids[start]), int(app_ids[min(start + shard_size, len(app_ids)) - 1]), PENDING)
+                      for shard_id, start in enumerate(range(0, len(app_ids), shard_size))]
+            connection.executemany("INSERT INTO shards VALUES (?, ?, ?, ?, NULL, NULL, 0, NULL)", shards)
+        return len(shards)
+
+    def acquire(self, owner: str, lease_seconds: float=None):
+        """
+        Lease the first shard that is pending or whose lease has expired.
+        :param owner: Name of the worker, e.g. host:pid
+        :param lease_seconds: Length of the lease. Default config.SHARD_LEASE_SECONDS.
+        :return: (shard_id, first_app_id, last_app_id), or None if there is nothing left to lease
+        """
+        lease_seconds = config.SHARD_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        now = time.time()
+        with self._transaction() as connection:
+            shard = connection.execute("SELECT shard_id, first_app_id, last_app_id FROM shards "
+                                       "WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                                       "ORDER BY shard_id LIMIT 1", (PENDING, LEASED, now)).fetchone()
+            if shard is not None:
+                connection.execute("UPDATE shards SET status = ?, owner = ?, lease_expires = ?, "
+                                   "attempts = attempts + 1 WHERE shard_id = ?",
+                                   (LEASED, owner, now + lease_seconds, shard[0]))
+        return shard
+
+    def renew(self, shard_id: int, owner: str, lease_seconds: float=None):
+        """
+        Extend a lease.
+        :return: False if the lease expired and was given to another worker, or the shard is not leased by owner
+        """
+        lease_seconds = config.SHARD_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        with self._transaction() as connection:
+            cursor = connection.execute("UPDATE shards SET lease_expires = ? WHERE shard_id = ? AND owner = ? "
+                                        "AND status = ?", (time.time() + lease_seconds, shard_id, owner, LEASED))
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id: int, owner: str):
+        """
+        Mark a leased shard as done.
+        :return: False if the shard is not leased by owner
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute("UPDATE shards SET status = ?, lease_expires = NULL, completed_at = ? "
+                                        "WHERE shard_id = ? AND owner = ? AND status = ?",
+                                        (DONE, time.time(), shard_id, owner, LEASED))
+        return cursor.rowcount == 1
+
+    def release(self, shard_id: int, owner: str):
+        """
+        Give a leased shard back to the queue, e.g. when the worker fails.
+        """
+        with self._transaction() as connection:
+            connection.execute("UPDATE shards SET status = ?, owner = NULL, lease_expires = NULL "
+                               "WHERE shard_id = ? AND owner = ? AND status = ?", (PENDING, shard_id, owner, LEASED))
+
+    def reset(self):
+        """
+        Put every shard back in the queue, e.g. to re-crawl the whole catalogue. Shard stores are kept, so apps already
+        crawled are skipped.
+        """
+        with self._transaction() as connection:
+            connection.execute("UPDATE shards SET status = ?, owner = NULL, lease_expires = NULL, completed_at = NULL",
+                               (PENDING,))
+
+    def shard_ids(self, status: str=None):
+        """
+        :param status: Optional status to filter on
+        :return: Sorted list of shard ids
+        """
+        if status is None:
+            rows = self.connection.execute("SELECT shard_id FROM shards ORDER BY shard_id")
+        else:
+            rows = self.connection.execute("SELECT shard_id FROM shards WHERE status = ? ORDER BY shard_id", (status,))
+        return [shard_id for shard_id, in rows]
+
+    def count_by_status(self):
+        """
+        :return: Dictionary mapping status to number of shards. Expired leases are counted as 'expired'.
+        """
+        counts = {PENDING: 0, LEASED: 0, "expired": 0, DONE: 0}
+        for status, expired, count in self.connection.execute(
+                "SELECT status, status = ? AND lease_expires < ?, COUNT(*) FROM shards GROUP BY 1, 2",
+                (LEASED, time.time())):
+            counts["expired" if expired else status] += count
+        return counts
+
+
+def shard_directory(shard_id: int, directory: str=None):
+    """
+    :param shard_id: Shard id
+    :param directory: Directory of the shards. Default config.SHARD_DIRECTORY.
+    :return: Directory holding the checkpoint store and queried apps index of the shard
+    """
+    directory = config.SHARD_DIRECTORY if directory is None else directory
+    return os.path.join(directory, f"shard-{shard_id:05d}")
+
+
+def open_shard_store(shard_id: int, directory: str=None):
+    """
+    :return: checkpoint_store.CheckpointStore of the shard
+    """
+    path = shard_directory(shard_id, directory)
+    Path(path).mkdir(parents=True, exist_ok=True)
+    return CheckpointStore(os.path.join(path, "checkpoint.sqlite3"))
+
+
+def run_worker(app_ids, owner: str=None, queue_path: str=None, directory: str=None, lease_seconds: float=None,
+               fetcher=None, max_shards: int=None):
+    """
+    Lease shards and crawl them until the queue is empty. The lease is renewed at least three times per lease length
+    while the shard is crawled, checked after every review page so that apps with millions of reviews keep it too, and
+    before every checkpoint. If a renewal fails, the shard has been given to another worker and this worker moves on
+    without saving.
+    :param app_ids: Every Steam app id, e.g. the appid column of config.STEAM_APP_CSV_DATA. Each shard crawls the ids
+    in its range.
+    :param owner: Name of the worker. Default host:pid.
+    :param queue_path: See ShardQueue
+    :param directory: See shard_directory
+    :param lease_seconds: Length of a lease. Default config.SHARD_LEASE_SECONDS.
+    :param fetcher: crawler.RateLimitedFetcher. Default is a new fetcher with the config settings.
+    :param max_shards: Optional maximum number of shards to crawl
+    :return: Number of shards completed
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}" if owner is None else owner
+    lease_seconds = config.SHARD_LEASE_SECONDS if lease_seconds is None else lease_seconds
+    app_ids = np.unique(np.fromiter(app_ids, dtype=np.int64))
+    fetcher = crawler.RateLimitedFetcher() if fetcher is None else fetcher
+    queue = ShardQueue(queue_path)
+
+    num_completed = 0
+    while max_shards is None or num_completed < max_shards:
+        shard = queue.acquire(owner, lease_seconds)
+        if shard is None:
+            break
+        shard_id, first_app_id, last_app_id = shard
+        shard_app_ids = app_ids[(app_ids >= first_app_id) & (app_ids <= last_app_id)].tolist()
+        print(f"{owner} leased shard {shard_id} ({len(shard_app_ids)} apps).")
+
+        store = open_shard_store(shard_id, directory)
+        try:
+            session = CrawlSession(store, os.path.join(shard_directory(shard_id, directory), "queried_apps.npz"),
+                                   progress_path=None)
+            renewed_at = time.monotonic()
+            lease_held = True
+
+            def renew():
+                nonlocal renewed_at, lease_held
+                lease_held = lease_held and queue.renew(shard_id, owner, lease_seconds)
+                renewed_at = time.monotonic()
+                return lease_held
+
+            def heartbeat():
+                return lease_held and (time.monotonic() - renewed_at <= lease_seconds / 3 or renew())
+
+            for app_id, message in session.crawl(shard_app_ids, fetcher, before_save=renew, heartbeat=heartbeat):
+                print(f"Shard {shard_id}. App {app_id}. {message}")
+                if not heartbeat():
+                    break
+
+            if lease_held and queue.complete(shard_id, owner):
+                num_completed += 1
+                print(f"{owner} completed shard {shard_id}.")
+            else:
+                print(f"{owner} lost the lease on shard {shard_id}.")
+        except BaseException:
+            queue.release(shard_id, owner)
+            raise
+        finally:
+            store.close()
+    queue.close()
+    return num_completed
+
+
+def _run_worker_process(app_ids, worker_number, queue_path, directory, lease_seconds, rate_limits):
+    owner = f"{socket.gethostname()}:{os.getpid()}:{worker_number}"
+    with telemetry.TelemetryExporter(f"worker-{socket.gethostname()}-{worker_number}"):
+        run_worker(app_ids, owner, queue_path, directory, lease_seconds, crawler.RateLimitedFetcher(rate_limits))
+
+
+def run_workers(app_ids, num_processes: int, queue_path: str=None, directory: str=None, lease_seconds: float=None):
+    """
+    Run worker processes on this machine until the queue is empty. The rate limits of config.CRAWLER_RATE_LIMITS
+    are split evenly between the processes, since they share one IP address.
+    :param app_ids: See run_worker
+    :param num_processes: Number of worker processes
+    :return: List of the exit codes of the processes
+    """
+    app_ids = np.unique(np.fromiter(app_ids, dtype=np.int64))
+    rate_limits = {endpoint: (num_requests / num_processes, period)
+                   for endpoint, (num_requests, period) in config.CRAWLER_RATE_LIMITS.items()}
+    processes = [Process(target=_run_worker_process,
+                         args=(app_ids, worker_number, queue_path, directory, lease_seconds, rate_limits))
+                 for worker_number in range(num_processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
+
+
+def merge_shards(output_path: str=None, queue_path: str=None, directory: str=None, include_incomplete: bool=False,
+                 batch_size: int=100000):
+    """
+    Merge shard stores into a new checkpoint store. Shards are read in shard id order and their rows in insertion
+    order. Reviews, images and trailers get new consecutive ids and dimension names are interned again in order of
+    first appearance, with every dimension id column remapped to match. The result only depends on the contents of
+    the shard stores.
+    :param output_path: Path of the merged store. It is replaced. Default config.SHARD_MERGED_DATABASE.
+    :param queue_path: See ShardQueue
+    :param directory: See shard_directory
+    :param include_incomplete: If True, also merge the progress of shards that are not done
+    :param batch_size: Number of rows inserted per transaction
+    :return: checkpoint_store.CheckpointStore of the merged store
+    """
+    output_path = config.SHARD_MERGED_DATABASE if output_path is None else output_path
+    queue = ShardQueue(queue_path)
+    shard_ids = queue.shard_ids() if include_incomplete else queue.shard_ids(DONE)
+    queue.close()
+
+    for suffix in ["", "-wal", "-shm"]:
+        if Path(output_path + suffix).is_file():
+            os.remove(output_path + suffix)
+    merged = CheckpointStore(output_path)
+    dimensions = {table: DimensionTable() for table in DIMENSION_TABLES}
+    next_ids = {table: 0 for table in ROW_ID_TABLES}
+    review_cursors = {}
+
+    for shard_id in shard_ids:
+        if not Path(shard_directory(shard_id, directory), "checkpoint.sqlite3").is_file():
+            continue
+        store = open_shard_store(shard_id, directory)
+
+        # Map the dimension ids of the shard to merged ids. -1 (no developer, publisher or currency) stays -1.
+        id_maps = {}
+        for table in DIMENSION_TABLES:
+            id_maps[table] = np.array([dimensions[table].get_id(name) for _, name in store.iter_rows(table)],
+                                      dtype=np.int64)
+        merged.checkpoint({table: dimensions[table].rows(merged.count(table)) for table in DIMENSION_TABLES})
+
+        for table in TABLES:
+            if table in DIMENSION_TABLES:
+                continue
+            columns = get_columns(table)
+            for chunk in pd.read_sql_query(f"SELECT * FROM {table} ORDER BY rowid", store.connection,
+                                           chunksize=batch_size):
+                if table in ROW_ID_TABLES:
+                    chunk[columns[0]] = np.arange(next_ids[table], next_ids[table] + len(chunk))
+                    next_ids[table] += len(chunk)
+                for column, dimension in DIMENSION_COLUMNS.get(table, []):
+                    local_ids = chunk[column].to_numpy(dtype=np.int64)
+                    id_map = np.append(id_maps[dimension], -1)  # Index -1 maps to -1
+                    chunk[column] = id_map[local_ids]
+                rows = chunk[columns].astype(object).where(chunk[columns].notna(), None).values.tolist()
+                merged.checkpoint({table: rows})
+
+        merged.checkpoint({}, list(store.queried_app_rows()), review_sync=store.load_review_sync())
+        review_cursors.update(store.load_review_cursors())
+        store.close()
+
+    merged.checkpoint({}, review_cursors=review_cursors)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["create", "work", "merge", "status", "reset"])
+    parser.add_argument("--shard-size", type=int, default=None, help="Apps per shard. Default config.SHARD_SIZE.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to run on this machine")
+    parser.add_argument("--lease-seconds", type=float, default=None, help="Default config.SHARD_LEASE_SECONDS")
+    parser.add_argument("--include-incomplete", action="store_true", help="Also merge shards that are not done")
+    parser.add_argument("--export", action="store_true", help="Export the merged store to CSV files")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        app_ids = pd.read_csv(config.STEAM_APP_CSV_DATA)["appid"]
+        print(f"Shards created: {ShardQueue().create_shards(app_ids, args.shard_size)}")
+    elif args.command == "work":
+        app_ids = pd.read_csv(config.STEAM_APP_CSV_DATA)["appid"]
+        if args.processes == 1:
+            with telemetry.TelemetryExporter(f"worker-{socket.gethostname()}-{os.getpid()}"):
+                run_worker(app_ids, lease_seconds=args.lease_seconds)
+        else:
+            run_workers(app_ids, args.processes, lease_seconds=args.lease_seconds)
+    elif args.command == "merge":
+        merged = merge_shards(include_incomplete=args.include_incomplete)
+        print(f"Merged apps: {merged.count('games')}. Reviews: {merged.count('reviews')}.")
+        if args.export:
+            merged.export_csv()
+    elif args.command == "reset":
+        ShardQueue().reset()
+    print(f"Shards: {ShardQueue().count_by_status()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import numpy as np
+import asset_extraction
+import config
+import crawler
+import data_collection
+import telemetry
+from review_dedup import NearDuplicateIndex, SeenIds
+from data_collection import save_progress
+from checkpoint_store import DIMENSION_TABLES, TABLES
+from dimension_table import DimensionTable
+from queried_apps import QueriedAppsIndex, DONE, NO_DETAILS, NO_REVIEWS
+from table_buffer import TableBuffer
+
+
+class CrawlSession:
+    """
+    Everything a crawl keeps between checkpoints of one checkpoint store: the rows collected since the last
+    checkpoint, the dimension tables, the crawl status of every app, the review cursors and sync states, and the next
+    primary keys. main.py runs one session on the main store. crawl_coordinator runs one per shard, each on the store
+    of its shard.
+    """
+
+    def __init__(self, store, queried_apps_path: str=None, review_dataset=None, progress_path: str="./progress.txt",
+                 save_every: int=10):
+        """
+        :param store: checkpoint_store.CheckpointStore the session appends to
+        :param queried_apps_path: Path of the saved queried_apps.QueriedAppsIndex. Default config.QUERIED_APPS_INDEX.
+        :param review_dataset: Optional review_dataset.ReviewDataset also appended to at every checkpoint
+        :param progress_path: File the time of the last checkpoint is written to, or None
+        :param save_every: Number of apps written between checkpoints
+        """
+        self.store = store
+        self.queried_apps_path = config.QUERIED_APPS_INDEX if queried_apps_path is None else queried_apps_path
+        self.review_dataset = review_dataset
+        self.progress_path = progress_path
+        self.save_every = save_every
+
+        # Only the small dimension tables (developers, publishers, genres, ...) are loaded. All other rows are kept in
+        # typed column buffers only until the next checkpoint appends them to the store.
+        self.new_rows = {table: TableBuffer(TABLES[table][1]) for table in [
+            "games", "reviews", "images", "trailers", "app_developers", "app_publishers", "app_genres",
+            "app_categories", "app_platforms"]}
+        self.before_save = None
+        self.heartbeat = None
+        self.stopped = False
+        self.dimensions = {table: DimensionTable.from_rows(store.iter_rows(table)) for table in DIMENSION_TABLES}
+
+        # Crawl status of every app id. Membership checks are O(1).
+        self.queried_apps = QueriedAppsIndex.load(self.queried_apps_path, store)
+
+        # Apps whose reviews were only partly collected by an earlier run continue from their last saved cursor
+        self.review_cursors = store.load_review_cursors()
+
+        # Newest review and review totals of every crawled app, for sync_reviews. States set since the last
+        # checkpoint are also kept in review_sync_changes.
+        self.review_sync = store.load_review_sync()
+        self.review_sync_changes = {}
+
+        self.next_review_id = store.next_id("reviews")
+        self.next_image_id = store.next_id("images")
+        self.next_trailer_id = store.next_id("trailers")
+        self.num_games = store.count("games")
+
+    def save(self):
+        """
+        Append everything collected since the last checkpoint to the store.
+        """
+        save_progress(self.store, self.new_rows, self.dimensions, self.queried_apps, self.review_cursors,
+                      self.review_dataset, self.review_sync_changes, self.queried_apps_path, self.progress_path)
+
+    def crawl(self, app_ids, fetcher=None, before_save=None, heartbeat=None):
+        """
+        Crawl apps that have not been queried yet, saving a checkpoint every save_every written apps and at the end.
+        :param app_ids: Iterable of Steam app ids. Apps already in queried_apps are skipped.
+        :param fetcher: crawler.RateLimitedFetcher. Default is a new fetcher with the config settings.
+        :param before_save: Optional function called before every checkpoint. If it returns False, the crawl stops
+        without saving, e.g. because the lease on the shard was lost.
+        :param heartbeat: Optional function called after every review page, e.g. to renew a lease while an app with
+        many reviews is crawled. If it returns False, the crawl stops without saving.
+        :return: Generator of (app_id, message) describing the outcome of each app
+        """
+        self.before_save = before_save
+        self.heartbeat = heartbeat
+        self.stopped = False
+        pending_app_ids = (app_id for app_id in app_ids if app_id not in self.queried_apps)
+        for app_id, details, review_pages in crawler.crawl_apps(pending_app_ids, fetcher,
+                                                                review_cursors=self.review_cursors):
+            message, written = self.add_app(app_id, details, review_pages)
+            yield app_id, message
+            if self.stopped:
+                return
+            if written and self.num_games % self.save_every == 0:
+                if before_save is not None and not before_save():
+                    return
+                self.save()
+        if before_save is None or before_save():
+            self.save()
+        self.before_save = None
+        self.heartbeat = None
+
+    def buffered_bytes(self):
+        """
+        :return: Number of bytes held by the rows collected since the last checkpoint
+        """
+        return sum(rows.nbytes() for rows in self.new_rows.values())
+
+    def add_app(self, app_id, details, review_pages):
+        """
+        Turn the details and review pages of an app into rows and set its status.
+        :param app_id: Steam app id
+        :param details: App details. See crawler.crawl_apps.
+        :param review_pages: Iterator of review pages. See crawler.crawl_apps.
+        :return: (message, True if a game row was written)
+        """
+        if details is not None and not details:  # Details is false. Leave the app for the next run.
+            telemetry.increment("apps_total", outcome="details_failed")
+            return "Details request failed. Skipping.", False
+
+        if details is None:
+            self.queried_apps.set_status(app_id, NO_DETAILS)
+            telemetry.increment("apps_total", outcome="no_details")
+            return "Details from app is None. Skipping.", False
+
+        # Save reviews one page at a time. The cursor of the last saved page is kept so that, if the reviews fail
+        # part way through, the next run continues from there.
+        num_app_reviews = 0
+        resumed = app_id in self.review_cursors  # The newest reviews were in pages of an earlier run
+        seen_ids = SeenIds(self.review_cursors[app_id].get("seen_ids", []) if resumed else [])
+        near_duplicates = self.near_duplicate_index()
+        sync_state = None
+        try:
+            for page in review_pages:
+                query_summary = page["query_summary"]
+                page_reviews = self.filter_reviews(page["reviews"], seen_ids, near_duplicates)
+                self.new_rows["reviews"] += data_collection.build_review_rows(app_id, page_reviews,
+                                                                              self.next_review_id)
+                self.next_review_id += len(page_reviews)
+                sync_state = data_collection.update_review_sync_state(sync_state, query_summary, page["reviews"])
+
+                num_app_reviews += len(page_reviews)
+                telemetry.increment("reviews_total", len(page_reviews))
+                self.review_cursors[app_id] = page
+                page["reviews"] = []  # The page is kept for its cursor and the recent review ids only
+                page["seen_ids"] = seen_ids
+
+                # Apps with millions of reviews are saved part way through, so the buffers stay small. The saved
+                # cursor lets the next run continue after the saved reviews.
+                if self.buffered_bytes() > config.CRAWL_BUFFER_MAX_BYTES and \
+                        (self.before_save is None or self.before_save()):
+                    self.save()
+                if self.heartbeat is not None and not self.heartbeat():
+                    self.stopped = True
+                    return "Crawl stopped part way through the reviews.", False
+        except data_collection.APIError as e:
+            telemetry.increment("apps_total", outcome="reviews_failed")
+            return f"{e}. Skipping.", False
+
+        self.review_cursors.pop(app_id, None)
+        self.queried_apps.set_status(app_id, DONE if page["num_reviews"] > 0 else NO_REVIEWS)
+        if page["num_reviews"] == 0:
+            telemetry.increment("apps_total", outcome="no_reviews")
+            return "No reviews. Skipping.", False
+        if not resumed:
+            self.review_sync[app_id] = self.review_sync_changes[app_id] = sync_state
+
+        self._add_game(app_id, details, query_summary)
+        telemetry.increment("apps_total", outcome="written")
+        return f"App data written. Total apps: {self.num_games}. Reviews for app: {num_app_reviews}.", True
+
+    @staticmethod
+    def near_duplicate_index():
+        """
+        :return: A new NearDuplicateIndex for the reviews of one app, or None if config.REVIEW_NEAR_DUPLICATE_FILTER is
+        off. Each app gets its own index, so a review written about several games is kept for each of them and the
+        reviews kept do not depend on the order the apps are crawled in.
+        """
+        return NearDuplicateIndex() if config.REVIEW_NEAR_DUPLICATE_FILTER else None
+
+    @staticmethod
+    def filter_reviews(reviews: list, seen_ids: SeenIds, near_duplicates: NearDuplicateIndex=None):
+        """
+        Drop the reviews of an app already seen (same recommendationid) and the near duplicates of its recent reviews.
+        :param reviews: Reviews returned by the appreviews endpoint
+        :param seen_ids: Recent review ids of the app. The ids of the reviews are added to it.
+        :param near_duplicates: Index returned by near_duplicate_index for the app, or None
+        :return: The reviews to save, in order
+        """
+        unique = seen_ids.filter(reviews)
+        kept = unique if near_duplicates is None else near_duplicates.filter(unique)
+        if len(unique) < len(reviews):
+            telemetry.increment("reviews_dropped_total", len(reviews) - len(unique), reason="duplicate")
+        if len(kept) < len(unique):
+            telemetry.increment("reviews_dropped_total", len(unique) - len(kept), reason="near_duplicate")
+        return kept
+
+    def _add_game(self, app_id, details, query_summary):
+        new_rows = self.new_rows
+        # price_cents is the final price in cents as the API returns it, 0 for free apps and -1 if the app has none
+        try:
+            if not details["is_free"]:
+                price_currency = details["price_overview"]["currency"]
+                price = details["price_overview"]["final_formatted"]
+                price_cents = int(details["price_overview"]["final"])
+            else:
+                price_currency = ""
+                price = ""
+                price_cents = 0
+        except KeyError:
+            price_currency = ""
+            price = ""
+            price_cents = -1
+        currency_id = self.dimensions["currencies"].get_id(price_currency) if price_currency else -1
+
+        try:
+            genres = [genre["description"] for genre in details["genres"]]
+            new_rows["app_genres"] += [[app_id, genre_id]
+                                       for genre_id in self.dimensions["genres"].get_ids(genres)]
+        except KeyError:
+            genres = ""
+
+        try:
+            categories = [category["description"] for category in details["categories"]]
+            new_rows["app_categories"] += [[app_id, category_id]
+                                           for category_id in self.dimensions["categories"].get_ids(categories)]
+        except KeyError:
+            categories = ""
+
+        try:
+            platforms = []
+            for key, value in details["platforms"].items():
+                if value:
+                    platforms.append(key)
+            new_rows["app_platforms"] += [[app_id, platform_id]
+                                          for platform_id in self.dimensions["platforms"].get_ids(platforms)]
+        except KeyError:
+            platforms = ""
+
+        # Every listed developer and publisher is linked to the app. The games table keeps the first of each.
+        developer_ids = self.dimensions["developers"].get_ids(details.get("developers") or [])
+        new_rows["app_developers"] += [[app_id, developer_id] for developer_id in developer_ids]
+        developer_idx = developer_ids[0] if developer_ids else -1
+
+        publisher_ids = self.dimensions["publishers"].get_ids(details.get("publishers") or [])
+        new_rows["app_publishers"] += [[app_id, publisher_id] for publisher_id in publisher_ids]
+        publisher_idx = publisher_ids[0] if publisher_ids else -1
+
+        new_rows["games"].append([
+            app_id,
+            details["name"],
+            details["type"],
+            details["detailed_description"],
+            query_summary.get("total_reviews", query_summary["num_reviews"]),
+            query_summary["total_positive"],
+            query_summary["total_negative"],
+            price_currency,
+            price,
+            genres,
+            categories,
+            platforms,
+            developer_idx,
+            publisher_idx,
+            price_cents,
+            self.dimensions["app_types"].get_id(details["type"]),
+            currency_id
+        ])
+        self.num_games += 1
+
+        # Save images and videos. The description is scanned once for both.
+        all_images, all_trailers = asset_extraction.extract_assets(details)
+        new_rows["images"] += [[
+            primary_key,
+            app_id,
+            image_type,
+            image_link
+        ] for primary_key, (image_type, image_link) in enumerate(all_images, self.next_image_id)]
+        self.next_image_id += len(all_images)
+
+        new_rows["trailers"] += [[
+            primary_key,
+            app_id,
+            video_url
+        ] for primary_key, video_url in enumerate(all_trailers, self.next_trailer_id)]
+        self.next_trailer_id += len(all_trailers)
+
+    def sync_reviews(self, app_ids=None, fetcher=None, save_every: int=100):
+        """
+        Delta sync of apps crawled before: only reviews newer than the last sync are fetched, and apps whose review
+        totals have not changed cost a single request. See crawler.sync_apps.
+        :param app_ids: Apps to sync. Default every app with status DONE.
+        :param fetcher: crawler.RateLimitedFetcher
+        :param save_every: Number of synced apps between checkpoints
+        :return: (number of apps synced, number of new reviews)
+        """
+        if app_ids is None:
+            app_ids = [int(app_id) for app_id in np.flatnonzero(self.queried_apps.statuses == DONE)]
+        num_synced = 0
+        num_new_reviews = 0
+        for app_id, result in crawler.sync_apps(app_ids, self.review_sync, fetcher):
+            if isinstance(result, Exception):
+                print(f"{result}. Skipping.")
+                continue
+            new_reviews, sync_state = result
+            new_reviews = self.filter_reviews(new_reviews, SeenIds(capacity=max(len(new_reviews), 1)),
+                                             self.near_duplicate_index())
+            self.new_rows["reviews"] += data_collection.build_review_rows(app_id, new_reviews, self.next_review_id)
+            self.next_review_id += len(new_reviews)
+            self.review_sync[app_id] = self.review_sync_changes[app_id] = sync_state
+            num_synced += 1
+            num_new_reviews += len(new_reviews)
+            telemetry.increment("apps_total", outcome="synced")
+            telemetry.increment("reviews_total", len(new_reviews))
+            if new_reviews:
+                print(f"Apps synced: {num_synced}/{len(app_ids)}. New reviews for app {app_id}: {len(new_reviews)}.")
+            if num_synced % save_every == 0:
+                self.save()
+        self.save()
+        return num_synced, num_new_reviews
@@ -0,0 +1,367 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import requests
+import queue
+import random
+import threading
+import time
+import warnings
+import config
+import data_collection
+import steam_client
+import telemetry
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket. Every request takes one token and tokens are refilled at a constant rate, so a shared
+    bucket keeps all workers together at the endpoint's rate limit.
+    """
+
+    def __init__(self, rate: float, capacity: float=None):
+        """
+        :param rate: Number of tokens added per second.
+        :param capacity: Maximum number of tokens the bucket can hold (the allowed burst). Default max(1, rate).
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_limit(cls, num_requests: int, period: float, burst: float=None):
+        """
+        Create a bucket from a limit of the form "num_requests every period seconds".
+        :param num_requests: Number of requests allowed per period
+        :param period: Length of the period in seconds
+        :param burst: Bucket capacity. Default is a tenth of num_requests.
+        """
+        if burst is None:
+            burst = max(1.0, num_requests / 10)
+        return cls(num_requests / period, burst)
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """
+        Take a single token, sleeping until one is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def pause(self, seconds: float):
+        """
+        Stop handing out tokens for the given number of seconds and empty the bucket. Used when the server answers
+        with a 429 so that every worker backs off, not only the one that got the response.
+        :param seconds: Number of seconds to block for
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0
+            self._last_refill = self._blocked_until
+
+
+def parse_retry_after(value):
+    """
+    Parse the value of a Retry-After header.
+    :param value: Header value. Either a number of seconds or an HTTP date.
+    :return: Number of seconds to wait, or None if the value is missing or cannot be parsed.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimitedFetcher:
+    """
+    Makes GET requests through one token bucket per endpoint. Requests answered with 429 or a 5xx status, and requests
+    that fail at the connection level, are retried with exponential backoff and full jitter. A Retry-After header
+    takes precedence over the computed backoff.
+    """
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, rate_limits: dict=None, max_retries: int=None, backoff_base: float=None,
+                 backoff_cap: float=None, timeout=None):
+        """
+        :param rate_limits: Dictionary mapping endpoint name to (num_requests, period). Default
+        config.CRAWLER_RATE_LIMITS.
+        :param max_retries: Number of retries before the last response is returned. Default
+        config.CRAWLER_MAX_RETRIES.
+        :param backoff_base: Backoff in seconds before the first retry. Default config.CRAWLER_BACKOFF_BASE.
+        :param backoff_cap: Upper bound of the backoff in seconds. Default config.CRAWLER_BACKOFF_CAP.
+        :param timeout: Timeout passed to every request. Default config.HTTP_TIMEOUT.
+        """
+        if rate_limits is None:
+            rate_limits = config.CRAWLER_RATE_LIMITS
+        self.limiters = {endpoint: TokenBucket.from_limit(*limit) for endpoint, limit in rate_limits.items()}
+        self.max_retries = config.CRAWLER_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = config.CRAWLER_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_cap = config.CRAWLER_BACKOFF_CAP if backoff_cap is None else backoff_cap
+        self.timeout = timeout
+
+        self.num_requests = 0
+        self.num_rate_limited = 0
+        self.num_retries = 0
+        self._stats_lock = threading.Lock()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _count(self, requests_made=0, rate_limited=0, retries=0):
+        with self._stats_lock:
+            self.num_requests += requests_made
+            self.num_rate_limited += rate_limited
+            self.num_retries += retries
+
+    def get(self, endpoint: str, url: str, params: dict=None, timeout=None, stream: bool=False):
+        """
+        Make a rate limited GET request.
+        :param endpoint: Name of the endpoint. Selects the token bucket. Endpoints without a bucket are not limited.
+        :param url: URL to request
+        :param params: Query parameters
+        :param timeout: Request timeout. Default is the fetcher's timeout.
+        :param stream: If True, the body of the returned response is not read. See steam_client.get.
+        :return: The requests.Response of the last attempt.
+        """
+        limiter = self.limiters.get(endpoint)
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        while True:
+            if limiter is not None:
+                wait_start = time.perf_counter()
+                limiter.acquire()
+                telemetry.increment("rate_limit_wait_seconds_total", time.perf_counter() - wait_start,
+                                    endpoint=endpoint)
+            request_start = time.perf_counter()
+            try:
+                response = steam_client.get(url, params=params, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                telemetry.increment("request_errors_total", endpoint=endpoint, error=type(e).__name__)
+                if attempt >= self.max_retries:
+                    raise
+                self._count(requests_made=1, retries=1)
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            telemetry.observe_request(endpoint, time.perf_counter() - request_start, response.status_code)
+            self._count(requests_made=1, rate_limited=int(response.status_code == 429))
+            if response.status_code not in self.RETRY_STATUS_CODES or attempt >= self.max_retries:
+                return response
+            response.close()
+
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = self._backoff(attempt)
+            if response.status_code == 429 and limiter is not None:
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            self._count(retries=1)
+            attempt += 1
+
+
+_END_OF_PAGES = object()
+
+
+def _put(q, item, stop):
+    """
+    Put an item on a bounded queue, giving up if the crawl is stopped while waiting.
+    :return: False if the crawl was stopped.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fetch_app(app_id, fetcher, resume_state, ready, max_buffered_pages, stop):
+    """
+    Worker body. Puts (app_id, details, page_queue) on the ready queue as soon as the details are known, then streams
+    review pages into page_queue. The queue is bounded, so a worker that gets ahead of the consumer blocks instead of
+    buffering the app's whole review history.
+    """
+    if stop.is_set():
+        return
+
+    try:
+        details, _ = data_collection.get_app_details(app_id, num_api_calls=0, fetcher=fetcher)
+    except Exception as e:  # Anything raised here would otherwise leave the consumer waiting forever
+        warnings.warn(f"Giving up on app {app_id} for this run: {e}")
+        details = False
+
+    if not details:
+        ready.put((app_id, details, None))
+        return
+
+    page_queue = queue.Queue(maxsize=max_buffered_pages)
+    ready.put((app_id, details, page_queue))
+    try:
+        for page in data_collection.iter_app_review_pages(app_id, resume_state, fetcher=fetcher):
+            if not _put(page_queue, page, stop):
+                return
+    except Exception as e:
+        _put(page_queue, data_collection.APIError(f"Giving up on reviews of app {app_id} for this run: {e}"), stop)
+        return
+    _put(page_queue, _END_OF_PAGES, stop)
+
+
+def _iter_page_queue(page_queue):
+    while True:
+        page = page_queue.get()
+        if page is _END_OF_PAGES:
+            return
+        if isinstance(page, Exception):
+            raise page
+        yield page
+
+
+def crawl_apps(app_ids, fetcher: RateLimitedFetcher=None, num_workers: int=None, review_cursors: dict=None,
+               max_buffered_pages: int=2):
+    """
+    Fetch details and reviews for many apps with a bounded pool of worker threads. At most 2 * num_workers apps are
+    in flight at a time, so app_ids can be a lazy iterable. Results are yielded in completion order to the calling
+    thread, which means the caller can update its tables without any locking.
+    :param app_ids: Iterable of Steam app ids
+    :param fetcher: RateLimitedFetcher shared by all workers. Default is a new fetcher with the config settings.
+    :param num_workers: Number of worker threads. Default config.CRAWLER_NUM_WORKERS.
+    :param review_cursors: Optional dictionary mapping app id to a review page to resume from. See
+    data_collection.iter_app_review_pages.
+    :param max_buffered_pages: Maximum number of review pages each worker fetches ahead of the consumer.
+    :return: Generator of (app_id, details, review_pages) tuples. details follows the conventions of
+    data_collection.get_app_details, except that it is also False if the requests still failed after all retries.
+    review_pages is None if the app has no details, else an iterator of the pages yielded by
+    data_collection.iter_app_review_pages, which raises data_collection.APIError if the reviews could not be fetched.
+    review_pages should be consumed before asking for the next app. Unconsumed pages are fetched and discarded.
+    """
+    if fetcher is None:
+        fetcher = RateLimitedFetcher()
+    if num_workers is None:
+        num_workers = config.CRAWLER_NUM_WORKERS
+    if review_cursors is None:
+        review_cursors = {}
+
+    app_ids = iter(app_ids)
+    ready = queue.Queue()
+    stop = threading.Event()
+    num_submitted = 0
+    num_yielded = 0
+    exhausted = False
+    executor = ThreadPoolExecutor(max_workers=num_workers)
+    try:
+        while True:
+            # Keep the pool topped up
+            while not exhausted and num_submitted - num_yielded < 2 * num_workers:
+                try:
+                    app_id = next(app_ids)
+                except StopIteration:
+                    exhausted = True
+                    break
+                executor.submit(_fetch_app, app_id, fetcher, review_cursors.get(app_id), ready, max_buffered_pages,
+                                stop)
+                num_submitted += 1
+
+            if num_yielded == num_submitted:
+                return
+
+            app_id, details, page_queue = ready.get()
+            num_yielded += 1
+            if page_queue is None:
+                yield app_id, details, None
+                continue
+
+            review_pages = _iter_page_queue(page_queue)
+            yield app_id, details, review_pages
+
+            # Drain whatever the caller did not consume so the worker can finish
+            try:
+                for _ in review_pages:
+                    pass
+            except data_collection.APIError:
+                pass
+    finally:
+        # Release blocked workers and drop apps that have not started if the caller stops early
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _sync_app(app_id, sync_state, fetcher):
+    """
+    Worker body of sync_apps. Errors are returned rather than raised, so one app cannot stop the sync.
+    """
+    try:
+        return app_id, data_collection.get_new_app_reviews(app_id, sync_state, fetcher=fetcher)
+    except Exception as e:
+        return app_id, data_collection.APIError(f"Giving up on syncing reviews of app {app_id} for this run: {e}")
+
+
+def sync_apps(app_ids, review_sync: dict, fetcher: RateLimitedFetcher=None, num_workers: int=None):
+    """
+    Delta sync the reviews of apps that were crawled before, with a bounded pool of worker threads. At most
+    2 * num_workers apps are in flight at a time. See data_collection.get_new_app_reviews.
+    :param app_ids: Iterable of Steam app ids
+    :param review_sync: Dictionary mapping app id to its saved review sync state. Apps without one are only
+    given a state.
+    :param fetcher: RateLimitedFetcher shared by all workers. Default is a new fetcher with the config settings.
+    :param num_workers: Number of worker threads. Default config.CRAWLER_NUM_WORKERS.
+    :return: Generator of (app_id, result) in completion order. result is (new reviews, new sync state), or a
+    data_collection.APIError if the app could not be synced.
+    """
+    if fetcher is None:
+        fetcher = RateLimitedFetcher()
+    if num_workers is None:
+        num_workers = config.CRAWLER_NUM_WORKERS
+
+    app_ids = iter(app_ids)
+    pending = set()
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        try:
+            while True:
+                while not exhausted and len(pending) < 2 * num_workers:
+                    try:
+                        app_id = next(app_ids)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(executor.submit(_sync_app, app_id, review_sync.get(app_id), fetcher))
+
+                if not pending:
+                    return
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -1,19 +1,24 @@
-from asyncio import timeout
 from datetime import datetime
 from json import JSONDecodeError
 from pathlib import Path
 from urllib.parse import quote
 
-import pandas as pd
-import requests
 import json
+import app_name_index
+import asset_extraction
 import config
-import re
+import json_stream
+import response_cache
+import steam_client
+import telemetry
 import os
 import numpy as np
 import time
 import warnings
-import pickle
+
+
+# (app list, its length, AppNameIndex) of the last list passed to get_steam_app_id
+_app_name_index = None
 
 
 def raise_api_warning(function_name: str, status_code, reason):
@@ -29,46 +34,113 @@ def raise_api_warning(function_name: str, status_code, reason):
           f"API error reason: {reason}")
 
 
-def get_all_app_ids_and_names(print_endpoint: bool=False,
-                              overwrite_existing_file=False):
+def _get(endpoint: str, url: str, params: dict=None, timeout=None, fetcher=None, stream: bool=False,
+         use_cache: bool=True):
+    """
+    Make a GET request, through the fetcher if one is given. Responses of the endpoints cached by response_cache are
+    served from the cache when a fresh entry exists, and stored in it otherwise.
+    :param endpoint: Name of the endpoint ('appdetails', 'appreviews', ...). Used by the fetcher for rate limiting.
+    :param url: URL to request
+    :param params: Query parameters
+    :param timeout: Timeout in seconds. Default config.HTTP_TIMEOUT.
+    :param fetcher: Optional object with a get(endpoint, url, params, timeout, stream) method, e.g. a
+    crawler.RateLimitedFetcher. If None, the request goes straight through the shared steam_client session.
+    :param stream: If True, the body is not read. Read it with steam_client.iter_content. Ignored for cached
+    endpoints, whose bodies are read whole to be stored.
+    :param use_cache: If False, the response cache is bypassed: the request always goes to the network and the
+    response is not stored. For responses that have to be current, such as the first page of reviews.
+    :return: requests.Response
     """
-    Get a list of every app id and name. Write to file designated in config.STEAM_APP_JSON_DATA.
+    cache = response_cache.get_cache() if use_cache else None
+    if cache is not None and cache.is_cached_endpoint(endpoint):
+        response = cache.get(endpoint, url, params)
+        if response is not None:
+            telemetry.increment("cache_hits_total", endpoint=endpoint)
+            return response
+        stream = False
+
+    if fetcher is None:
+        request_start = time.perf_counter()
+        response = steam_client.get(url, params=params, timeout=timeout, stream=stream)
+        telemetry.observe_request(endpoint, time.perf_counter() - request_start, response.status_code)
+    else:
+        response = fetcher.get(endpoint, url, params=params, timeout=timeout, stream=stream)
+
+    if cache is not None and not stream:
+        cache.put(endpoint, url, response, params)
+    return response
+
+
+def iter_all_app_ids_and_names(print_endpoint: bool=False, overwrite_existing_file=False):
+    """
+    Iterate over every app id and name, yielding each app as soon as it is decoded. Neither the cached file nor the
+    API response is loaded whole. A response from the API is written to <config.STEAM_APP_JSON_DATA> as it is
+    parsed, and the file only replaces the existing one once the whole list has been read.
     :param print_endpoint: If true, print full endpoint to console. Default False.
-    :param overwrite_existing_file: If True and <config.STEAM_APP_JSON_DATA> exists, overwrite that file. Default False.
-    :return: A list of dictionaries containing every app id and corresponding app name. The dictionaries have two
-    keys: 'appid' and 'name'.
+    :param overwrite_existing_file: If True and <config.STEAM_APP_JSON_DATA> exists, request the list again (the
+    server answers 304 if it has not changed). Default False.
+    :return: Generator of dictionaries with the keys 'appid' and 'name'.
     """
     # Create data directory if it doesn't exist
     Path(config.DATA_DIRECTORY).mkdir(exist_ok=True)
 
     # If data file already exists and we are not overwriting, read file and return contents
     if not overwrite_existing_file and Path(config.STEAM_APP_JSON_DATA).is_file():
-        with open(config.STEAM_APP_JSON_DATA, "r") as f:
-            json_data = json.load(f)
-            print("Returning contents from existing file.")
-            return json_data["apps"]
+        print("Returning contents from existing file.")
+        yield from json_stream.iter_json_array(json_stream.iter_file_chunks(config.STEAM_APP_JSON_DATA), ("apps",))
+        return
 
-    # Make api
+    # Make api call. If the file exists, ask the server to answer 304 when the list has not changed since.
     print("Making API request.")
-    response = requests.get("https://api.steampowered.com/ISteamApps/GetAppList/v2/")
+    response, validators = steam_client.conditional_get(f"{config.STEAM_API_URL}/ISteamApps/GetAppList/v2/",
+                                                        config.STEAM_APP_JSON_DATA, config.STEAM_APP_JSON_METADATA,
+                                                        stream=True)
     if print_endpoint:
         print(response.url)
 
+    # Not modified. The existing file is up to date.
+    if response.status_code == 304:
+        response.close()
+        print("App list not modified. Returning contents from existing file.")
+        yield from json_stream.iter_json_array(json_stream.iter_file_chunks(config.STEAM_APP_JSON_DATA), ("apps",))
+        return
+
     # Check status
     if response.status_code != 200:
+        response.close()
         raise_api_warning("get_all_app_ids_and_names", response.status_code, response.reason)
+        return
+
+    # Write to file while parsing. The file holds the 'applist' object: {"apps": [...]}
+    temp_path = config.STEAM_APP_JSON_DATA + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write('{"apps": [')
+        separator = ""
+        for app in json_stream.iter_json_array(steam_client.iter_content(response), ("applist", "apps")):
+            f.write(separator + json.dumps(app))
+            separator = ", "
+            yield app
+        f.write("]}")
+    os.replace(temp_path, config.STEAM_APP_JSON_DATA)
+    # The validators describe the new file, so they are only saved once it is in place
+    steam_client.save_validators(validators, config.STEAM_APP_JSON_METADATA)
+    print("file written")
 
-    # Write to file
-    if overwrite_existing_file or not Path(config.STEAM_APP_JSON_DATA).is_file():
-            with open(config.STEAM_APP_JSON_DATA, "w") as f:
-                json.dump(response.json()["applist"], f)
-                print("file written")
 
-    # Return resulting list
-    return response.json()["applist"]["apps"]
+def get_all_app_ids_and_names(print_endpoint: bool=False,
+                              overwrite_existing_file=False):
+    """
+    Get a list of every app id and name. Write to file designated in config.STEAM_APP_JSON_DATA. See
+    iter_all_app_ids_and_names for a version that does not build the list.
+    :param print_endpoint: If true, print full endpoint to console. Default False.
+    :param overwrite_existing_file: If True and <config.STEAM_APP_JSON_DATA> exists, overwrite that file. Default False.
+    :return: A list of dictionaries containing every app id and corresponding app name. The dictionaries have two
+    keys: 'appid' and 'name'.
+    """
+    return list(iter_all_app_ids_and_names(print_endpoint, overwrite_existing_file))
 
 
-def get_app_details(appid: str or int, print_endpoint: bool=False, num_api_calls=None):
+def get_app_details(appid: str or int, print_endpoint: bool=False, num_api_calls=0, fetcher=None):
     """
     Get the details about a single app in a dictionary. Dictionary keys returned:
     ['type', 'name', 'steam_appid', 'required_age', 'is_free', 'controller_support', 'dlc', 'detailed_description',
@@ -80,12 +152,14 @@ def get_app_details(appid: str or int, print_endpoint: bool=False, num_api_calls
     See https://github.com/Revadike/InternalSteamWebAPI/wiki/Get-App-Details for more information.
     :param appid: A single Steam AppID as an integer or a string
     :param print_endpoint: if True, print the API endpoint used in the request
+    :param num_api_calls: Running count of API calls. Incremented and returned.
+    :param fetcher: Optional crawler.RateLimitedFetcher used to make the request
     :return: App details in JSON format. Returns none if no details or false if api call fails. Second return is
     num_api_calls.
     """
     # Set parameters, make api call, and optionally print the endpoing
     parameters = {"appids": appid}
-    response = requests.get("https://store.steampowered.com/api/appdetails", params=parameters)
+    response = _get("appdetails", f"{config.STEAM_STORE_URL}/api/appdetails", params=parameters, fetcher=fetcher)
     num_api_calls += 1
     if print_endpoint:
         print(response.url)
@@ -110,12 +184,126 @@ def get_app_details(appid: str or int, print_endpoint: bool=False, num_api_calls
         return None, num_api_calls
 
 
+class APIError(RuntimeError):
+    """
+    Raised by the generator APIs when a Steam API call fails. Generators cannot return False half way through.
+    """
+
+
+def _iter_review_events(appid, resume_state, print_endpoint, fetcher, use_cache):
+    """
+    Request review pages one after another and parse each response body as it is downloaded. The first page
+    (cursor '*') is never taken from the response cache, since it changes with every new review.
+    :return: Generator of ('review', review) for each review as soon as it is decoded and ('page', state) at the end
+    of each page, where state has the keys 'query_summary', 'cursor' and 'num_reviews'.
+    """
+    if resume_state is not None:
+        cursor = resume_state["cursor"]
+        query_summary = resume_state["query_summary"]
+        num_reviews = resume_state["num_reviews"]
+    else:
+        cursor = "*"
+        query_summary = None
+        num_reviews = 0
+
+    while True:
+        # Get the response and optionally print the full API endpoint
+        response = _get("appreviews", f"{config.STEAM_STORE_URL}/appreviews/{appid}?json=1&num_per_page=100&cursor="
+                                      f"{quote(cursor)}&filter=recent&purchase_type=all", fetcher=fetcher,
+                        stream=True, use_cache=use_cache and cursor != "*")
+        if print_endpoint:
+            print(response.url)
+
+        # Check status code. Raise error if status code is not 200
+        if response.status_code != 200:
+            response.close()
+            raise APIError(f"Failed API Call in 'iter_app_review_pages'. API response code: {response.status_code}. "
+                           f"API error reason: {response.reason}")
+
+        # Stream the reviews out of the body. The query summary comes before them and the cursor after.
+        page_summary = {}
+        next_cursor = cursor
+        for path, value in json_stream.iter_json_members(steam_client.iter_content(response), ("reviews",)):
+            if path == ("reviews", "item"):
+                num_reviews += 1
+                yield "review", value
+            elif path == ("query_summary",):
+                page_summary = value
+            elif path == ("cursor",):
+                next_cursor = value
+
+        if query_summary is None:
+            query_summary = page_summary
+
+        yield "page", {
+            "query_summary": query_summary,
+            "cursor": next_cursor,
+            "num_reviews": num_reviews
+        }
+
+        # Stop on the last page. A repeated cursor also means there are no more pages.
+        if (num_reviews >= query_summary["total_reviews"] or page_summary.get("num_reviews", 0) == 0
+                or next_cursor == cursor):
+            return
+        cursor = next_cursor
+
+
+def iter_app_review_pages(appid: str or int, resume_state: dict=None, print_endpoint: bool=False, fetcher=None,
+                          use_cache: bool=True):
+    """
+    Iterate over the review pages of a single app, one request per page of up to 100 reviews. Only the current page
+    is held in memory.
+    See https://github.com/Revadike/InternalSteamWebAPI/wiki/Get-App-Reviews
+    :param appid: A single Steam AppID as an integer or a string
+    :param resume_state: Resume from a page previously yielded by this function. Only the keys 'cursor',
+    'query_summary' and 'num_reviews' are used, so the page can be persisted without its reviews. Default None,
+    which starts at the first page.
+    :param print_endpoint: if True, print the API endpoint used in each request
+    :param fetcher: Optional crawler.RateLimitedFetcher used to make the requests
+    :param use_cache: If False, no page is taken from the response cache. The first page never is.
+    :return: Generator of dictionaries with the following structure: {
+        query_summary: dict. Summary returned with the first page.
+        reviews: list. Reviews of this page.
+        cursor: str. Cursor of the next page.
+        num_reviews: int. Number of reviews yielded so far, including this page.
+    }
+    Raises APIError if an API call fails. The last yielded page can be used to resume.
+    """
+    reviews = []
+    for event, value in _iter_review_events(appid, resume_state, print_endpoint, fetcher, use_cache):
+        if event == "review":
+            reviews.append(value)
+        else:
+            value["reviews"] = reviews
+            yield value
+            reviews = []
+
+
+def iter_app_reviews(appid: str or int, resume_state: dict=None, print_endpoint: bool=False, fetcher=None,
+                     use_cache: bool=True):
+    """
+    Iterate over the reviews of a single app, yielding each review as soon as it is decoded from the response.
+    Nothing but the review being decoded is held in memory. Use iter_app_review_pages when the crawl has to be
+    resumable, since a failure part way through a page cannot be resumed from here.
+    :param appid: A single Steam AppID as an integer or a string
+    :param resume_state: See iter_app_review_pages
+    :param print_endpoint: if True, print the API endpoint used in each request
+    :param fetcher: Optional crawler.RateLimitedFetcher used to make the requests
+    :param use_cache: See iter_app_review_pages
+    :return: Generator of review dictionaries. Raises APIError if an API call fails.
+    """
+    for event, value in _iter_review_events(appid, resume_state, print_endpoint, fetcher, use_cache):
+        if event == "review":
+            yield value
+
+
 def get_app_reviews(appid: str or int, print_endpoint: bool=False, cursor="*", aggregate_app_review_data=None,
-                    report_threshold=1000):
+                    report_threshold=1000, fetcher=None):
     """
-    Get the reviews for a single app.
+    Get all the reviews for a single app. For apps with many reviews prefer iter_app_review_pages, which does not
+    keep every review in memory.
     See https://github.com/Revadike/InternalSteamWebAPI/wiki/Get-App-Reviews
-    :param report_threshold: Do not use
+    :param report_threshold: Number of reviews after which progress is first printed
     :param appid: A single Steam AppID as an integer or a string
     :param print_endpoint: if True, print the API endpoint used in the request
     :param cursor: Cursor returned by previous calls
@@ -123,6 +311,7 @@ def get_app_reviews(appid: str or int, print_endpoint: bool=False, cursor="*", a
         query_summary: dict
         reviews: list
     }
+    :param fetcher: Optional crawler.RateLimitedFetcher used to make the requests
     :return: App details in JSON format. Returns False if API call fails
     """
     # Allocate memory
@@ -134,55 +323,135 @@ def get_app_reviews(appid: str or int, print_endpoint: bool=False, cursor="*", a
             "reviews": []
         }
 
-    # Get the response and optionally print the full API endpoint
-    cur = quote(cursor)
-    response = requests.get(f"https://store.steampowered.com/appreviews/{appid}?json=1&num_per_page=100&cursor="
-                            f"{cur}&filter=recent&purchase_type=all", timeout=10)
-    if print_endpoint:
-        print(response.url)
+    resume_state = None
+    if cursor != "*":
+        resume_state = {
+            "cursor": cursor,
+            "query_summary": app_review_data["query_summary"],
+            "num_reviews": len(app_review_data["reviews"])
+        }
 
-    # Check status code. Raise error if status code is not 200
-    if response.status_code != 200:
-        raise_api_warning("get_app_reviews", response.status_code, response.reason)
+    try:
+        for page in iter_app_review_pages(appid, resume_state, print_endpoint, fetcher):
+            app_review_data["query_summary"] = page["query_summary"]
+            app_review_data["reviews"].extend(page["reviews"])
+
+            num_reviews = page["num_reviews"]
+            total_reviews = page["query_summary"]["total_reviews"]
+            if num_reviews > report_threshold and num_reviews < total_reviews:
+                print(f"App {appid} review progress:", f"{np.round(100 * num_reviews / total_reviews, 2)}%")
+                report_threshold += 1000
+    except APIError as e:
+        warnings.warn(str(e))
         return False
 
-    json_data = response.json()
+    return app_review_data
 
-    if cursor == "*":
-        app_review_data["query_summary"] = json_data["query_summary"]
 
-    # Get important parts of the json
-    reviews = json_data["reviews"]
-    cursor = json_data["cursor"]
+def _review_key(review: dict):
+    # Reviews are ordered by creation time. The recommendation id breaks ties.
+    return int(review["timestamp_created"]), int(review["recommendationid"])
 
-    # save to dictionary
-    app_review_data["reviews"] = app_review_data["reviews"] + reviews
-    num_reviews = len(app_review_data["reviews"])
-    total_reviews = app_review_data["query_summary"]["total_reviews"]
 
-    if num_reviews < total_reviews and json_data["query_summary"]["num_reviews"] != 0:
-        if num_reviews > report_threshold:
-            print(f"App {appid} review progress:", f"{np.round(100 * num_reviews / total_reviews, 2)}%")
-            report_threshold += 1000
-        return get_app_reviews(appid, False, cursor, app_review_data, report_threshold)
-    else:
-        return app_review_data
+def update_review_sync_state(sync_state: dict, query_summary: dict, reviews: list):
+    """
+    Fold a page of reviews into the review sync state of an app.
+    :param sync_state: State returned by a previous call, or None
+    :param query_summary: Query summary of the first review page. Its totals replace those of the state.
+    :param reviews: Reviews of the page
+    :return: New state with the keys of checkpoint_store.REVIEW_SYNC_COLUMNS
+    """
+    state = {"newest_timestamp": -1, "newest_review_id": -1, "total_reviews": 0, "total_positive": 0,
+             "total_negative": 0} if sync_state is None else dict(sync_state)
+    newest = (state["newest_timestamp"], state["newest_review_id"])
+    for review in reviews:
+        newest = max(newest, _review_key(review))
+    state["newest_timestamp"], state["newest_review_id"] = newest
+    if "total_reviews" in query_summary:
+        state["total_reviews"] = query_summary["total_reviews"]
+        state["total_positive"] = query_summary.get("total_positive", 0)
+        state["total_negative"] = query_summary.get("total_negative", 0)
+    state["synced_at"] = int(time.time())
+    return state
+
+
+def get_new_app_reviews(appid: str or int, sync_state: dict=None, print_endpoint: bool=False, fetcher=None):
+    """
+    Delta sync of the reviews of an app that was crawled before. Review pages (newest first) are requested only until
+    a review that was already seen comes up. If the review totals and the newest review have not changed, only the
+    first page is requested. If there is no sync state yet (apps crawled before sync states were recorded), the first
+    page only sets the state and no reviews are returned, since the reviews already saved cannot be told apart.
+    :param appid: A single Steam AppID as an integer or a string
+    :param sync_state: State saved by the previous sync or crawl of the app, see update_review_sync_state
+    :param print_endpoint: if True, print the API endpoint used in each request
+    :param fetcher: Optional crawler.RateLimitedFetcher used to make the requests
+    :return: (list of reviews newer than the state, new state). Raises APIError if an API call fails. Pages are
+    never taken from the response cache, which would hide the new reviews.
+    """
+    newest = None if sync_state is None else (sync_state["newest_timestamp"], sync_state["newest_review_id"])
+    new_reviews = []
+    state = None
+    for page in iter_app_review_pages(appid, print_endpoint=print_endpoint, fetcher=fetcher, use_cache=False):
+        page_reviews = page["reviews"]
+        if state is None:
+            state = update_review_sync_state(sync_state, page["query_summary"], page_reviews)
+            if sync_state is None:
+                return [], state
+            unchanged = all(state[key] == sync_state[key]
+                            for key in ("total_reviews", "total_positive", "total_negative", "newest_timestamp",
+                                        "newest_review_id"))
+            if unchanged:
+                return [], state
+        else:
+            state = update_review_sync_state(state, page["query_summary"], page_reviews)
+
+        fresh = [review for review in page_reviews if _review_key(review) > newest]
+        new_reviews += fresh
+        if len(fresh) < len(page_reviews):
+            break
+    if state is None:  # No pages at all
+        state = update_review_sync_state(sync_state, {}, [])
+    return new_reviews, state
+
+
+def build_review_rows(app_id: int, reviews: list, first_review_id: int):
+    """
+    :param app_id: Steam app id of the reviews
+    :param reviews: Reviews returned by the appreviews endpoint
+    :param first_review_id: Primary key of the first row
+    :return: List of [review_id, steam_app_id, playtime_at_review, review] rows for the reviews table. Reviews
+    without a playtime get NaN.
+    """
+    return [[
+        review_id,
+        app_id,
+        review.get("author", {}).get("playtime_at_review", np.nan),
+        review["review"]
+    ] for review_id, review in enumerate(reviews, first_review_id)]
+
 
-def get_steam_app_id(app_name, steam_apps):
+def get_steam_app_id(app_name, steam_apps=None):
     """
-    Get a Steam app ID from a Steam app name
+    Get a Steam app ID from a Steam app name. The lookup is case-insensitive and goes through an
+    app_name_index.AppNameIndex, so it is O(1) once the index is built.
     :param app_name: The name of the app
-    :param steam_apps: A list of steam apps. Most likely this was generated by the function 'get_all_app_ids_and_names'.
+    :param steam_apps: A list of steam apps, most likely generated by the function 'get_all_app_ids_and_names', or
+    an app_name_index.AppNameIndex. The index of a list is built on the first call and reused while the same list is
+    passed. Default None, which uses the persisted index of <config.STEAM_APP_JSON_DATA>.
     :return: The corresponding Steam app ID as an integer.
     """
-    app_id = None
-    for app in steam_apps:
-        if app["name"].lower() != app_name.lower():
-            continue
-        else:
-            app_id = app["appid"]
-            break
+    global _app_name_index
+    if steam_apps is None:
+        index = app_name_index.get_index()
+    elif isinstance(steam_apps, app_name_index.AppNameIndex):
+        index = steam_apps
+    else:
+        if _app_name_index is None or _app_name_index[0] is not steam_apps or \
+                _app_name_index[1] != len(steam_apps):
+            _app_name_index = (steam_apps, len(steam_apps), app_name_index.AppNameIndex.from_apps(steam_apps))
+        index = _app_name_index[2]
 
+    app_id = index.lookup(app_name)
     if app_id is not None:
         return app_id
 
@@ -190,124 +459,65 @@ def get_steam_app_id(app_name, steam_apps):
                        "try again.")
 
 
-
 def extract_image_links(text_data):
     """
-    Extract image links from the provided text data and save return them in list format.
+    Extract image links from the provided text data and save return them in list format. See
+    asset_extraction.extract_image_links.
     Parameters:
     - detail_data (str): Data from the get_app_details function
     """
-    if not isinstance(text_data, dict):
-        return None
-
-    try:
-        header_image = [["header", text_data["header_image"]]]
-    except KeyError:
-        header_image = []
-
-    try:
-        capsule_image = [["capsule", text_data["capsule_image"]]]
-    except KeyError:
-        capsule_image = []
-
-    try:
-        description_text = text_data["detailed_description"]
-        # Regex pattern for matching image URLs
-        image_pattern = r'https?://[^\s]+(?:\.jpg|\.jpeg|\.png|\.gif|\.bmp|\.tiff|\.webp|\.svg)'
-        image_links = re.findall(image_pattern, description_text, re.IGNORECASE)
-        description_images = [["description", image] for image in list(set(image_links))]
-    except KeyError:
-        description_images = []
-
-    # Get screenshots
-    try:
-        screenshots = [["screenshot", screenshot["path_full"]] for screenshot in text_data["screenshots"]]
-    except KeyError:
-        screenshots = []
-
-    # Combine and return all images
-    all_images = header_image + capsule_image + description_images + screenshots
-    return all_images
+    return asset_extraction.extract_image_links(text_data)
 
 
 def extract_video_links(text_data):
     """
-    Extract video links from the provided text data and save return them in list format.
+    Extract video links from the provided text data and save return them in list format. See
+    asset_extraction.extract_video_links.
     Parameters:
     - text_data (str): The data containing potential video links.
     """
-    if not isinstance(text_data, dict):
-        return None
+    return asset_extraction.extract_video_links(text_data)
 
-    try:
-        videos = [movie["mp4"]["max"] for movie in text_data["movies"]]
-        return videos
 
-    except KeyError:
-        return []
-
-
-def save_progress(games_list, reviews_list, images_list, publishers_list, developers_list, trailers_list, queried_apps):
-    games_list_columns = [
-        "steam_app_id",
-        "steam_app_name",
-        "app_type",
-        "description",
-        "total_reviews",
-        "total_positive_reviews",
-        "total_negative_reviews",
-        "price_currency",
-        "price",
-        "genres",
-        "categores",
-        "platforms",
-        "developer_id",
-        "publisher_id"
-    ]
-
-    review_columns = [
-        "review_id",
-        "steam_app_id",
-        "playtime_at_review",
-        "review"
-    ]
-
-    image_columns = [
-        "image_id",
-        "steam_app_id",
-        "image_type",
-        "image_url"
-    ]
-
-    publisher_columns = [
-        "publisher_id",
-        "publisher_name"
-    ]
-
-    developer_columns = [
-        "developer_id",
-        "developer_name"
-    ]
-
-    trailer_columns = [
-        "trailer_id",
-        "steam_app_id",
-        "trailer_url"
-    ]
-
-    pd.DataFrame(games_list, columns=games_list_columns).set_index("steam_app_id").to_csv("data/steam_apps_info.csv")
-    pd.DataFrame(reviews_list, columns=review_columns).set_index("review_id").to_csv("data/steam_apps_reviews.csv")
-    pd.DataFrame(images_list, columns=image_columns).set_index("image_id").to_csv("data/steam_apps_images.csv")
-    pd.DataFrame(publishers_list, columns=publisher_columns).set_index("publisher_id").to_csv(
-        "data/steam_apps_publishers.csv")
-    pd.DataFrame(developers_list, columns=developer_columns).set_index("developer_id").to_csv(
-        "data/steam_apps_developers.csv")
-    pd.DataFrame(trailers_list, columns=trailer_columns).set_index("trailer_id").to_csv("data/steam_apps_trailers.csv")
-
-    with open("data/queried_apps.pkl", "wb") as f:
-        pickle.dump(queried_apps, f)
+def save_progress(store, new_rows: dict, dimensions: dict, queried_apps, review_cursors=None, review_dataset=None,
+                  review_sync: dict=None, queried_apps_path: str=None, progress_path: str="./progress.txt"):
+    """
+    Append the crawl progress to the checkpoint store in one transaction. Only new rows are written.
+    :param store: checkpoint_store.CheckpointStore
+    :param new_rows: Dictionary mapping table name ('games', 'reviews', 'images', 'trailers', 'app_developers', ...) to
+    the rows collected since the last checkpoint. The lists are cleared after saving.
+    :param dimensions: Dictionary mapping table name ('developers', 'publishers', ...) to a
+    dimension_table.DimensionTable. Names added since the last checkpoint are written.
+    :param queried_apps: queried_apps.QueriedAppsIndex. Statuses set since the last checkpoint are written, then the
+    index is saved to <config.QUERIED_APPS_INDEX>.
+    :param review_cursors: Dictionary mapping app id to the last review page consumed, for apps whose reviews were
+    only partly collected.
+    :param review_dataset: Optional review_dataset.ReviewDataset. New reviews are also appended to it, after the
+    checkpoint, so that a crash in between is detected and repaired by ReviewDataset.open.
+    :param review_sync: Optional dictionary mapping app id to the review sync state of apps crawled or synced since
+    the last checkpoint. It is cleared after saving.
+    :param queried_apps_path: Path queried_apps is saved to. Default config.QUERIED_APPS_INDEX.
+    :param progress_path: File the time of the checkpoint is written to, or None
+    """
+    rows = dict(new_rows)
+    for table, dimension in dimensions.items():
+        rows[table] = dimension.rows(store.count(table))
+    with telemetry.timer("checkpoint", "checkpoint_seconds"):
+        store_size = store.size()
+        store.checkpoint(rows, queried_apps.pop_changes(), review_cursors, review_sync)
+        telemetry.increment("bytes_written_total", store.size() - store_size, target="checkpoint_store")
+        queried_apps.save(config.QUERIED_APPS_INDEX if queried_apps_path is None else queried_apps_path)
+        if review_dataset is not None:
+            telemetry.increment("bytes_written_total", review_dataset.append(new_rows.get("reviews", [])),
+                                target="review_dataset")
+
+    for table_rows in new_rows.values():
+        table_rows.clear()
+    if review_sync is not None:
+        review_sync.clear()
 
     print("Data collection progress saved!")
 
-    with open("./progress.txt", "w") as f:
-        f.write(f"Last saved: {str(datetime.now())}. {len(games_list)} apps written.")
+    if progress_path is not None:
+        with open(progress_path, "w") as f:
+            f.write(f"Last saved: {str(datetime.now())}. {store.count('games')} apps written.")
@@ -1,19 +1,85 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from itertools import islice
 from pathlib import Path
-import json
+from pyarrow import csv as pa_csv, feather
+import os
 import config
+import json_stream
+from checkpoint_store import LINK_TABLES, TABLES, get_columns
+from text_cleaning import genre_file_name
 
 
-def create_csv_of_apps(steam_apps: list=None, block_size=1000, overwrite_file=False):
+OUTPUT_FORMATS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather"
+}
+
+
+def build_app_arrow_table(steam_apps, block_size: int=100000):
+    """
+    Build the table of Steam app IDs and names as Arrow columns. The apps are read block_size at a time and each
+    block becomes one typed chunk of the appid and name columns, so no row objects or DataFrame are built. Apps
+    without an id or with an empty name are dropped and, if an app id is listed more than once, the first entry is
+    kept.
+    :param steam_apps: List or iterator of dictionaries with the keys 'appid' and 'name', as returned by
+    data_collection.get_all_app_ids_and_names or data_collection.iter_all_app_ids_and_names
+    :param block_size: Number of apps turned into Arrow arrays at a time. At most this many app dictionaries of an
+    iterator are held at once.
+    :return: pyarrow.Table with the columns 'appid' (int64) and 'name' (string)
+    """
+    steam_apps = iter(steam_apps)
+    app_id_chunks = []
+    name_chunks = []
+    while True:
+        block = list(islice(steam_apps, block_size))
+        if not block:
+            break
+        app_id_chunks.append(pa.array([app.get("appid") for app in block], type=pa.int64()))
+        name_chunks.append(pa.array([app.get("name") for app in block], type=pa.string()))
+    table = pa.table({"appid": pa.chunked_array(app_id_chunks, type=pa.int64()),
+                      "name": pa.chunked_array(name_chunks, type=pa.string())})
+
+    named = pc.fill_null(pc.not_equal(table.column("name"), ""), False)
+    table = table.filter(pc.and_(pc.is_valid(table.column("appid")), named))
+    _, first_rows = np.unique(table.column("appid").to_numpy(), return_index=True)
+    if len(first_rows) < len(table):
+        table = table.take(np.sort(first_rows))
+    return table
+
+
+def build_app_table(steam_apps, block_size: int=100000):
+    """
+    Build the table of Steam app IDs and names. See build_app_arrow_table.
+    :param steam_apps: List or iterator of dictionaries with the keys 'appid' and 'name'
+    :param block_size: See build_app_arrow_table
+    :return: DataFrame indexed by 'appid' with a single 'name' column
+    """
+    return build_app_arrow_table(steam_apps, block_size).to_pandas().set_index("appid")
+
+
+def create_csv_of_apps(steam_apps: list=None, block_size: int=100000, overwrite_file=False, output_format="csv",
+                       output_path=None):
     """
-    Create a CSV file containing all Steam app IDs and names. This function creates multiple small dataframes of size
-    block_size and concatenates them. This greatly speeds up computation.
-    :param steam_apps: List of Steam apps. If this does not exist the file <config.STEAM_APP_JSON_DATA> must exist.
-    :param block_size: The number of entries to write in a single dataframe before starting a new dataframe.
+    Create a file containing all Steam app IDs and names. The table is built as Arrow columns, see
+    build_app_arrow_table, and CSV and Feather files are written straight from them.
+    :param steam_apps: List or iterator of Steam apps. If this does not exist the file <config.STEAM_APP_JSON_DATA>
+    must exist. It is then parsed incrementally rather than loaded whole.
+    :param block_size: Number of apps turned into Arrow arrays at a time. See build_app_arrow_table.
     :param overwrite_file: If true, overwrite the existing file. Default False.
+    :param output_format: One of 'csv', 'parquet' or 'feather'. Default 'csv'.
+    :param output_path: Path of the output file. Default <config.STEAM_APP_CSV_DATA> with the extension of the format.
     """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}'. Use one of {list(OUTPUT_FORMATS)}.")
+    if output_path is None:
+        output_path = str(Path(config.STEAM_APP_CSV_DATA).with_suffix(OUTPUT_FORMATS[output_format]))
+
     # If file already exists, and overwrite_file is False, do nothing
-    if Path(config.STEAM_APP_CSV_DATA).is_file() and not overwrite_file:
+    if Path(output_path).is_file() and not overwrite_file:
         print("File already exists. To overwrite, set 'overwrite_file' to 'True'.")
         return
 
@@ -24,36 +90,137 @@ def create_csv_of_apps(steam_apps: list=None, block_size=1000, overwrite_file=Fa
 
     # Read file or create data directory if necessary
     if steam_apps is None:
-        with open(config.STEAM_APP_JSON_DATA, "r") as f:
-            steam_apps = json.load(f)["apps"]
+        steam_apps = json_stream.iter_json_array(json_stream.iter_file_chunks(config.STEAM_APP_JSON_DATA), ("apps",))
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)  # Create output directory if it doesn't exist.
+
+    print("Creating table for output file")
+    table = build_app_arrow_table(steam_apps, block_size)
+
+    if output_format == "csv":
+        # Every string is quoted. pd.read_csv reads the file the same as one written by DataFrame.to_csv.
+        pa_csv.write_csv(table, output_path)
+    elif output_format == "parquet":
+        # Through pandas, so that appid is stored as the index, as before
+        table.to_pandas().set_index("appid").to_parquet(output_path)
     else:
-        Path(config.DATA_DIRECTORY).mkdir(exist_ok=True)  # Create data directory if it doesn't exist.
-
-    # Memory allocation
-    df_dict = {}
-    num_apps_processed = 0
-    df = pd.DataFrame(columns=["appid", "name"])
-
-    # Create dataframes
-    print("Creating Dataframes for CSV file")
-    for app in steam_apps:
-        num_apps_processed += 1
-        if app["name"] == "":
-            continue
-        df.loc[len(df)] = [app["appid"], app["name"]]
-        if num_apps_processed % block_size == 0:
-            df_dict[num_apps_processed] = df
-            df = pd.DataFrame(columns=["appid", "name"])
-        if num_apps_processed % 10000 == 0:
-            print(f"Progress: {round(100 * num_apps_processed / len(steam_apps), 2)}%")
-
-    # Concatenate dataframes
-    print("Progress: 100%")
-    num_apps_processed += 1
-    df_dict[num_apps_processed] = df
-    all_dfs = df_dict.values()
-    total_df = pd.concat(all_dfs).set_index("appid")
-    total_df.to_csv(config.STEAM_APP_CSV_DATA)
-    print(f"Total records: {len(total_df)}")
+        feather.write_feather(table, output_path)
+    print(f"Total records: {len(table)}")
+
+
+def read_app_links(link_table: str, directory: str=None):
+    """
+    Read a link table exported by CheckpointStore.export_csv (app_genres, app_categories, app_platforms,
+    app_developers or app_publishers) and join it with the names of its dimension table on the integer id, so lists
+    of genres, categories or platforms are never parsed from their repr in steam_apps_info.csv.
+    :param link_table: Name of a table in checkpoint_store.LINK_TABLES
+    :param directory: Directory of the exported CSV files. Default config.DATA_DIRECTORY.
+    :return: DataFrame with the columns 'steam_app_id', the id column and the name column of the dimension, e.g.
+    'genre_id' and 'genre_name', in the order the links were saved
+    """
+    directory = config.DATA_DIRECTORY if directory is None else directory
+    dimension = LINK_TABLES[link_table]
+    id_column, name_column = get_columns(dimension)
+    links = pd.read_csv(os.path.join(directory, TABLES[link_table][0]))
+    names = pd.read_csv(os.path.join(directory, TABLES[dimension][0]), keep_default_na=False)
+    names = pd.Series(names[name_column].to_numpy(), index=names[id_column])
+    links[name_column] = names.reindex(links[id_column]).to_numpy()
+    return links
+
+
+def genre_mask(genre_ids):
+    """
+    :param genre_ids: Iterable of genre ids, each less than 64
+    :return: np.uint64 with bit i set for every genre id i. (genre_masks(...) & genre_mask(ids)) != 0 tests whether
+    each app has any of the genres, and == genre_mask(ids) whether it has all of them.
+    """
+    mask = 0
+    for genre_id in genre_ids:
+        if not 0 <= genre_id < 64:
+            raise ValueError(f"Genre id {genre_id} does not fit in a 64 bit mask.")
+        mask |= 1 << int(genre_id)
+    return np.uint64(mask)
+
+
+def genre_masks(app_genres: pd.DataFrame):
+    """
+    Bitmask of the genres of every app, from the integer genre ids of the app_genres link table.
+    :param app_genres: DataFrame with the columns 'steam_app_id' and 'genre_id', e.g. read_app_links("app_genres")
+    :return: Series of np.uint64 masks indexed by steam_app_id, sorted by app id. Apps without genres are missing.
+    """
+    genre_ids = app_genres["genre_id"].to_numpy(dtype=np.int64)
+    if len(genre_ids) and (genre_ids.min() < 0 or genre_ids.max() >= 64):
+        raise ValueError("Genre ids must be between 0 and 63 to fit in a 64 bit mask.")
+    app_ids = app_genres["steam_app_id"].to_numpy(dtype=np.int64)
+    order = np.argsort(app_ids, kind="stable")
+    app_ids = app_ids[order]
+    bits = np.left_shift(np.uint64(1), genre_ids[order].astype(np.uint64))
+    starts = np.flatnonzero(np.r_[True, app_ids[1:] != app_ids[:-1]]) if len(app_ids) else np.zeros(0, dtype=np.int64)
+    masks = np.bitwise_or.reduceat(bits, starts) if len(starts) else np.zeros(0, dtype=np.uint64)
+    return pd.Series(masks, index=pd.Index(app_ids[starts], name="steam_app_id"))
+
+
+def explode_app_genres(games: pd.DataFrame, genres: list=None, links: pd.DataFrame=None):
+    """
+    Build the app -> genre mapping used to group reviews, one row per (app, genre). Apps with at least as many positive
+    as negative reviews are 'liked', the others 'disliked'.
+    :param games: DataFrame with the columns 'steam_app_id', 'total_positive_reviews', 'total_negative_reviews' and,
+    unless links is given, 'genres' (lists of genre names)
+    :param genres: Optional list of genres to keep, e.g. the most common ones
+    :param links: Optional DataFrame with the columns 'steam_app_id' and 'genre_name', e.g.
+    read_app_links("app_genres"). If given, it is joined with games on the app id instead of exploding the lists.
+    :return: DataFrame with the columns 'steam_app_id', 'genre' and 'group'
+    """
+    liked = games["total_positive_reviews"] >= games["total_negative_reviews"]
+    app_groups = games[["steam_app_id"]].assign(group=liked.map({True: "liked", False: "disliked"}))
+    if links is None:
+        app_genres = app_groups.assign(genre=games["genres"]).explode("genre")
+    else:
+        app_genres = app_groups.merge(links[["steam_app_id", "genre_name"]].rename(columns={"genre_name": "genre"}),
+                                      on="steam_app_id")
+    app_genres = app_genres[["steam_app_id", "genre", "group"]].dropna(subset="genre")
+    if genres is not None:
+        app_genres = app_genres[app_genres["genre"].isin(genres)]
+    return app_genres.reset_index(drop=True)
+
+
+def write_genre_review_files(app_genres: pd.DataFrame, reviews, directory: str=None, min_playtime: float=120):
+    """
+    Write the reviews of every (group, genre) pair to <directory>/<group>-games/<group>-<genre>.csv in one pass over
+    the reviews. Each chunk of reviews is hash-joined with app_genres once and its rows are appended to the file of
+    every genre of their app, instead of filtering the whole review table again for each genre. Rows keep the index
+    and the order of the reviews. Files are written for every pair in app_genres, even if they get no reviews.
+    :param app_genres: DataFrame returned by explode_app_genres
+    :param reviews: DataFrame with the columns 'steam_app_id', 'playtime_at_review' and 'review', or an iterable of
+    such DataFrames, e.g. pd.read_csv(path, chunksize=100000) or review_dataset.ReviewDataset.iter_batches
+    :param directory: Output directory. Default config.GROUPED_TEXT_DIRECTORY.
+    :param min_playtime: Only reviews written after at least this many minutes of play are kept. Default 120.
+    :return: Dictionary mapping (group, genre) to the number of reviews written
+    """
+    directory = config.GROUPED_TEXT_DIRECTORY if directory is None else directory
+    if isinstance(reviews, pd.DataFrame):
+        reviews = [reviews]
+    columns = ["steam_app_id", "playtime_at_review", "review"]
+    app_genres = app_genres[["steam_app_id", "genre", "group"]].drop_duplicates()
 
+    files = {}
+    counts = {}
+    try:
+        # Every partition gets its file and header up front
+        for group, genre in app_genres[["group", "genre"]].drop_duplicates().itertuples(index=False, name=None):
+            Path(directory, f"{group}-games").mkdir(parents=True, exist_ok=True)
+            path = os.path.join(directory, f"{group}-games", f"{group}-{genre_file_name(genre)}.csv")
+            files[(group, genre)] = open(path, "w", newline="")
+            pd.DataFrame(columns=columns).to_csv(files[(group, genre)])
+            counts[(group, genre)] = 0
 
+        for chunk in reviews:
+            chunk = chunk[columns].dropna()
+            chunk = chunk[chunk["playtime_at_review"] >= min_playtime]
+            joined = chunk.rename_axis("_row").reset_index().merge(app_genres, on="steam_app_id", how="inner")
+            for (group, genre), rows in joined.groupby(["group", "genre"], sort=False):
+                rows.set_index("_row")[columns].rename_axis(None).to_csv(files[(group, genre)], header=False)
+                counts[(group, genre)] += len(rows)
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
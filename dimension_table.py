@@ -0,0 +1,69 @@
+class DimensionTable:
+    """
+    Interns names (developers, publishers, genres, categories, ...) into dense integer ids. Lookups go through a
+    dictionary, so getting the id of a name is O(1) no matter how many names the table holds. Row i of the table is
+    [i, name_i], which is the layout of the dimension tables in the checkpoint store.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Rebuild a table from saved rows in O(n).
+        :param rows: Iterable of (id, name) rows with ids 0, 1, 2, ... in order, e.g.
+        CheckpointStore.iter_rows("developers")
+        :return: DimensionTable
+        """
+        table = cls()
+        for row_id, name in rows:
+            if row_id != len(table.names):
+                raise ValueError(f"Dimension rows must have dense ids in order. Expected id {len(table.names)}, got "
+                                 f"{row_id}.")
+            table.ids[name] = row_id
+            table.names.append(name)
+        return table
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def get_id(self, name):
+        """
+        Get the id of a name, adding the name to the table if it is new.
+        :param name: Name to intern
+        :return: Integer id of the name
+        """
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.ids[name] = name_id
+            self.names.append(name)
+        return name_id
+
+    def get_ids(self, names):
+        """
+        Get the ids of several names, adding new names to the table. Repeated names are returned once.
+        :param names: Iterable of names
+        :return: List of ids in the order the names first appear
+        """
+        return [self.get_id(name) for name in dict.fromkeys(names)]
+
+    def lookup(self, name, default=None):
+        """
+        Get the id of a name without adding it to the table.
+        :param name: Name to look up
+        :param default: Value returned if the name is not in the table
+        """
+        return self.ids.get(name, default)
+
+    def rows(self, start: int=0):
+        """
+        :param start: First id to return. Passing the number of rows already saved returns only the new rows.
+        :return: List of [id, name] rows
+        """
+        return [[name_id, name] for name_id, name in enumerate(self.names[start:], start)]
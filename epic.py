@@ -1,6 +1,7 @@
 import requests
 from bs4 import BeautifulSoup
 import csv
+import app_name_index
 
 # Step 1: Define the URL of the Epic Games Store
 url = "https://store.epicgames.com/en-US/"
@@ -28,11 +29,17 @@ for game in games:
     # Add game details to the list
     game_data.append([title, price])
 
-# Step 5: Write the scraped data to a CSV file in the current directory
+# Step 5: Match each title to its Steam app id, for games that are on Steam too. Titles that differ only in case,
+# punctuation or trademark signs still match.
+steam_app_ids = app_name_index.get_index().resolve_many([title for title, _ in game_data])
+game_data = [[title, price, "" if app_id is None else app_id]
+             for (title, price), app_id in zip(game_data, steam_app_ids)]
+
+# Step 6: Write the scraped data to a CSV file in the current directory
 output_file = "epic_games.csv"
 with open(output_file, mode='w', newline='', encoding='utf-8') as file:
     writer = csv.writer(file)
-    writer.writerow(["Title", "Price"])  # Header
+    writer.writerow(["Title", "Price", "Steam App ID"])  # Header
     writer.writerows(game_data)
 
 print(f"Game details saved to {output_file}")
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+
+# Localised genre names Steam returns for some apps -> the English name they stand for
+GENRE_ALIASES = {
+    "Strateji": "Strategy",
+    "Simülasyon": "Simulation"
+}
+
+# Genres that describe how an app is sold rather than what it is. They are dropped before encoding.
+DROPPED_GENRES = frozenset(["Early Access", "Free To Play"])
+
+
+def normalize_genres(app_genres: pd.DataFrame, aliases: dict=None, dropped=DROPPED_GENRES,
+                     name_column: str="genre_name"):
+    """
+    Map every genre name through the alias table and drop the dropped genres, once for the whole link table. An app
+    that gets the same genre twice (e.g. 'Strategy' and 'Strateji') keeps one row of it.
+    :param app_genres: DataFrame with the columns 'steam_app_id' and name_column, e.g.
+    data_processing.read_app_links("app_genres")
+    :param aliases: Dictionary mapping a genre name to the name it is replaced with. Default GENRE_ALIASES.
+    :param dropped: Genre names to drop, after aliases are applied
+    :param name_column: Column holding the genre names
+    :return: DataFrame with the columns 'steam_app_id' and name_column, in the order of app_genres
+    """
+    aliases = GENRE_ALIASES if aliases is None else aliases
+    # The mapping is applied to the few distinct names, then spread to the rows through their codes. Code -1 (a
+    # missing name) takes the None appended at the end.
+    codes, names = pd.factorize(app_genres[name_column])
+    names = np.array([aliases.get(name, name) for name in names] + [None], dtype=object)
+    genres = pd.DataFrame({"steam_app_id": app_genres["steam_app_id"].to_numpy(), name_column: names[codes]})
+    genres = genres[genres[name_column].notna() & ~genres[name_column].isin(list(dropped))]
+    return genres.drop_duplicates().reset_index(drop=True)
+
+
+def genre_counts(app_genres: pd.DataFrame, name_column: str="genre_name"):
+    """
+    :param app_genres: DataFrame with the columns 'steam_app_id' and name_column, e.g. the result of normalize_genres
+    :param name_column: Column holding the genre names
+    :return: Series mapping every genre to its number of apps, most common first. Ties keep the order in which the
+    genres first appear, as collections.Counter.most_common does.
+    """
+    codes, names = pd.factorize(app_genres[name_column])
+    counts = np.bincount(codes[codes >= 0], minlength=len(names))
+    order = np.argsort(-counts, kind="stable")
+    return pd.Series(counts[order], index=names[order], name="count")
+
+
+def multi_hot(app_genres: pd.DataFrame, app_ids=None, columns: list=None, sparse: bool=False,
+              name_column: str="genre_name"):
+    """
+    Encode the genres of every app as a multi-hot uint8 matrix in one vectorised pass: the app ids and genre names of
+    the link rows are turned into row and column positions, and a single scatter sets the cells.
+    :param app_genres: DataFrame with the columns 'steam_app_id' and name_column, e.g. the result of normalize_genres.
+    Works the same for categories or platforms with their name column.
+    :param app_ids: Apps of the rows, in order. Apps without genres get a row of zeros. Default every app of
+    app_genres, in the order they first appear.
+    :param columns: Genres of the columns, in order. Other genres are left out. Default every genre, in the order
+    they first appear.
+    :param sparse: If True, the columns have a pandas SparseDtype with fill value 0
+    :param name_column: Column holding the genre names
+    :return: DataFrame of 0 and 1 indexed by steam_app_id, with one column per genre
+    """
+    link_app_ids = app_genres["steam_app_id"].to_numpy()
+    link_names = app_genres[name_column].to_numpy()
+    app_ids = pd.Index(pd.unique(link_app_ids) if app_ids is None else np.asarray(app_ids), name="steam_app_id")
+    columns = pd.Index(pd.unique(link_names[pd.notna(link_names)]) if columns is None else list(columns))
+
+    rows = app_ids.get_indexer(link_app_ids)
+    cols = columns.get_indexer(link_names)
+    keep = (rows >= 0) & (cols >= 0)
+    matrix = np.zeros((len(app_ids), len(columns)), dtype=np.uint8)
+    matrix[rows[keep], cols[keep]] = 1
+
+    encoded = pd.DataFrame(matrix, index=app_ids, columns=columns)
+    if sparse:
+        encoded = encoded.astype(pd.SparseDtype(np.uint8, 0))
+    return encoded
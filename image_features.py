@@ -0,0 +1,229 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import csv
+import os
+import warnings
+import config
+import steam_client
+
+
+# Columns of the attributes file, as in steam_images_attributes1.csv
+COLUMNS = ["steam_app_id", "image_url", "brightness", "contrast", "saturation", "dominant_hue"]
+
+
+class _Workspace:
+    """
+    Scratch arrays reused from one image to the next, so that computing the attributes of an image does not allocate
+    new full-size arrays. Each array grows to the largest image seen so far.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+
+    def get(self, name: str, size: int, dtype):
+        array = self._arrays.get(name)
+        if array is None or len(array) < size:
+            array = np.empty(size, dtype=dtype)
+            self._arrays[name] = array
+        return array[:size]
+
+
+# One workspace per process
+_workspace = _Workspace()
+
+
+def image_attributes(rgb: np.ndarray, workspace: _Workspace=None):
+    """
+    Compute the attributes of an image. They follow Pillow's conversions: brightness and contrast are the mean and
+    standard deviation of the 'L' (luma) image, saturation is the mean of the S channel and dominant_hue the most
+    common value of the H channel of the 'HSV' image. All channels are on a 0-255 scale.
+    :param rgb: uint8 array of shape (height, width, 3)
+    :param workspace: Scratch arrays to reuse. Default the workspace of the process.
+    :return: (brightness, contrast, saturation, dominant_hue)
+    """
+    workspace = _workspace if workspace is None else workspace
+    pixels = rgb.reshape(-1, 3)
+    num_pixels = len(pixels)
+    if num_pixels == 0:
+        return np.nan, np.nan, np.nan, 0
+    red, green, blue = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+
+    # Luma with Pillow's fixed point weights: L = (19595 R + 38470 G + 7471 B + 0x8000) >> 16
+    luma = workspace.get("luma", num_pixels, np.uint32)
+    scratch = workspace.get("scratch", num_pixels, np.uint32)
+    np.multiply(red, np.uint32(19595), out=luma)
+    luma += np.multiply(green, np.uint32(38470), out=scratch)
+    luma += np.multiply(blue, np.uint32(7471), out=scratch)
+    luma += 0x8000
+    luma >>= 16
+    brightness = float(luma.mean())
+    contrast = float(luma.std())
+
+    # Saturation: S = int(255 * (max - min) / max)
+    max_channel = workspace.get("max", num_pixels, np.uint8)
+    min_channel = workspace.get("min", num_pixels, np.uint8)
+    np.maximum(np.maximum(red, green, out=max_channel), blue, out=max_channel)
+    np.minimum(np.minimum(red, green, out=min_channel), blue, out=min_channel)
+    delta = workspace.get("delta", num_pixels, np.float32)
+    np.subtract(max_channel, min_channel, out=delta, dtype=np.float32)
+    chromatic = workspace.get("chromatic", num_pixels, bool)
+    np.greater(delta, 0, out=chromatic)
+
+    ratio = workspace.get("ratio", num_pixels, np.float32)
+    ratio.fill(0)
+    np.divide(delta, max_channel, out=ratio, where=chromatic)
+    ratio *= 255
+    saturation = float(np.floor(ratio, out=ratio).mean())
+
+    # Hue: the sextant of the max channel plus the position between the other two, scaled to 0-255. Grey pixels have
+    # hue 0.
+    hue = workspace.get("hue", num_pixels, np.float32)
+    np.subtract(green, blue, out=hue, dtype=np.float32)
+    green_max = max_channel == green
+    blue_max = max_channel == blue
+    red_max = max_channel == red
+    np.subtract(blue, red, out=ratio, dtype=np.float32)
+    ratio += 2 * delta
+    np.copyto(hue, ratio, where=green_max & ~red_max)
+    np.subtract(red, green, out=ratio, dtype=np.float32)
+    ratio += 4 * delta
+    np.copyto(hue, ratio, where=blue_max & ~red_max & ~green_max)
+    np.divide(hue, delta, out=hue, where=chromatic)
+    hue /= 6
+    hue += 1
+    np.fmod(hue, 1, out=hue)
+    hue *= 255
+    hue[~chromatic] = 0
+    hue_counts = np.bincount(hue.astype(np.uint8), minlength=256)
+    dominant_hue = int(hue_counts.argmax())
+
+    return brightness, contrast, saturation, dominant_hue
+
+
+def decode_image(content: bytes):
+    """
+    Decode an image file into an RGB array. Needs Pillow.
+    :param content: Bytes of the image file
+    :return: uint8 array of shape (height, width, 3)
+    """
+    from PIL import Image
+    with Image.open(BytesIO(content)) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def _content_attributes(content: bytes):
+    """
+    Decode an image and compute its attributes. Runs in the worker processes.
+    :return: (brightness, contrast, saturation, dominant_hue). Images that cannot be decoded get NaN attributes, so
+    that they are not downloaded again on the next run.
+    """
+    try:
+        rgb = decode_image(content)
+    except Exception:
+        return np.nan, np.nan, np.nan, None
+    return image_attributes(rgb)
+
+
+def _download(url: str):
+    """
+    :return: The body of the response, or None if the download failed
+    """
+    try:
+        response = steam_client.get(url)
+    except Exception as e:
+        warnings.warn(f"Failed to download {url}: {e}")
+        return None
+    if response.status_code != 200:
+        warnings.warn(f"Failed to download {url}. Response code: {response.status_code}. Reason: {response.reason}")
+        return None
+    return response.content
+
+
+def _iter_downloads(rows, num_threads: int, max_in_flight: int):
+    """
+    Download images concurrently, with at most max_in_flight downloads started but not yet consumed.
+    :param rows: Iterable of (steam_app_id, image_url)
+    :return: Generator of (steam_app_id, image_url, content or None), in the order of rows
+    """
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        pending = deque()
+        for app_id, url in rows:
+            pending.append((app_id, url, executor.submit(_download, url)))
+            if len(pending) >= max_in_flight:
+                app_id, url, future = pending.popleft()
+                yield app_id, url, future.result()
+        while pending:
+            app_id, url, future = pending.popleft()
+            yield app_id, url, future.result()
+
+
+def read_done_urls(path: str):
+    """
+    :param path: Path of an attributes file
+    :return: Set of the image URLs already in the file. Empty if the file does not exist.
+    """
+    if not Path(path).is_file():
+        return set()
+    return set(pd.read_csv(path, usecols=["image_url"])["image_url"])
+
+
+def extract_image_attributes(rows, output_path: str=None, num_threads: int=16, num_workers: int=None,
+                             batch_size: int=256, max_in_flight: int=64):
+    """
+    Compute the attributes of every image and append them to the attributes file. Images already in the file are
+    skipped, so an interrupted run continues where it stopped. Downloads run in a bounded thread pool while a process
+    pool decodes the images and computes their attributes, one batch at a time. Each batch is flushed to disk before
+    the next one is written.
+    :param rows: Iterable of (steam_app_id, image_url), e.g. iter_store_images(store)
+    :param output_path: Path of the attributes file. Default config.IMAGE_ATTRIBUTES_CSV.
+    :param num_threads: Number of concurrent downloads
+    :param num_workers: Number of processes. Default os.cpu_count().
+    :param batch_size: Number of images sent to the process pool and written at a time
+    :param max_in_flight: Maximum number of downloads started ahead of the processing
+    :return: Number of images written and number of failed downloads
+    """
+    output_path = config.IMAGE_ATTRIBUTES_CSV if output_path is None else output_path
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    done_urls = read_done_urls(output_path)
+    rows = ((app_id, url) for app_id, url in rows if url not in done_urls)
+
+    num_written = 0
+    num_failed = 0
+    write_header = not Path(output_path).is_file() or os.path.getsize(output_path) == 0
+    with open(output_path, "a", newline="") as f, ProcessPoolExecutor(max_workers=num_workers) as executor:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(COLUMNS)
+        downloads = _iter_downloads(rows, num_threads, max(max_in_flight, 1))
+        while True:
+            batch = list(islice(downloads, batch_size))
+            if not batch:
+                break
+            batch_failed = [content is None for _, _, content in batch]
+            num_failed += sum(batch_failed)
+            batch = [row for row, failed in zip(batch, batch_failed) if not failed]
+            attributes = executor.map(_content_attributes, [content for _, _, content in batch])
+            writer.writerows((app_id, url, *row_attributes)
+                             for (app_id, url, _), row_attributes in zip(batch, attributes))
+            f.flush()
+            num_written += len(batch)
+            print(f"Image attributes written: {num_written}. Failed downloads: {num_failed}.")
+    return num_written, num_failed
+
+
+def iter_store_images(store):
+    """
+    :param store: checkpoint_store.CheckpointStore
+    :return: Generator of (steam_app_id, image_url) for every row of the images table, without duplicate URLs
+    """
+    seen = set()
+    for _, app_id, _, url in store.iter_rows("images"):
+        if url not in seen:
+            seen.add(url)
+            yield app_id, url
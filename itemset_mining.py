@@ -0,0 +1,197 @@
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import csv
+import config
+from dimension_table import DimensionTable
+
+
+class TransactionDatabase:
+    """
+    Transactions in vertical layout. Items are interned into dense integer ids, and each item keeps the set of
+    transactions it appears in as a bitset (a Python int with bit t set if transaction t holds the item). The support
+    of an itemset is the popcount of the AND of its item bitsets, so counting never rescans the transactions.
+    """
+
+    def __init__(self, items: DimensionTable, tidsets: list, num_transactions: int):
+        """
+        :param items: DimensionTable mapping item names to ids
+        :param tidsets: tidsets[item_id] is the bitset of the transactions holding the item
+        :param num_transactions: Number of transactions
+        """
+        self.items = items
+        self.tidsets = tidsets
+        self.num_transactions = num_transactions
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        """
+        Encode transactions in one pass. Only the transaction ids of each item are kept while reading.
+        :param transactions: Iterable of iterables of item names, e.g. iter_transaction_file(path)
+        :return: TransactionDatabase
+        """
+        items = DimensionTable()
+        tids = []
+        num_transactions = 0
+        for transaction in transactions:
+            for item_id in items.get_ids(transaction):
+                if item_id == len(tids):
+                    tids.append([])
+                tids[item_id].append(num_transactions)
+            num_transactions += 1
+
+        # Pack each tid-list into a bitset
+        tidsets = []
+        bits = np.zeros(num_transactions, dtype=bool)
+        for item_tids in tids:
+            bits[item_tids] = True
+            tidsets.append(int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little"))
+            bits[item_tids] = False
+        return cls(items, tidsets, num_transactions)
+
+    @classmethod
+    def from_files(cls, paths):
+        """
+        :param paths: Path or list of paths of transaction CSV files. See iter_transaction_file.
+        :return: TransactionDatabase of the transactions of every file
+        """
+        paths = [paths] if isinstance(paths, (str, Path)) else paths
+        return cls.from_transactions(transaction for path in paths for transaction in iter_transaction_file(path))
+
+    def support_count(self, item_ids):
+        """
+        :param item_ids: Iterable of item ids
+        :return: Number of transactions holding every item
+        """
+        tidset = (1 << self.num_transactions) - 1
+        for item_id in item_ids:
+            tidset &= self.tidsets[item_id]
+        return tidset.bit_count()
+
+
+def iter_transaction_file(path: str):
+    """
+    Stream the transactions of a file written by text_cleaning.clean_genre_files (t-liked-<genre>.csv or
+    t-disliked-<genre>.csv), one transaction of comma separated words per line. Empty lines are skipped.
+    :param path: Path of the CSV file
+    :return: Generator of lists of items
+    """
+    with open(path, "r", newline="") as f:
+        for row in csv.reader(f):
+            if row:
+                yield row
+
+
+def transaction_file_path(group: str, genre: str, directory: str=None):
+    """
+    :param group: 'liked' or 'disliked'
+    :param genre: Genre file name, e.g. 'massively_multiplayer'. See text_cleaning.genre_file_name.
+    :param directory: Directory of the grouped review files. Default config.GROUPED_TEXT_DIRECTORY.
+    :return: Path of the transaction file of the genre
+    """
+    directory = config.GROUPED_TEXT_DIRECTORY if directory is None else directory
+    return str(Path(directory, "transactions", f"t-{group}-{genre}.csv"))
+
+
+def _min_count(min_support: float, num_transactions: int):
+    # The smallest count whose support reaches min_support, allowing for floating point error
+    return max(1, int(np.ceil(min_support * num_transactions - 1e-9)))
+
+
+def eclat(database: TransactionDatabase, min_support: float, max_length: int=None):
+    """
+    Mine every frequent itemset with Eclat: a depth-first search over itemsets where each extension intersects the
+    bitset of the prefix with the bitset of one more item.
+    :param database: TransactionDatabase
+    :param min_support: Minimum fraction of transactions that must hold an itemset
+    :param max_length: Optional maximum number of items in an itemset
+    :return: Dictionary mapping itemsets (tuples of item ids, sorted) to their support count
+    """
+    min_count = _min_count(min_support, database.num_transactions)
+    counts = {}
+
+    def extend(prefix, candidates):
+        # candidates: (item id, tidset of prefix + item, count), every one frequent
+        for idx, (item_id, tidset, count) in enumerate(candidates):
+            itemset = prefix + (item_id,)
+            counts[tuple(sorted(itemset))] = count
+            if max_length is not None and len(itemset) >= max_length:
+                continue
+            next_candidates = []
+            for other_id, other_tidset, _ in candidates[idx + 1:]:
+                joined = tidset & other_tidset
+                joined_count = joined.bit_count()
+                if joined_count >= min_count:
+                    next_candidates.append((other_id, joined, joined_count))
+            if next_candidates:
+                extend(itemset, next_candidates)
+
+    # Least frequent items first keeps the intersected bitsets small
+    singletons = []
+    for item_id, tidset in enumerate(database.tidsets):
+        count = tidset.bit_count()
+        if count >= min_count:
+            singletons.append((item_id, tidset, count))
+    singletons.sort(key=lambda candidate: candidate[2])
+    extend((), singletons)
+    return counts
+
+
+def frequent_itemsets(transactions, min_support: float, max_length: int=None):
+    """
+    Find the frequent itemsets of transactions. The result has the layout of mlxtend.frequent_patterns.apriori with
+    use_colnames=True.
+    :param transactions: TransactionDatabase, or iterable of iterables of item names
+    :param min_support: Minimum fraction of transactions that must hold an itemset
+    :param max_length: Optional maximum number of items in an itemset
+    :return: DataFrame with the columns 'support' and 'itemsets' (frozensets of item names), sorted by descending
+    support
+    """
+    database = transactions if isinstance(transactions, TransactionDatabase) else \
+        TransactionDatabase.from_transactions(transactions)
+    counts = eclat(database, min_support, max_length)
+    names = database.items.names
+    num_transactions = max(database.num_transactions, 1)
+    df = pd.DataFrame({
+        "support": np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) / num_transactions,
+        "itemsets": [frozenset(names[item_id] for item_id in itemset) for itemset in counts]
+    })
+    return df.sort_values("support", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def association_rules(itemsets: pd.DataFrame, min_confidence: float=0.5):
+    """
+    Derive association rules A -> C from frequent itemsets. Every subset of a frequent itemset is frequent, so the
+    support of each antecedent and consequent is looked up rather than counted.
+    :param itemsets: DataFrame returned by frequent_itemsets
+    :param min_confidence: Minimum support(A and C) / support(A)
+    :return: DataFrame with the columns 'antecedents', 'consequents', 'support', 'confidence' and 'lift', sorted by
+    descending confidence
+    """
+    supports = dict(zip(itemsets["itemsets"], itemsets["support"]))
+    rules = []
+    for itemset, support in supports.items():
+        for size in range(1, len(itemset)):
+            for antecedent in combinations(itemset, size):
+                antecedent = frozenset(antecedent)
+                confidence = support / supports[antecedent]
+                if confidence >= min_confidence:
+                    consequent = itemset - antecedent
+                    rules.append((antecedent, consequent, support, confidence, confidence / supports[consequent]))
+    df = pd.DataFrame(rules, columns=["antecedents", "consequents", "support", "confidence", "lift"])
+    return df.sort_values("confidence", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def mine_transaction_files(paths, min_support: float, min_confidence: float=0.5, max_length: int=None):
+    """
+    Stream transaction files into a TransactionDatabase and mine their itemsets and rules.
+    :param paths: Path or list of paths, e.g. transaction_file_path('liked', 'action')
+    :param min_support: See frequent_itemsets
+    :param min_confidence: See association_rules
+    :param max_length: See frequent_itemsets
+    :return: (itemsets DataFrame, rules DataFrame)
+    """
+    itemsets = frequent_itemsets(TransactionDatabase.from_files(paths), min_support, max_length)
+    return itemsets, association_rules(itemsets, min_confidence)
@@ -0,0 +1,163 @@
+from json import JSONDecodeError
+
+import codecs
+import json
+
+
+_WHITESPACE = " \t\n\r"
+# Characters that can continue a number cut by a chunk boundary
+_NUMBER_CHARACTERS = ".eE+-0123456789"
+
+
+class _Scanner:
+    """
+    Reads JSON text from an iterator of chunks, keeping only the unconsumed part of the input in memory.
+    """
+
+    def __init__(self, chunks, compact_size=1 << 16):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+        self._compact_size = compact_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        """
+        Append the next chunk to the buffer.
+        :return: False at the end of the input
+        """
+        if self.eof:
+            return False
+        # Drop the consumed part of the buffer so memory does not grow with the size of the input
+        if self.pos >= self._compact_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk) if isinstance(chunk, (bytes, bytearray)) else chunk
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self._decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character without consuming it. Returns "" at the end of the input.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more():
+                return ""
+
+    def expect(self, characters: str):
+        character = self.peek()
+        if character == "" or character not in characters:
+            raise JSONDecodeError(f"Expected one of {characters!r}", self.buffer, self.pos)
+        self.pos += 1
+        return character
+
+    def decode_value(self):
+        """
+        Decode the next complete JSON value, reading more input until it is complete.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self.buffer, self.pos)
+            except JSONDecodeError:
+                if self._read_more():
+                    continue
+                raise
+            # A bare number ending at the end of the buffer, or just before its '.', exponent or digits, may have
+            # been cut by a chunk boundary (raw_decode reads '1500.' as 1500 followed by '.'). Read on until it
+            # is followed by something that cannot continue it.
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and not self.eof and \
+                    (end == len(self.buffer) or self.buffer[end] in _NUMBER_CHARACTERS) and self._read_more():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_members(chunks, stream_path: tuple):
+    """
+    Incrementally parse a JSON object, streaming the elements of one array inside it. Only the array element being
+    decoded is held in memory, so peak memory and the time to the first element do not depend on the size of the
+    array.
+    :param chunks: Iterable of bytes or str chunks of the JSON document, e.g. response.iter_content(65536) or an
+    open file read in blocks (see iter_file_chunks)
+    :param stream_path: Keys leading from the top-level object to the array to stream, e.g. ('applist', 'apps').
+    Every key but the last must hold an object.
+    :return: Generator of (path, value) tuples. Each element of the streamed array is yielded as
+    (stream_path + ('item',), element). Every other member of an object on the way to the array is decoded whole
+    and yielded as (path_to_member, value), e.g. (('cursor',), '...').
+    """
+    scanner = _Scanner(chunks)
+    yield from _iter_object(scanner, (), tuple(stream_path))
+    if scanner.peek() != "":
+        raise JSONDecodeError("Extra data", scanner.buffer, scanner.pos)
+
+
+def _iter_object(scanner, prefix, stream_path):
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        scanner.pos += 1
+        return
+    while True:
+        key = scanner.decode_value()
+        scanner.expect(":")
+        path = prefix + (key,)
+        if path == stream_path[:len(path)] and scanner.peek() in "{[":
+            if len(path) == len(stream_path):
+                yield from _iter_array(scanner, path)
+            else:
+                yield from _iter_object(scanner, path, stream_path)
+        else:
+            yield path, scanner.decode_value()
+        if scanner.expect(",}") == "}":
+            return
+
+
+def _iter_array(scanner, path):
+    scanner.expect("[")
+    item_path = path + ("item",)
+    if scanner.peek() == "]":
+        scanner.pos += 1
+        return
+    while True:
+        yield item_path, scanner.decode_value()
+        if scanner.expect(",]") == "]":
+            return
+
+
+def iter_json_array(chunks, stream_path: tuple):
+    """
+    Incrementally parse a JSON object and yield only the elements of the array at stream_path.
+    :param chunks: See iter_json_members
+    :param stream_path: See iter_json_members
+    :return: Generator of the decoded array elements
+    """
+    item_path = tuple(stream_path) + ("item",)
+    for path, value in iter_json_members(chunks, stream_path):
+        if path == item_path:
+            yield value
+
+
+def iter_file_chunks(path: str, chunk_size: int=1 << 16):
+    """
+    Read a file in binary chunks.
+    :param path: Path of the file
+    :param chunk_size: Number of bytes per chunk
+    :return: Generator of bytes
+    """
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
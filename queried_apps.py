@@ -0,0 +1,130 @@
+from pathlib import Path
+
+import numpy as np
+import os
+
+
+# Status of an app in the crawl. UNQUERIED apps have not been looked at yet. main.py no longer sets COME_BACK_LATER,
+# since its come_back_later_list is applied on every run instead of being saved. The status is kept so saved indexes
+# still load.
+UNQUERIED = 0
+DONE = 1
+NO_DETAILS = 2
+NO_REVIEWS = 3
+COME_BACK_LATER = 4
+
+STATUS_NAMES = {
+    UNQUERIED: "unqueried",
+    DONE: "done",
+    NO_DETAILS: "no_details",
+    NO_REVIEWS: "no_reviews",
+    COME_BACK_LATER: "come_back_later"
+}
+
+
+class QueriedAppsIndex:
+    """
+    Crawl status of every app, held as one uint8 per app id in a NumPy array indexed by app id. Membership checks and
+    status lookups are O(1). Steam app ids are dense enough that the array compresses to a few hundred KB on disk.
+    """
+
+    def __init__(self, statuses: np.ndarray=None):
+        """
+        :param statuses: Optional uint8 array where statuses[app_id] is the status of the app
+        """
+        self.statuses = np.zeros(0, dtype=np.uint8) if statuses is None else statuses.astype(np.uint8)
+        self._num_known = int(np.count_nonzero(self.statuses))
+        self._changes = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build an index from (app_id, status) rows, e.g. CheckpointStore.queried_app_rows().
+        :param rows: Iterable of (app_id, status)
+        :return: QueriedAppsIndex
+        """
+        rows = np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+        statuses = np.zeros(rows[:, 0].max() + 1 if len(rows) else 0, dtype=np.uint8)
+        statuses[rows[:, 0]] = rows[:, 1]
+        return cls(statuses)
+
+    @classmethod
+    def load(cls, path: str, store=None):
+        """
+        Load an index saved with save. If the file is missing, or does not match the number of apps in the
+        checkpoint store (e.g. the run was killed between the checkpoint and the save), rebuild it from the store.
+        :param path: Path of the .npz file
+        :param store: Optional checkpoint_store.CheckpointStore to check against and rebuild from
+        :return: QueriedAppsIndex
+        """
+        index = None
+        if Path(path).is_file():
+            with np.load(path) as data:
+                index = cls(data["statuses"])
+        if store is not None and (index is None or len(index) != store.count("queried_apps")):
+            index = cls.from_rows(store.queried_app_rows())
+        return index if index is not None else cls()
+
+    def save(self, path: str):
+        """
+        Atomically save the index, compressed. Trailing unqueried ids are not written.
+        :param path: Path of the .npz file
+        """
+        known = np.flatnonzero(self.statuses)
+        end = known[-1] + 1 if len(known) else 0
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, statuses=self.statuses[:end])
+        os.replace(temp_path, path)
+
+    def __len__(self):
+        return self._num_known
+
+    def __contains__(self, app_id):
+        return 0 <= app_id < len(self.statuses) and self.statuses[app_id] != UNQUERIED
+
+    def get_status(self, app_id: int):
+        """
+        :param app_id: Steam app id
+        :return: Status of the app. UNQUERIED if the app is unknown.
+        """
+        if 0 <= app_id < len(self.statuses):
+            return int(self.statuses[app_id])
+        return UNQUERIED
+
+    def set_status(self, app_id: int, status: int):
+        """
+        Set the status of an app. The array grows by doubling when the app id is past its end.
+        :param app_id: Steam app id
+        :param status: One of DONE, NO_DETAILS, NO_REVIEWS
+        """
+        if app_id >= len(self.statuses):
+            grown = np.zeros(max(app_id + 1, 2 * len(self.statuses)), dtype=np.uint8)
+            grown[:len(self.statuses)] = self.statuses
+            self.statuses = grown
+
+        previous = self.statuses[app_id]
+        self._num_known += int(previous == UNQUERIED) - int(status == UNQUERIED)
+        self.statuses[app_id] = status
+        self._changes[int(app_id)] = status
+
+    def add(self, app_id: int, status: int=DONE):
+        """
+        Mark an app as queried.
+        """
+        self.set_status(app_id, status)
+
+    def pop_changes(self):
+        """
+        :return: List of (app_id, status) set since the last call, for appending to the checkpoint store
+        """
+        changes = list(self._changes.items())
+        self._changes = {}
+        return changes
+
+    def count_by_status(self):
+        """
+        :return: Dictionary mapping status name to the number of apps with that status
+        """
+        counts = np.bincount(self.statuses, minlength=len(STATUS_NAMES))
+        return {name: int(counts[status]) for status, name in STATUS_NAMES.items() if status != UNQUERIED}
@@ -0,0 +1,252 @@
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from requests.structures import CaseInsensitiveDict
+
+import requests
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+import config
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def canonical_url(url: str, params: dict=None):
+    """
+    Merge params into the query of url and sort the query, so that equal requests get equal keys.
+    :param url: URL, possibly with a query
+    :param params: Query parameters
+    :return: URL string
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += [(str(key), str(value)) for key, value in params.items()]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ""))
+
+
+class ResponseCache:
+    """
+    On-disk cache of successful Steam API responses. Entries are keyed by endpoint and canonical URL. Bodies are
+    stored zlib-compressed and content-addressed, so identical bodies (e.g. the same empty review page of many apps)
+    are stored once. Each endpoint has its own time to live. Endpoints without one are not cached. When the
+    compressed bodies outgrow the size limit, the least recently used entries are evicted. The index is a SQLite
+    database next to the bodies. Safe to use from several threads.
+    """
+
+    def __init__(self, directory: str=None, ttl: dict=None, max_bytes: int=None, ignore_ttl: bool=False):
+        """
+        :param directory: Directory of the cache. Default config.RESPONSE_CACHE_DIRECTORY.
+        :param ttl: Dictionary mapping endpoint to time to live in seconds. Default config.RESPONSE_CACHE_TTL.
+        :param max_bytes: Maximum total size of the compressed bodies. Default config.RESPONSE_CACHE_MAX_BYTES.
+        :param ignore_ttl: If True, entries never expire. Use to re-process a crawl without any network calls.
+        """
+        self.directory = config.RESPONSE_CACHE_DIRECTORY if directory is None else directory
+        self.ttl = config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.max_bytes = config.RESPONSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ignore_ttl = ignore_ttl
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "stored": 0, "evicted": 0, "bytes_saved": 0,
+                      "bytes_stored": 0}
+        self._lock = threading.Lock()
+
+        Path(self.directory, "blobs").mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, endpoint TEXT, "
+                                    "url TEXT, content_hash TEXT, content_type TEXT, created REAL, accessed REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS blobs (content_hash TEXT PRIMARY KEY, "
+                                    "size INTEGER, num_entries INTEGER)")
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def is_cached_endpoint(self, endpoint: str):
+        return endpoint in self.ttl
+
+    @staticmethod
+    def _key(endpoint: str, url: str):
+        return hashlib.sha256(f"{endpoint}\n{url}".encode()).hexdigest()
+
+    def _blob_path(self, content_hash: str):
+        return os.path.join(self.directory, "blobs", content_hash[:2], content_hash + ".z")
+
+    def get(self, endpoint: str, url: str, params: dict=None):
+        """
+        Look up a response.
+        :param endpoint: Name of the endpoint
+        :param url: URL of the request
+        :param params: Query parameters of the request
+        :return: requests.Response with its content read, or None if there is no fresh entry
+        """
+        if not self.is_cached_endpoint(endpoint):
+            return None
+        url = canonical_url(url, params)
+        key = self._key(endpoint, url)
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute("SELECT content_hash, content_type, created FROM entries WHERE key = ?",
+                                          (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            content_hash, content_type, created = row
+            if not self.ignore_ttl and now - created > self.ttl[endpoint]:
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            try:
+                with open(self._blob_path(content_hash), "rb") as f:
+                    content = zlib.decompress(f.read())
+            except (OSError, zlib.error):
+                self.stats["misses"] += 1
+                self._delete_entries([key])
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self.stats["hits"] += 1
+            self.stats["bytes_saved"] += len(content)
+
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = url
+        response.encoding = "utf-8"
+        response.headers = CaseInsensitiveDict({"Content-Type": content_type or "application/json"})
+        response._content = content
+        response._content_consumed = True
+        response.from_cache = True
+        response.stats_recorded = True  # Nothing was received, see steam_client.iter_content
+        return response
+
+    def put(self, endpoint: str, url: str, response, params: dict=None):
+        """
+        Store a response if its endpoint is cached and it succeeded. Bodies that are empty or 'null' (what appdetails
+        sends when it is overloaded) are not stored.
+        :param endpoint: Name of the endpoint
+        :param url: URL of the request
+        :param response: requests.Response with its content read
+        :param params: Query parameters of the request
+        """
+        content = response.content
+        if not self.is_cached_endpoint(endpoint) or response.status_code != 200 or content.strip() in (b"", b"null"):
+            return
+        url = canonical_url(url, params)
+        key = self._key(endpoint, url)
+        content_hash = hashlib.sha256(content).hexdigest()
+        now = time.time()
+
+        with self._lock:
+            with self.connection:
+                # Replace an older entry first, so that a body it shares with the new entry is not deleted after
+                # being reused
+                self._delete_entries([key], commit=False)
+                blob = self.connection.execute("SELECT size FROM blobs WHERE content_hash = ?",
+                                               (content_hash,)).fetchone()
+                if blob is None:
+                    compressed = zlib.compress(content, 6)
+                    path = self._blob_path(content_hash)
+                    Path(path).parent.mkdir(exist_ok=True)
+                    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(temp_path, "wb") as f:
+                        f.write(compressed)
+                    os.replace(temp_path, path)
+                    self.connection.execute("INSERT INTO blobs VALUES (?, ?, 0)", (content_hash, len(compressed)))
+                    self.total_bytes += len(compressed)
+                    self.stats["bytes_stored"] += len(compressed)
+                self.connection.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                    key, endpoint, url, content_hash, response.headers.get("Content-Type"), now, now))
+                self.connection.execute("UPDATE blobs SET num_entries = num_entries + 1 WHERE content_hash = ?",
+                                        (content_hash,))
+            self.stats["stored"] += 1
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _delete_entries(self, keys: list, commit: bool=True):
+        """
+        Delete entries and the bodies no other entry uses. Call with the lock held.
+        """
+        deleted_blobs = []
+        for key in keys:
+            row = self.connection.execute("SELECT content_hash FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                continue
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.connection.execute("UPDATE blobs SET num_entries = num_entries - 1 WHERE content_hash = ?", row)
+            blob = self.connection.execute("SELECT size, num_entries FROM blobs WHERE content_hash = ?",
+                                           row).fetchone()
+            if blob is not None and blob[1] <= 0:
+                self.connection.execute("DELETE FROM blobs WHERE content_hash = ?", row)
+                self.total_bytes -= blob[0]
+                deleted_blobs.append(row[0])
+        if commit:
+            self.connection.commit()
+        for content_hash in deleted_blobs:
+            try:
+                os.remove(self._blob_path(content_hash))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, batch_size: int=256):
+        """
+        Delete least recently used entries until the cache is back under 90% of its size limit, so that eviction
+        does not run on every store. Call with the lock held.
+        """
+        target = 0.9 * self.max_bytes
+        while self.total_bytes > target:
+            keys = [key for key, in self.connection.execute(
+                "SELECT key FROM entries ORDER BY accessed LIMIT ?", (batch_size,))]
+            if not keys:
+                break
+            with self.connection:
+                for key in keys:
+                    self._delete_entries([key], commit=False)
+                    self.stats["evicted"] += 1
+                    if self.total_bytes <= target:
+                        break
+
+    def get_stats(self):
+        """
+        :return: Dictionary of counters: 'hits', 'misses' (including 'expired' entries), 'stored' responses,
+        'evicted' entries, 'bytes_saved' (decoded bytes served from the cache instead of the network),
+        'bytes_stored' (compressed bytes written) and the current compressed 'size' and number of 'entries'
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = self.total_bytes
+            stats["entries"] = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return stats
+
+
+def get_cache():
+    """
+    Get the cache shared by every Steam API call, created from config on first use.
+    :return: ResponseCache, or None if config.RESPONSE_CACHE_ENABLED is False
+    """
+    global _cache
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(ignore_ttl=config.RESPONSE_CACHE_IGNORE_TTL)
+        return _cache
+
+
+def close_cache():
+    """
+    Close the shared cache. The next call to get_cache opens it again.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
@@ -0,0 +1,185 @@
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import json
+import os
+import shutil
+import config
+from table_buffer import TableBuffer
+
+
+# Typed columns of the review dataset, in the column order of the reviews table of the checkpoint store
+SCHEMA = pa.schema([
+    ("review_id", pa.int64()),
+    ("steam_app_id", pa.int64()),
+    ("playtime_at_review", pa.float64()),
+    ("review", pa.string())
+])
+
+# Hive partition column. Reviews of app id a are written to app_bucket=<a % num_buckets>.
+PARTITION_COLUMN = "app_bucket"
+
+# Written next to the data files. Files starting with "_" are skipped when the dataset is scanned.
+METADATA_FILE = "_dataset.json"
+
+
+class ReviewDataset:
+    """
+    The reviews table as a Parquet dataset partitioned by app id bucket. Every checkpoint appends new files, sorted
+    by app id so that the row group statistics of the steam_app_id column are tight. Loading with a set of app ids
+    only opens the buckets those apps hash to, and the app id and playtime filters are pushed down into the scan so
+    that row groups which cannot match are skipped. The review text column is only read when it is asked for.
+    """
+
+    def __init__(self, directory: str=None, num_buckets: int=None):
+        """
+        :param directory: Directory of the dataset. Default config.REVIEW_DATASET_DIRECTORY.
+        :param num_buckets: Number of app id buckets. Default config.REVIEW_DATASET_BUCKETS. Ignored if the dataset
+        already exists, since the buckets of existing files cannot change.
+        """
+        self.directory = config.REVIEW_DATASET_DIRECTORY if directory is None else directory
+        self.num_buckets = config.REVIEW_DATASET_BUCKETS if num_buckets is None else num_buckets
+        self.num_rows = 0
+        self.num_files = 0
+
+        metadata_path = os.path.join(self.directory, METADATA_FILE)
+        if Path(metadata_path).is_file():
+            with open(metadata_path, "r") as f:
+                metadata = json.load(f)
+            self.num_buckets = metadata["num_buckets"]
+            self.num_rows = metadata["num_rows"]
+            self.num_files = metadata["num_files"]
+
+    @classmethod
+    def open(cls, directory: str=None, store=None, num_buckets: int=None):
+        """
+        Open the dataset. If it does not hold the same number of reviews as the checkpoint store (e.g. it did not
+        exist yet, or the run was killed between the checkpoint and the write), rebuild it from the store.
+        :param directory: See __init__
+        :param store: Optional checkpoint_store.CheckpointStore to check against and rebuild from
+        :param num_buckets: See __init__
+        :return: ReviewDataset
+        """
+        dataset = cls(directory, num_buckets)
+        if store is not None and dataset.num_rows != store.count("reviews"):
+            print("Rebuilding the review dataset from the checkpoint store.")
+            dataset.rebuild(store.iter_rows("reviews"))
+        return dataset
+
+    def _save_metadata(self):
+        metadata_path = os.path.join(self.directory, METADATA_FILE)
+        temp_path = metadata_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"num_buckets": self.num_buckets, "num_rows": self.num_rows, "num_files": self.num_files}, f)
+        os.replace(temp_path, metadata_path)
+
+    def append(self, rows: list):
+        """
+        Write rows as new files of the dataset.
+        :param rows: table_buffer.TableBuffer or list of [review_id, steam_app_id, playtime_at_review, review] rows,
+        the layout of the reviews table of the checkpoint store
+        :return: Number of bytes written
+        """
+        if len(rows) == 0:
+            return 0
+        if isinstance(rows, TableBuffer):
+            table = rows.to_arrow(SCHEMA)
+        else:
+            table = pa.table([pa.array(values, type=field.type) for values, field in zip(zip(*rows), SCHEMA)],
+                             schema=SCHEMA)
+        table = table.append_column(PARTITION_COLUMN, pa.array(
+            table.column("steam_app_id").to_numpy() % self.num_buckets, type=pa.int32()))
+        table = table.sort_by("steam_app_id")
+
+        # Each append writes under a new file name, so files of earlier checkpoints are never touched
+        written_paths = []
+        ds.write_dataset(table, self.directory, format="parquet", partitioning=[PARTITION_COLUMN],
+                         partitioning_flavor="hive", basename_template=f"part-{self.num_files}-{{i}}.parquet",
+                         existing_data_behavior="overwrite_or_ignore",
+                         file_visitor=lambda written_file: written_paths.append(written_file.path))
+        self.num_rows += len(rows)
+        self.num_files += 1
+        self._save_metadata()
+        return sum(os.path.getsize(path) for path in written_paths)
+
+    def rebuild(self, rows, batch_size: int=100000):
+        """
+        Delete the dataset and write it again.
+        :param rows: Iterable of review rows, e.g. CheckpointStore.iter_rows("reviews")
+        :param batch_size: Number of rows written per file
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        self.num_rows = 0
+        self.num_files = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                self.append(batch)
+                batch = []
+        self.append(batch)
+        self._save_metadata()
+
+    def _dataset(self):
+        partition_schema = pa.schema([(PARTITION_COLUMN, pa.int32())])
+        # No reviews were written yet (the directory may not even exist). Scan an empty table of the same schema.
+        if not any(Path(self.directory).glob(f"{PARTITION_COLUMN}=*/*.parquet")):
+            return ds.dataset(pa.unify_schemas([SCHEMA, partition_schema]).empty_table())
+        partitioning = ds.partitioning(partition_schema, flavor="hive")
+        return ds.dataset(self.directory, format="parquet", partitioning=partitioning)
+
+    def _filter(self, app_ids, min_playtime):
+        expression = None
+        if app_ids is not None:
+            app_ids = sorted({int(app_id) for app_id in app_ids})
+            buckets = sorted({app_id % self.num_buckets for app_id in app_ids})
+            expression = ds.field(PARTITION_COLUMN).isin(buckets) & ds.field("steam_app_id").isin(app_ids)
+        if min_playtime is not None:
+            playtime = ds.field("playtime_at_review") >= min_playtime
+            expression = playtime if expression is None else expression & playtime
+        return expression
+
+    def scanner(self, app_ids=None, min_playtime: float=None, columns: list=None, batch_size: int=None):
+        """
+        :param app_ids: Optional iterable of app ids. Only reviews of these apps are read.
+        :param min_playtime: Optional minimum playtime at review in minutes, e.g. 120
+        :param columns: Columns to read. Default every column of SCHEMA.
+        :param batch_size: Optional maximum number of rows per record batch
+        :return: pyarrow.dataset.Scanner with the filters pushed down
+        """
+        options = {} if batch_size is None else {"batch_size": batch_size}
+        return self._dataset().scanner(columns=SCHEMA.names if columns is None else list(columns),
+                                       filter=self._filter(app_ids, min_playtime), **options)
+
+    def load(self, app_ids=None, min_playtime: float=None, columns: list=None):
+        """
+        Load reviews into a DataFrame, reading only the partitions, row groups and columns that are needed.
+        :param app_ids: See scanner
+        :param min_playtime: See scanner
+        :param columns: See scanner
+        :return: DataFrame with one row per review
+        """
+        return self.scanner(app_ids, min_playtime, columns).to_table().to_pandas()
+
+    def iter_batches(self, app_ids=None, min_playtime: float=None, columns: list=None, batch_size: int=100000):
+        """
+        Like load, but yields DataFrames of at most batch_size rows so the result never has to fit in memory.
+        :return: Generator of DataFrames
+        """
+        for batch in self.scanner(app_ids, min_playtime, columns, batch_size).to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+
+def load_reviews(app_ids=None, min_playtime: float=None, columns: list=None, directory: str=None):
+    """
+    Load reviews from the dataset written by save_progress. See ReviewDataset.load.
+    :param app_ids: Optional iterable of app ids. Only reviews of these apps are read.
+    :param min_playtime: Optional minimum playtime at review in minutes, e.g. 120
+    :param columns: Columns to read. Default every column.
+    :param directory: Directory of the dataset. Default config.REVIEW_DATASET_DIRECTORY.
+    :return: DataFrame with one row per review. Empty, with the columns of the dataset, if no reviews were written.
+    """
+    return ReviewDataset(directory).load(app_ids, min_playtime, columns)
@@ -0,0 +1,206 @@
+from collections import deque
+
+import numpy as np
+import re
+import zlib
+import config
+
+
+# Mersenne prime 2^31 - 1. With coefficients below it and 32 bit shingle hashes, a * h + b fits in 64 bits.
+_PRIME = (1 << 31) - 1
+_WORD_PATTERN = re.compile(r"\w+")
+# Odd multiplier combining the word hashes of a shingle
+_SHINGLE_MULTIPLIER = 0x9E3779B1
+
+
+class SeenIds:
+    """
+    The most recent capacity review ids of an app, to drop the reviews that overlapping filter=recent cursors return
+    twice. Duplicates come from neighbouring pages, so a window of recent ids finds them without keeping every id of
+    apps with millions of reviews.
+    """
+
+    def __init__(self, ids=(), capacity: int=None):
+        """
+        :param ids: Ids seen before, oldest first, e.g. saved with the review cursor of the app
+        :param capacity: Number of ids kept. Default config.REVIEW_DEDUP_WINDOW.
+        """
+        self.order = deque(maxlen=config.REVIEW_DEDUP_WINDOW if capacity is None else capacity)
+        self.ids = set()
+        for review_id in ids:
+            self.add(review_id)
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
+    def add(self, review_id):
+        """
+        :param review_id: recommendationid of a review
+        :return: True if the id is new, False if it is a duplicate
+        """
+        review_id = int(review_id)
+        if review_id in self.ids:
+            return False
+        if len(self.order) == self.order.maxlen:
+            self.ids.discard(self.order[0])
+        self.order.append(review_id)
+        self.ids.add(review_id)
+        return True
+
+    def filter(self, reviews: list):
+        """
+        :param reviews: Reviews returned by the appreviews endpoint
+        :return: The reviews whose recommendationid has not been seen, in order
+        """
+        return [review for review in reviews if self.add(review["recommendationid"])]
+
+
+class NearDuplicateIndex:
+    """
+    Finds reviews whose text is nearly the same as a review seen before (copy-pasted and templated reviews) with
+    MinHash signatures and locality sensitive hashing. The text is split into word shingles, and the MinHash signature
+    of the shingles is cut into bands. Reviews sharing a band are candidates, and a candidate is a duplicate if the
+    share of equal signature values, an estimate of the Jaccard similarity of the shingle sets, reaches threshold.
+    The signatures of the last capacity reviews are kept in a ring buffer and the band tables only point into it, so
+    the memory of the index is fixed no matter how many reviews pass through it. Reviews that keep getting copied are
+    moved back to the front of the buffer.
+    """
+
+    def __init__(self, threshold: float=None, capacity: int=None, num_perm: int=64, bands: int=16,
+                 shingle_size: int=3, min_shingles: int=None, seed: int=0):
+        """
+        :param threshold: Minimum estimated Jaccard similarity of a near duplicate. Default
+        config.REVIEW_NEAR_DUPLICATE_THRESHOLD.
+        :param capacity: Number of signatures kept. Default config.REVIEW_NEAR_DUPLICATE_CAPACITY.
+        :param num_perm: Length of the signatures
+        :param bands: Number of LSH bands. num_perm must be a multiple of it.
+        :param shingle_size: Number of words per shingle
+        :param min_shingles: Reviews with fewer shingles are never duplicates, since short reviews such as 'Good
+        game' are written by many people. Default config.REVIEW_NEAR_DUPLICATE_MIN_SHINGLES.
+        :param seed: Seed of the hash functions
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands}).")
+        self.threshold = config.REVIEW_NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+        self.capacity = config.REVIEW_NEAR_DUPLICATE_CAPACITY if capacity is None else capacity
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.min_shingles = config.REVIEW_NEAR_DUPLICATE_MIN_SHINGLES if min_shingles is None else min_shingles
+
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.band_multipliers = rng.integers(1, 1 << 63, size=num_perm // bands, dtype=np.uint64) | np.uint64(1)
+
+        self.signatures = np.zeros((self.capacity, num_perm), dtype=np.uint32)
+        self.slot_band_keys = np.zeros((self.capacity, bands), dtype=np.uint64)
+        self.slot_items = np.full(self.capacity, -1, dtype=np.int64)
+        self.band_tables = [{} for _ in range(bands)]
+        self.num_items = 0
+
+    def signature(self, text: str):
+        """
+        :param text: Review text
+        :return: MinHash signature (np.uint32 array of length num_perm), or None if the text has fewer than
+        min_shingles shingles
+        """
+        words = _WORD_PATTERN.findall(text.lower())
+        num_shingles = len(words) - self.shingle_size + 1
+        if num_shingles < max(self.min_shingles, 1):
+            return None
+        # Each word is hashed once. The hash of a shingle is a combination of the hashes of its words, computed for
+        # every shingle at once.
+        word_hashes = np.fromiter(map(zlib.crc32, map(str.encode, words)), dtype=np.uint64, count=len(words))
+        hashes = np.zeros(num_shingles, dtype=np.uint64)
+        for offset in range(self.shingle_size):
+            hashes = hashes * np.uint64(_SHINGLE_MULTIPLIER) + word_hashes[offset:offset + num_shingles]
+        hashes = np.unique(hashes & np.uint64(0xFFFFFFFF))
+        return ((self.a * hashes + self.b) % np.uint64(_PRIME)).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray):
+        rows = signature.reshape(self.bands, -1).astype(np.uint64)
+        return (rows * self.band_multipliers).sum(axis=1, dtype=np.uint64)
+
+    def find(self, signature: np.ndarray, band_keys: np.ndarray=None):
+        """
+        :param signature: Signature returned by signature
+        :param band_keys: Band keys of the signature, if already computed
+        :return: Item id of a kept review the signature is a near duplicate of, or None
+        """
+        band_keys = self._band_keys(signature) if band_keys is None else band_keys
+        checked = set()
+        for table, key in zip(self.band_tables, band_keys.tolist()):
+            item = table.get(key)
+            if item is None or item in checked:
+                continue
+            checked.add(item)
+            if np.count_nonzero(self.signatures[item % self.capacity] == signature) >= \
+                    self.threshold * len(signature):
+                return item
+        return None
+
+    def add(self, signature: np.ndarray, band_keys: np.ndarray=None):
+        """
+        Keep a signature, replacing the oldest one if the index is full.
+        :param signature: Signature returned by signature
+        :param band_keys: Band keys of the signature, if already computed
+        :return: Item id of the signature
+        """
+        band_keys = self._band_keys(signature) if band_keys is None else band_keys
+        item = self.num_items
+        slot = item % self.capacity
+        old_item = int(self.slot_items[slot])
+        if old_item >= 0:
+            for table, key in zip(self.band_tables, self.slot_band_keys[slot].tolist()):
+                if table.get(key) == old_item:
+                    del table[key]
+        self.signatures[slot] = signature
+        self.slot_band_keys[slot] = band_keys
+        self.slot_items[slot] = item
+        for table, key in zip(self.band_tables, band_keys.tolist()):
+            table[key] = item
+        self.num_items += 1
+        return item
+
+    def is_duplicate(self, text: str):
+        """
+        Check a review against the index and keep it if it is not a near duplicate.
+        :param text: Review text
+        :return: True if the text is a near duplicate of a kept review
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return False
+        band_keys = self._band_keys(signature)
+        item = self.find(signature, band_keys)
+        if item is None:
+            self.add(signature, band_keys)
+            return False
+        # A review that keeps being copied is moved to the front of the ring buffer, so templates stay in the index
+        # while one-off reviews pass through it
+        if self.num_items - item > self.capacity // 2:
+            slot = item % self.capacity
+            self.add(self.signatures[slot].copy(), self.slot_band_keys[slot].copy())
+        return True
+
+    def filter(self, reviews: list):
+        """
+        :param reviews: Reviews returned by the appreviews endpoint
+        :return: The reviews that are not near duplicates, in order
+        """
+        return [review for review in reviews if not self.is_duplicate(review["review"])]
+
+
+def near_duplicate_mask(texts, **kwargs):
+    """
+    Mark the near duplicates of an already collected set of reviews, e.g. before mining a review file. The first
+    review of every group of near duplicates is kept.
+    :param texts: Iterable of review texts
+    :param kwargs: Arguments of NearDuplicateIndex
+    :return: Boolean np.ndarray, True for the reviews that are near duplicates of an earlier review
+    """
+    index = NearDuplicateIndex(**kwargs)
+    return np.fromiter((isinstance(text, str) and index.is_duplicate(text) for text in texts), dtype=bool)
@@ -0,0 +1,196 @@
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import requests
+import json
+import os
+import threading
+import config
+
+
+_session = None
+_session_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _create_session():
+    """
+    Create a session with a pooled adapter for both schemes. Connection and read errors are retried by urllib3.
+    Status codes are not, because rate limiting is handled per endpoint by crawler.RateLimitedFetcher.
+    """
+    retry = Retry(total=config.HTTP_RETRIES, connect=config.HTTP_RETRIES, read=config.HTTP_RETRIES, status=0,
+                  backoff_factor=config.HTTP_RETRY_BACKOFF, allowed_methods={"GET", "HEAD"}, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_CONNECTIONS, pool_maxsize=config.HTTP_POOL_MAXSIZE,
+                          max_retries=retry, pool_block=True)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+        "User-Agent": config.HTTP_USER_AGENT
+    })
+    return session
+
+
+def get_session():
+    """
+    Get the session shared by every Steam API call. Connections are kept alive and reused per host.
+    :return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _create_session()
+        return _session
+
+
+def close_session():
+    """
+    Close the shared session and all of its pooled connections. The next call to get_session creates a new one.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _record(response, decoded_bytes=None):
+    response.stats_recorded = True
+    host = urlsplit(response.url).netloc
+    # raw.tell() is the number of bytes read from the socket, before decompression
+    if decoded_bytes is None:
+        decoded_bytes = len(response.content)
+    wire_bytes = response.raw.tell() if response.raw is not None else decoded_bytes
+    with _stats_lock:
+        host_stats = _stats.setdefault(host, {"requests": 0, "not_modified": 0, "bytes_received": 0,
+                                              "bytes_decoded": 0})
+        host_stats["requests"] += 1
+        host_stats["not_modified"] += int(response.status_code == 304)
+        host_stats["bytes_received"] += wire_bytes
+        host_stats["bytes_decoded"] += decoded_bytes
+
+
+def get(url: str, params: dict=None, timeout=None, headers: dict=None, stream: bool=False):
+    """
+    Make a GET request through the shared session.
+    :param url: URL to request
+    :param params: Query parameters
+    :param timeout: Timeout in seconds, or a (connect, read) tuple. Default config.HTTP_TIMEOUT.
+    :param headers: Extra request headers
+    :param stream: If True, do not read the body. Read it with iter_content, which also releases the connection.
+    :return: requests.Response, with its content already read unless stream is True
+    """
+    if timeout is None:
+        timeout = config.HTTP_TIMEOUT
+    response = get_session().get(url, params=params, timeout=timeout, headers=headers, stream=stream)
+    if not stream:
+        _record(response)
+    return response
+
+
+def iter_content(response, chunk_size: int=1 << 16):
+    """
+    Read the body of a response made with stream=True in decoded (decompressed) chunks, then record it in the stats
+    and close the response. Responses that are already read (stream=False, or served from response_cache) are only
+    split into chunks.
+    :param response: requests.Response from get(..., stream=True)
+    :param chunk_size: Number of bytes per chunk
+    :return: Generator of bytes
+    """
+    decoded_bytes = 0
+    try:
+        for chunk in response.iter_content(chunk_size):
+            decoded_bytes += len(chunk)
+            yield chunk
+    finally:
+        if not getattr(response, "stats_recorded", False):
+            _record(response, decoded_bytes)
+        response.close()
+
+
+def get_stats():
+    """
+    Get counters for benchmarking, per host. 'requests', 'not_modified' (304 responses), 'bytes_received' (on the
+    wire, compressed) and 'bytes_decoded' are counted by this module. 'connections' (connections opened) and
+    'pool_requests' (requests sent over those connections) come from the connection pools, so
+    pool_requests - connections is the number of requests that reused a kept-alive connection.
+    :return: Dictionary mapping host to a dictionary of counters
+    """
+    with _stats_lock:
+        stats = {host: dict(host_stats) for host, host_stats in _stats.items()}
+
+    session = _session
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+                host_stats = stats.setdefault(host, {})
+                host_stats["connections"] = host_stats.get("connections", 0) + pool.num_connections
+                host_stats["pool_requests"] = host_stats.get("pool_requests", 0) + pool.num_requests
+    return stats
+
+
+def reset_stats():
+    """
+    Reset the counters kept by this module. Connection pool counters are reset by close_session.
+    """
+    with _stats_lock:
+        _stats.clear()
+
+
+def conditional_get(url: str, cached_path: str, metadata_path: str, params: dict=None, timeout=None,
+                    stream: bool=False):
+    """
+    Make a GET request with If-None-Match / If-Modified-Since validators saved from the previous response. If the
+    server answers 304 Not Modified, nothing but the headers is downloaded.
+    :param url: URL to request
+    :param cached_path: File holding the content of the previous response. Validators are only sent if it exists.
+    :param metadata_path: JSON file holding the ETag and Last-Modified values of the previous response. Not written
+    here: save the returned validators with save_validators once the content has been stored in cached_path.
+    :param params: Query parameters
+    :param timeout: See get
+    :param stream: See get
+    :return: (requests.Response, validators of the response or None if it is not a 200). Check for status code 304
+    before using the content.
+    """
+    headers = {}
+    if Path(cached_path).is_file() and Path(metadata_path).is_file():
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+
+    response = get(url, params=params, timeout=timeout, headers=headers, stream=stream)
+
+    validators = None
+    if response.status_code == 200:
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+    return response, validators
+
+
+def save_validators(validators: dict, metadata_path: str):
+    """
+    Save the validators returned by conditional_get. Call it only after the content of the response is completely
+    stored, otherwise a failed download would be answered with 304 from then on and never be fetched again.
+    :param validators: Validators returned by conditional_get
+    :param metadata_path: JSON file read by the next conditional_get
+    """
+    temp_path = metadata_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(validators, f)
+    os.replace(temp_path, metadata_path)
@@ -0,0 +1,206 @@
+from pathlib import Path
+
+import pandas as pd
+import json
+import os
+import config
+import data_processing
+import feature_encoding
+from checkpoint_store import TABLES
+
+
+# Version of the derived views. Changing how a view is computed must change this, so that old cached copies are
+# rebuilt rather than read.
+VIEW_VERSION = 1
+
+_datasets = {}
+
+
+def source_fingerprint(path: str):
+    """
+    :param path: Path of a source file
+    :return: [size, modification time in ns] of the file, or None if it does not exist
+    """
+    if not Path(path).is_file():
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class SteamDataset:
+    """
+    Lazy access to the tables exported by CheckpointStore.export_csv and to the views the analyses derive from them:
+    games only with at least min_reviews reviews, split into positive and negative games, and the reviews written
+    after at least min_playtime minutes of play. Every table and view is loaded or computed the first time it is
+    used and kept in memory after that. Each one is also saved as Parquet in cache_directory together with the
+    fingerprints (size and modification time) of the CSV files it was computed from, so a later session reads it
+    back in a fraction of the time of parsing the CSV files, until one of those files changes.
+    Tables and views are shared between callers. Copy them before changing them in place.
+    """
+
+    def __init__(self, directory: str=None, cache_directory: str=None, min_reviews: int=50,
+                 min_playtime: float=120, use_cache: bool=True):
+        """
+        :param directory: Directory of the exported CSV files. Default config.DATA_DIRECTORY.
+        :param cache_directory: Directory of the cached tables and views. Default <directory>/dataset_cache.
+        :param min_reviews: Minimum number of positive and negative reviews of the games view
+        :param min_playtime: Minimum playtime in minutes at the time of the review of the played_reviews view
+        :param use_cache: If False, nothing is read from or written to cache_directory
+        """
+        self.directory = config.DATA_DIRECTORY if directory is None else directory
+        self.cache_directory = os.path.join(self.directory, config.DATASET_CACHE_DIRECTORY_NAME) \
+            if cache_directory is None else cache_directory
+        self.min_reviews = min_reviews
+        self.min_playtime = min_playtime
+        self.use_cache = use_cache
+        self._frames = {}
+
+    def path(self, table: str):
+        """
+        :param table: Name of a table in checkpoint_store.TABLES
+        :return: Path of the exported CSV file of the table
+        """
+        return os.path.join(self.directory, TABLES[table][0])
+
+    def _load(self, name: str, tables: list, build, parameters: dict=None):
+        """
+        Get a table or view from memory, else from the disk cache if its sources have not changed, else build it.
+        :param name: Name of the table or view, also the name of its cache file
+        :param tables: Tables whose CSV files the frame is computed from
+        :param build: Function returning the DataFrame
+        :param parameters: Settings the frame depends on, saved with the fingerprints
+        :return: DataFrame
+        """
+        if name in self._frames:
+            return self._frames[name]
+
+        key = {"version": VIEW_VERSION, "parameters": parameters or {},
+               "sources": {TABLES[table][0]: source_fingerprint(self.path(table)) for table in tables}}
+        cache_path = os.path.join(self.cache_directory, name + ".parquet")
+        key_path = os.path.join(self.cache_directory, name + ".json")
+        frame = None
+        if self.use_cache and Path(cache_path).is_file() and Path(key_path).is_file():
+            with open(key_path, "r") as f:
+                if json.load(f) == key:
+                    frame = pd.read_parquet(cache_path)
+
+        if frame is None:
+            frame = build()
+            if self.use_cache:
+                Path(self.cache_directory).mkdir(parents=True, exist_ok=True)
+                # The key is written after the data, so a crash in between leaves a cache that is rebuilt
+                if Path(key_path).is_file():
+                    os.remove(key_path)
+                frame.to_parquet(cache_path + ".tmp")
+                os.replace(cache_path + ".tmp", cache_path)
+                with open(key_path, "w") as f:
+                    json.dump(key, f)
+        self._frames[name] = frame
+        return frame
+
+    def table(self, table: str):
+        """
+        :param table: Name of a table in checkpoint_store.TABLES, e.g. 'games' for steam_apps_info.csv or 'reviews'
+        :return: DataFrame of the CSV file as pd.read_csv reads it
+        """
+        return self._load(table, [table], lambda: pd.read_csv(self.path(table)))
+
+    @property
+    def apps(self):
+        """
+        :return: The games table with total_reviews recomputed as the sum of the positive and negative reviews, which
+        the review sync keeps up to date
+        """
+        def build():
+            apps = self.table("games").copy()
+            apps["total_reviews"] = apps["total_positive_reviews"] + apps["total_negative_reviews"]
+            return apps
+        return self._load("apps", ["games"], build)
+
+    @property
+    def games(self):
+        """
+        :return: Apps of type 'game' with at least min_reviews reviews
+        """
+        def build():
+            apps = self.apps
+            return apps[(apps["app_type"] == "game") & (apps["total_reviews"] >= self.min_reviews)]
+        return self._load("games_view", ["games"], build, {"min_reviews": self.min_reviews})
+
+    @property
+    def positive_games(self):
+        """
+        :return: Games of the games view with at least as many positive as negative reviews
+        """
+        def build():
+            games = self.games
+            return games[games["total_positive_reviews"] >= games["total_negative_reviews"]]
+        return self._load("positive_games", ["games"], build, {"min_reviews": self.min_reviews})
+
+    @property
+    def negative_games(self):
+        """
+        :return: Games of the games view with more negative than positive reviews
+        """
+        def build():
+            games = self.games
+            return games[games["total_positive_reviews"] < games["total_negative_reviews"]]
+        return self._load("negative_games", ["games"], build, {"min_reviews": self.min_reviews})
+
+    @property
+    def played_reviews(self):
+        """
+        :return: Complete reviews written after at least min_playtime minutes of play
+        """
+        def build():
+            reviews = self.table("reviews").dropna()
+            return reviews[reviews["playtime_at_review"] >= self.min_playtime]
+        return self._load("played_reviews", ["reviews"], build, {"min_playtime": self.min_playtime})
+
+    @property
+    def positive_reviews(self):
+        """
+        :return: Reviews of the played_reviews view about games of the positive_games view
+        """
+        def build():
+            reviews = self.played_reviews
+            return reviews[reviews["steam_app_id"].isin(self.positive_games["steam_app_id"])]
+        return self._load("positive_reviews", ["games", "reviews"], build,
+                          {"min_reviews": self.min_reviews, "min_playtime": self.min_playtime})
+
+    @property
+    def negative_reviews(self):
+        """
+        :return: Reviews of the played_reviews view about games of the negative_games view
+        """
+        def build():
+            reviews = self.played_reviews
+            return reviews[reviews["steam_app_id"].isin(self.negative_games["steam_app_id"])]
+        return self._load("negative_reviews", ["games", "reviews"], build,
+                          {"min_reviews": self.min_reviews, "min_playtime": self.min_playtime})
+
+    @property
+    def app_genres(self):
+        """
+        :return: The app_genres link rows with the genre names normalised by feature_encoding.normalize_genres
+        """
+        return self._load("app_genres", ["app_genres", "genres"], lambda: feature_encoding.normalize_genres(
+            data_processing.read_app_links("app_genres", self.directory)))
+
+    def clear(self):
+        """
+        Drop the tables and views held in memory. The disk cache is kept.
+        """
+        self._frames = {}
+
+
+def get_dataset(directory: str=None):
+    """
+    Get the SteamDataset of a directory with the default settings, shared by every caller in the process.
+    :param directory: Directory of the exported CSV files. Default config.DATA_DIRECTORY.
+    :return: SteamDataset
+    """
+    directory = config.DATA_DIRECTORY if directory is None else directory
+    if directory not in _datasets:
+        _datasets[directory] = SteamDataset(directory)
+    return _datasets[directory]
@@ -0,0 +1,158 @@
+import numpy as np
+import pyarrow as pa
+
+
+# NumPy type of the INTEGER and REAL columns of checkpoint_store.TABLES. TEXT columns are string columns.
+NUMERIC_TYPES = {"INTEGER": np.int64, "REAL": np.float64}
+
+
+class _NumericChunk:
+
+    def __init__(self, dtype, size: int):
+        self.values = np.zeros(size, dtype=dtype)
+        self.valid = None  # Allocated when the first None is appended
+
+    def set(self, idx: int, value):
+        if value is None:
+            if self.valid is None:
+                self.valid = np.ones(len(self.values), dtype=bool)
+            self.valid[idx] = False
+        else:
+            self.values[idx] = value
+
+    def nbytes(self):
+        return self.values.nbytes + (0 if self.valid is None else self.valid.nbytes)
+
+    def to_list(self, length: int):
+        values = self.values[:length].tolist()
+        if self.valid is not None:
+            values = [value if valid else None for value, valid in zip(values, self.valid[:length].tolist())]
+        return values
+
+    def to_arrow(self, length: int, type):
+        mask = None if self.valid is None else ~self.valid[:length]
+        return pa.array(self.values[:length], type=type, mask=mask)
+
+
+class _StringChunk:
+    """
+    UTF-8 bytes of every string of the chunk in one buffer, with the offset of each string, as in an Arrow string
+    array. One Python object per chunk instead of one per string.
+    """
+
+    def __init__(self, size: int):
+        self.data = bytearray()
+        self.offsets = np.zeros(size + 1, dtype=np.int32)
+        self.valid = None
+
+    def set(self, idx: int, value):
+        if value is None:
+            if self.valid is None:
+                self.valid = np.ones(len(self.offsets) - 1, dtype=bool)
+            self.valid[idx] = False
+        else:
+            # Lists (genres, categories, platforms) are stored as their repr, as checkpoint_store does
+            self.data += (value if isinstance(value, str) else str(value)).encode("utf-8", "surrogatepass")
+        self.offsets[idx + 1] = len(self.data)
+
+    def nbytes(self):
+        return len(self.data) + self.offsets.nbytes + (0 if self.valid is None else self.valid.nbytes)
+
+    def to_list(self, length: int):
+        data = memoryview(self.data)
+        offsets = self.offsets[:length + 1].tolist()
+        values = [str(data[start:end], "utf-8", "surrogatepass") for start, end in zip(offsets[:-1], offsets[1:])]
+        if self.valid is not None:
+            values = [value if valid else None for value, valid in zip(values, self.valid[:length].tolist())]
+        return values
+
+    def to_arrow(self, length: int, type):
+        validity = None if self.valid is None else \
+            pa.py_buffer(np.packbits(self.valid[:length], bitorder="little").tobytes())
+        return pa.StringArray.from_buffers(length, pa.py_buffer(self.offsets[:length + 1].tobytes()),
+                                           pa.py_buffer(bytes(self.data)), validity).cast(type)
+
+
+class TableBuffer:
+    """
+    Rows of one table collected between two checkpoints, held column by column in typed chunks: a NumPy array for
+    each INTEGER or REAL column and one UTF-8 byte buffer with offsets for each TEXT column. A row costs about the
+    size of its data, rather than a list plus a boxed Python object per cell. Chunks double in size from 64 rows up
+    to chunk_size, so small tables stay small. Filled chunks are never copied or resized, and clear() drops them all,
+    so the memory of a crawl does not grow with the rows it has saved.
+    Behaves like the list of rows it replaces for append, +=, len and iteration.
+    """
+
+    def __init__(self, columns: list, chunk_size: int=4096):
+        """
+        :param columns: List of (column, SQLite type), e.g. checkpoint_store.TABLES[table][1]
+        :param chunk_size: Maximum number of rows per chunk
+        """
+        self.columns = [column for column, _ in columns]
+        self.types = [column_type for _, column_type in columns]
+        self.chunk_size = chunk_size
+        self.clear()
+
+    def _new_chunk(self):
+        size = min(self.chunk_size, 64 << len(self.chunks))
+        self.chunks.append([_NumericChunk(NUMERIC_TYPES[column_type], size) if column_type in NUMERIC_TYPES else
+                            _StringChunk(size) for column_type in self.types])
+        self._chunk_lengths.append(0)
+        self._chunk_capacity = size
+
+    def append(self, row):
+        """
+        :param row: Sequence of values in the column order of the table
+        """
+        if not self.chunks or self._chunk_lengths[-1] == self._chunk_capacity:
+            self._new_chunk()
+        idx = self._chunk_lengths[-1]
+        for column, value in zip(self.chunks[-1], row):
+            column.set(idx, value)
+        self._chunk_lengths[-1] += 1
+        self._length += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __iadd__(self, rows):
+        self.extend(rows)
+        return self
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        """
+        :return: Generator of rows as lists of Python values. Only one chunk is decoded at a time.
+        """
+        for chunk, length in zip(self.chunks, self._chunk_lengths):
+            yield from map(list, zip(*(column.to_list(length) for column in chunk)))
+
+    def clear(self):
+        """
+        Drop every row and release the chunks.
+        """
+        self.chunks = []
+        self._chunk_lengths = []
+        self._chunk_capacity = 0
+        self._length = 0
+
+    def nbytes(self):
+        """
+        :return: Number of bytes held by the chunks
+        """
+        return sum(column.nbytes() for chunk in self.chunks for column in chunk)
+
+    def to_arrow(self, schema: pa.Schema):
+        """
+        Convert the rows to an Arrow table without going through Python objects. String columns reuse the byte
+        buffers as they are.
+        :param schema: Arrow schema with one field per column, in order
+        :return: pyarrow.Table
+        """
+        arrays = [pa.chunked_array([chunk[idx].to_arrow(length, field.type)
+                                    for chunk, length in zip(self.chunks, self._chunk_lengths)], type=field.type)
+                  for idx, field in enumerate(schema)]
+        return pa.Table.from_arrays(arrays, schema=schema)
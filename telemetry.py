@@ -0,0 +1,325 @@
+"""
+Structured metrics of the crawl: request latency histograms and status counters per endpoint, time spent waiting on
+the rate limiters, apps and reviews processed, checkpoint durations and bytes written. Metrics are kept in memory by
+this module. TelemetryExporter writes them periodically to a rolling JSONL file (one snapshot per line, with rates
+since the previous line) and to a Prometheus text file that node_exporter's textfile collector can scrape.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import json
+import os
+import threading
+import time
+import config
+
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_started = time.time()
+
+# Counters the exporter turns into per second rates
+RATE_COUNTERS = {"apps_total": "apps_per_second", "reviews_total": "reviews_per_second",
+                 "requests_total": "requests_per_second", "bytes_written_total": "bytes_written_per_second"}
+
+# Descriptions written to the Prometheus file
+HELP = {
+    "requests_total": "HTTP responses by endpoint and status code",
+    "request_errors_total": "Requests that failed without a response, by endpoint and error type",
+    "rate_limited_total": "Responses with status 429 by endpoint",
+    "rate_limit_wait_seconds_total": "Time spent waiting for a rate limiter token, by endpoint",
+    "cache_hits_total": "Responses served from the response cache, by endpoint",
+    "apps_total": "Apps processed by the crawl, by outcome",
+    "reviews_total": "Reviews collected",
+    "bytes_written_total": "Bytes written by checkpoints, by target",
+    "stage_seconds_total": "Wall clock time per stage",
+    "request_seconds": "Latency of HTTP requests by endpoint",
+    "checkpoint_seconds": "Duration of checkpoints",
+}
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def increment(name: str, value: float=1, **labels):
+    """
+    Add to a counter.
+    :param name: Counter name, e.g. 'requests_total'
+    :param value: Amount to add
+    :param labels: Labels of the counter, e.g. endpoint='appdetails'
+    """
+    if not config.TELEMETRY_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    """
+    Record a value in a histogram with the buckets of config.TELEMETRY_LATENCY_BUCKETS.
+    :param name: Histogram name, e.g. 'request_seconds'
+    :param value: Observed value in seconds
+    :param labels: Labels of the histogram
+    """
+    if not config.TELEMETRY_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(config.TELEMETRY_LATENCY_BUCKETS), "count": 0,
+                                            "sum": 0.0}
+        # Buckets are cumulative: every bucket whose upper bound holds the value is incremented
+        for idx, bound in enumerate(config.TELEMETRY_LATENCY_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][idx] += 1
+        histogram["count"] += 1
+        histogram["sum"] += value
+
+
+@contextmanager
+def timer(stage: str, histogram: str=None, **labels):
+    """
+    Time a block of code. The duration is added to stage_seconds_total and, if given, observed in a histogram.
+    :param stage: Name of the stage, e.g. 'export_csv'
+    :param histogram: Optional histogram name, e.g. 'checkpoint_seconds'
+    :param labels: Labels of the histogram
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        increment("stage_seconds_total", elapsed, stage=stage)
+        if histogram is not None:
+            observe(histogram, elapsed, **labels)
+
+
+def observe_request(endpoint: str, seconds: float, status_code: int):
+    """
+    Record one HTTP response of an endpoint.
+    :param endpoint: Name of the endpoint
+    :param seconds: Time from sending the request to receiving the headers
+    :param status_code: Status code of the response
+    """
+    observe("request_seconds", seconds, endpoint=endpoint)
+    increment("requests_total", endpoint=endpoint, status=str(status_code))
+    if status_code == 429:
+        increment("rate_limited_total", endpoint=endpoint)
+
+
+def reset():
+    """
+    Clear every metric.
+    """
+    global _started
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _started = time.time()
+
+
+def _label_text(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+def snapshot():
+    """
+    :return: Dictionary with 'time', 'uptime_seconds', 'counters' and 'histograms'. Metrics with labels are keyed
+    'name{label="value",...}'.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {"buckets": list(histogram["buckets"]), "count": histogram["count"],
+                            "sum": histogram["sum"]} for key, histogram in _histograms.items()}
+    now = time.time()
+
+    def flat(key):
+        name, labels = key
+        return f"{name}{{{_label_text(labels)}}}" if labels else name
+
+    return {
+        "time": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+        "uptime_seconds": now - _started,
+        "counters": {flat(key): value for key, value in sorted(counters.items())},
+        "histograms": {flat(key): {**histogram, "bounds": list(config.TELEMETRY_LATENCY_BUCKETS)}
+                       for key, histogram in sorted(histograms.items())}
+    }
+
+
+def counter_total(name: str):
+    """
+    :param name: Counter name
+    :return: Sum of the counter over all its labels
+    """
+    with _lock:
+        return sum(value for (counter_name, _), value in _counters.items() if counter_name == name)
+
+
+def histogram_quantile(name: str, quantile: float, **labels):
+    """
+    Estimate a quantile of a histogram from its buckets, as Prometheus' histogram_quantile does.
+    :param name: Histogram name
+    :param quantile: Quantile between 0 and 1
+    :param labels: Labels of the histogram
+    :return: Estimated value, or None if the histogram is empty
+    """
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        if histogram is None or histogram["count"] == 0:
+            return None
+        buckets = list(histogram["buckets"])
+        count = histogram["count"]
+    rank = quantile * count
+    lower_bound, lower_count = 0.0, 0
+    for bound, bucket_count in zip(config.TELEMETRY_LATENCY_BUCKETS, buckets):
+        if bucket_count >= rank:
+            if bucket_count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (bucket_count - lower_count)
+        lower_bound, lower_count = bound, bucket_count
+    return config.TELEMETRY_LATENCY_BUCKETS[-1]
+
+
+def prometheus_text():
+    """
+    :return: Every metric in the Prometheus text exposition format
+    """
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, dict(histogram)) for key, histogram in _histograms.items())
+
+    lines = []
+    seen = set()
+    prefix = config.TELEMETRY_METRIC_PREFIX
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines += [f"# HELP {prefix}{name} {HELP.get(name, name)}", f"# TYPE {prefix}{name} counter"]
+        lines.append(f"{prefix}{name}{{{_label_text(labels)}}} {value}" if labels else f"{prefix}{name} {value}")
+    for (name, labels), histogram in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines += [f"# HELP {prefix}{name} {HELP.get(name, name)}", f"# TYPE {prefix}{name} histogram"]
+        label_text = _label_text(labels)
+        separator = "," if label_text else ""
+        for bound, bucket_count in zip(config.TELEMETRY_LATENCY_BUCKETS, histogram["buckets"]):
+            lines.append(f'{prefix}{name}_bucket{{{label_text}{separator}le="{bound}"}} {bucket_count}')
+        lines.append(f'{prefix}{name}_bucket{{{label_text}{separator}le="+Inf"}} {histogram["count"]}')
+        lines.append(f"{prefix}{name}_sum{{{label_text}}} {histogram['sum']}" if label_text else
+                     f"{prefix}{name}_sum {histogram['sum']}")
+        lines.append(f"{prefix}{name}_count{{{label_text}}} {histogram['count']}" if label_text else
+                     f"{prefix}{name}_count {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class TelemetryExporter:
+    """
+    Background thread that appends a snapshot to a JSONL file and rewrites a Prometheus text file every interval.
+    The JSONL file is rotated to <path>.1 when it outgrows its size limit, so it never grows without bound.
+    """
+
+    def __init__(self, name: str="crawl", directory: str=None, interval: float=None, max_bytes: int=None):
+        """
+        :param name: Base name of the files: <name>.jsonl and <name>.prom. Give each process its own name.
+        :param directory: Output directory. Default config.TELEMETRY_DIRECTORY.
+        :param interval: Seconds between exports. Default config.TELEMETRY_INTERVAL.
+        :param max_bytes: Size at which the JSONL file is rotated. Default config.TELEMETRY_MAX_BYTES.
+        """
+        directory = config.TELEMETRY_DIRECTORY if directory is None else directory
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.jsonl_path = os.path.join(directory, f"{name}.jsonl")
+        self.prometheus_path = os.path.join(directory, f"{name}.prom")
+        self.interval = config.TELEMETRY_INTERVAL if interval is None else interval
+        self.max_bytes = config.TELEMETRY_MAX_BYTES if max_bytes is None else max_bytes
+        self._previous = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if config.TELEMETRY_ENABLED and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="telemetry-exporter", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the thread and write a last export.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.export()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def export(self):
+        """
+        Write one snapshot. Rates are computed over the time since the previous export.
+        :return: The snapshot written
+        """
+        record = snapshot()
+        now = time.monotonic()
+        totals = {name: counter_total(name) for name in RATE_COUNTERS}
+        if self._previous is not None:
+            previous_time, previous_totals = self._previous
+            elapsed = max(now - previous_time, 1e-9)
+            record["rates"] = {rate: (totals[name] - previous_totals[name]) / elapsed
+                               for name, rate in RATE_COUNTERS.items()}
+        else:
+            elapsed = max(record["uptime_seconds"], 1e-9)
+            record["rates"] = {rate: totals[name] / elapsed for name, rate in RATE_COUNTERS.items()}
+        self._previous = (now, totals)
+
+        if Path(self.jsonl_path).is_file() and os.path.getsize(self.jsonl_path) > self.max_bytes:
+            os.replace(self.jsonl_path, self.jsonl_path + ".1")
+        with open(self.jsonl_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+        # Written to a temporary file and renamed, so a scraper never reads a partial file
+        temp_path = self.prometheus_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(prometheus_text())
+        os.replace(temp_path, self.prometheus_path)
+        return record
+
+
+def summary():
+    """
+    :return: Human readable lines summarizing the crawl: throughput, latency quantiles per endpoint, throttling and
+    checkpoint cost
+    """
+    uptime = max(time.time() - _started, 1e-9)
+    with _lock:
+        endpoints = sorted({dict(labels)["endpoint"] for name, labels in _histograms
+                            if name == "request_seconds"})
+        stages = sorted((dict(labels)["stage"], value) for (name, labels), value in _counters.items()
+                        if name == "stage_seconds_total")
+    lines = [f"Apps: {counter_total('apps_total'):.0f} ({counter_total('apps_total') / uptime:.2f}/s). "
+             f"Reviews: {counter_total('reviews_total'):.0f} ({counter_total('reviews_total') / uptime:.1f}/s). "
+             f"Bytes written: {counter_total('bytes_written_total'):.0f}."]
+    for endpoint in endpoints:
+        quantiles = [histogram_quantile("request_seconds", quantile, endpoint=endpoint) for quantile in (0.5, 0.95)]
+        with _lock:
+            requests_made = sum(value for (name, labels), value in _counters.items()
+                                if name == "requests_total" and dict(labels)["endpoint"] == endpoint)
+            rate_limited = _counters.get(_key("rate_limited_total", {"endpoint": endpoint}), 0)
+            waited = _counters.get(_key("rate_limit_wait_seconds_total", {"endpoint": endpoint}), 0)
+        lines.append(f"{endpoint}: {requests_made:.0f} requests, p50 {quantiles[0]:.3f}s, p95 {quantiles[1]:.3f}s, "
+                     f"{rate_limited:.0f} rate limited, {waited:.1f}s waiting for the rate limiter.")
+    for stage, seconds in stages:
+        lines.append(f"Stage {stage}: {seconds:.1f}s.")
+    return lines
@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import csv
+import os
+import string
+import config
+import review_dedup
+
+
+# Characters deleted from a review before it is split, and from every word after it is lower-cased
+NEWLINE_TABLE = str.maketrans("", "", "\n\r")
+STRIP_TABLE = str.maketrans("", "", string.punctuation + "0123456789")
+
+# Words that say nothing about a genre: filler, sentiment shared by every genre and the franchise names that dominated
+# some genres. The empty string drops words that were only punctuation or digits.
+REMOVE_WORDS = frozenset([
+    "", "game", "games", "ever", "it", "one", "really", "get", "would", "much", "even", "still", "im", "also", "way",
+    "lot", "ive", "something", "mass", "effect", "resident", "evil", "time", "like", "good", "bad", "great", "silent",
+    "hill", "recommend", "highly", "played", "going", "play", "k", "fun", "survival", "could", "make", "drawn",
+    "drawing", "early", "access", "idle", "text", "ai", "first", "two", "go", "back", "give", "though", "things",
+    "thing", "animals", "water", "instincts", "bears", "species", "animal", "without", "think", "country", "open",
+    "thats", "worth", "feels", "battlefront", "playing", "better", "people", "see"
+])
+
+# Review group -> (minimum number of words kept before duplicates are removed, minimum number of distinct words).
+# Liked reviews only need one word. Disliked reviews need ten, counted before duplicates and non-ASCII words are
+# removed.
+REVIEW_GROUPS = {
+    "liked": (0, 1),
+    "disliked": (10, 0)
+}
+
+# Stopwords and remove words of the worker processes, set once per process by _init_worker
+_worker_options = {}
+
+
+def load_stopwords(language: str="english"):
+    """
+    Load the NLTK stopword list. Needs nltk and its stopwords corpus (nltk.download("stopwords")).
+    :param language: Stopword list to load. Default 'english'.
+    :return: frozenset of stopwords
+    """
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words(language))
+
+
+def tokenize_review(review: str, stopwords: frozenset, remove_words: frozenset=REMOVE_WORDS, min_words: int=0,
+                    min_tokens: int=1):
+    """
+    Turn a review into a transaction in one pass over its words. Newlines are deleted, the review is split on
+    whitespace, and each word is lower-cased, dropped if it is a stopword, stripped of punctuation and digits,
+    'games' becomes 'game', and it is dropped if it is in remove_words. Duplicates and non-ASCII words are then removed,
+    keeping the order in which words first appear.
+    :param review: Review text
+    :param stopwords: frozenset of lower-case stopwords, see load_stopwords
+    :param remove_words: frozenset of words removed after punctuation and digits are stripped. Default REMOVE_WORDS.
+    :param min_words: Minimum number of words left before duplicates and non-ASCII words are removed
+    :param min_tokens: Minimum number of words in the transaction
+    :return: List of distinct words, or None if the review has too few words
+    """
+    words = []
+    for word in review.translate(NEWLINE_TABLE).split():
+        word = word.lower()
+        if word in stopwords:
+            continue
+        word = word.translate(STRIP_TABLE)
+        if word == "games":
+            word = "game"
+        if word not in remove_words:
+            words.append(word)
+
+    if len(words) < min_words:
+        return None
+    tokens = [word for word in dict.fromkeys(words) if word.isascii()]
+    if len(tokens) < min_tokens:
+        return None
+    return tokens
+
+
+def iter_transactions(reviews, stopwords: frozenset, remove_words: frozenset=REMOVE_WORDS, min_words: int=0,
+                      min_tokens: int=1):
+    """
+    Lazily tokenize reviews. Reviews with too few words are skipped. See tokenize_review.
+    :param reviews: Iterable of review texts
+    :return: Generator of lists of words
+    """
+    for review in reviews:
+        tokens = tokenize_review(review, stopwords, remove_words, min_words, min_tokens)
+        if tokens is not None:
+            yield tokens
+
+
+def _init_worker(stopwords, remove_words):
+    _worker_options["stopwords"] = stopwords
+    _worker_options["remove_words"] = remove_words
+
+
+def _clean_shard(reviews, min_words, min_tokens):
+    return list(iter_transactions(reviews, _worker_options["stopwords"], _worker_options["remove_words"], min_words,
+                                  min_tokens))
+
+
+def read_reviews(path: str, sample_size: int=None, random_state=None, drop_near_duplicates: bool=False):
+    """
+    Read the review column of a grouped review file (liked-<genre>.csv or disliked-<genre>.csv).
+    :param path: Path of the CSV file
+    :param sample_size: If the file has more reviews than this, a random sample of this many is returned
+    :param random_state: Seed of the sample
+    :param drop_near_duplicates: If True, near duplicates of earlier reviews in the file are dropped before sampling,
+    so copy-pasted reviews do not inflate itemset supports. See review_dedup.near_duplicate_mask.
+    :return: List of review texts. Reviews without text are left out.
+    """
+    # Missing texts are dropped rather than turned into the word 'nan'
+    reviews = pd.read_csv(path, usecols=["review"])["review"].dropna()
+    if drop_near_duplicates:
+        reviews = reviews[~review_dedup.near_duplicate_mask(reviews.tolist())]
+    if sample_size is not None and len(reviews) > sample_size:
+        reviews = reviews.sample(sample_size, random_state=random_state)
+    return reviews.astype(str).tolist()
+
+
+def genre_file_name(genre: str):
+    """
+    :param genre: Genre name, e.g. 'Massively Multiplayer'
+    :return: Name used in the grouped review files, e.g. 'massively_multiplayer'
+    """
+    return genre.lower().replace(" ", "_")
+
+
+def clean_genre_files(genres, groups=("liked", "disliked"), directory: str=None, stopwords: frozenset=None,
+                      remove_words: frozenset=REMOVE_WORDS, sample_size: int=10000, random_state=None,
+                      num_workers: int=None, shard_size: int=2000, drop_near_duplicates: bool=False):
+    """
+    Turn the grouped review files of every genre into transaction files. Reviews are read from
+    <directory>/<group>-games/<group>-<genre>.csv and the transactions are written, one per line, to
+    <directory>/transactions/t-<group>-<genre>.csv. The reviews of every file are split into shards of shard_size and
+    all shards are cleaned by one process pool, so the work is spread over every core even when one genre is much
+    larger than the others. Transactions are written in the order of the reviews.
+    :param genres: Iterable of genre names
+    :param groups: Review groups to clean. Keys of REVIEW_GROUPS. Default both.
+    :param directory: Directory of the grouped review files. Default config.GROUPED_TEXT_DIRECTORY.
+    :param stopwords: frozenset of stopwords. Default load_stopwords().
+    :param remove_words: See tokenize_review
+    :param sample_size: Maximum number of reviews cleaned per file. None cleans every review. Default 10000.
+    :param random_state: Seed of the samples
+    :param num_workers: Number of processes. Default os.cpu_count().
+    :param shard_size: Number of reviews per task sent to the pool
+    :param drop_near_duplicates: See read_reviews
+    :return: Dictionary mapping (group, genre file name) to the number of transactions written
+    """
+    directory = config.GROUPED_TEXT_DIRECTORY if directory is None else directory
+    stopwords = load_stopwords() if stopwords is None else frozenset(stopwords)
+    Path(directory, "transactions").mkdir(parents=True, exist_ok=True)
+
+    counts = {}
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                             initargs=(stopwords, frozenset(remove_words))) as executor:
+        # Submit every shard of every file first so that the pool never waits on one file
+        jobs = []
+        for group in groups:
+            min_words, min_tokens = REVIEW_GROUPS[group]
+            for genre in genres:
+                name = genre_file_name(genre)
+                print(f"Working on {group} {name}")
+                reviews = read_reviews(os.path.join(directory, f"{group}-games", f"{group}-{name}.csv"), sample_size,
+                                       random_state, drop_near_duplicates)
+                futures = [executor.submit(_clean_shard, reviews[start:start + shard_size], min_words, min_tokens)
+                           for start in range(0, len(reviews), shard_size)]
+                jobs.append((group, name, futures))
+
+        for group, name, futures in jobs:
+            counts[(group, name)] = 0
+            path = os.path.join(directory, "transactions", f"t-{group}-{name}.csv")
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f, delimiter=",")
+                for future in futures:
+                    transactions = future.result()
+                    writer.writerows(transactions)
+                    counts[(group, name)] += len(transactions)
+    return counts